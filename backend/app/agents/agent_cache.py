@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Model settings are part of the cache key, so changing them never serves a stale graph.
+MODEL_CONFIG = {
+    "model": os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+    "temperature": float(os.getenv("GEMINI_TEMPERATURE", "0")),
+}
+
+
+def tool_fingerprint(tools) -> str:
+    """Stable ID for a tool set: same tools (any order) -> same fingerprint."""
+    signature = "|".join(sorted(f"{t.name}:{t.description}" for t in tools))
+    return hashlib.sha256(signature.encode("utf-8")).hexdigest()[:16]
+
+
+def _key_id(api_key: str) -> str:
+    # Never keep raw API keys in stats output.
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def build_agent(api_key: str, tools, model_config: dict = None):
+    """Builds a fresh chat model + LangGraph agent (the expensive part we want to do once)."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain.agents import create_agent
+
+    config = model_config or MODEL_CONFIG
+    llm = ChatGoogleGenerativeAI(api_key=api_key, **config)
+    return create_agent(llm, tools)
+
+
+class AgentGraphCache:
+    """
+    Compiled agent graphs keyed by (API key, tool-set fingerprint, model config).
+    Compiled graphs hold no per-conversation state, so one instance can serve concurrent turns.
+    """
+
+    def __init__(self, builder=build_agent):
+        self._builder = builder
+        self._graphs = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+
+    def get(self, api_key: str, tools, model_config: dict = None):
+        config = model_config or MODEL_CONFIG
+        key = (api_key, tool_fingerprint(tools), tuple(sorted(config.items())))
+
+        graph = self._graphs.get(key)
+        if graph is not None:
+            self.hits += 1
+            return graph
+
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                started = time.perf_counter()
+                graph = self._builder(api_key, list(tools), config)
+                self.build_seconds += time.perf_counter() - started
+                self._graphs[key] = graph
+                self.misses += 1
+            else:
+                self.hits += 1
+        return graph
+
+    def warm_up(self, api_keys, tool_sets, model_config: dict = None) -> int:
+        """Pre-builds every (key, tool set) combination so the first chat turn pays nothing."""
+        for api_key in api_keys:
+            for tools in tool_sets:
+                self.get(api_key, tools, model_config)
+        return len(self._graphs)
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+
+    def stats(self) -> dict:
+        return {
+            "graphs": len(self._graphs),
+            "keys": sorted({_key_id(api_key) for api_key, _, _ in self._graphs}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "build_seconds_total": round(self.build_seconds, 4),
+        }
+
+
+agent_cache = AgentGraphCache()
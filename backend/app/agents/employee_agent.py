@@ -1,18 +1,23 @@
 import os
 import asyncio
 from dotenv import load_dotenv
-import langchain
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import SystemMessage
-from langchain.agents import create_agent
 from datetime import datetime, timedelta
-langchain.debug = True
-import json
 
 # --- UPDATED IMPORTS ---
+from app.agents.agent_cache import agent_cache, MODEL_CONFIG
+from app.agents.key_pool import GeminiKeyPool, is_rate_limit_error
+from app.agents.prompt_builder import build_messages, estimate_tokens, extractive_summary, summarize_incrementally
+from app.agents.prompt_templates import build_system_prompt
+from app.agents.stage_callbacks import turn_config
+from app.services.telemetry import span, debug_log, current_trace
 from app.tools.search_tools import search_policy
+from app.services.identity import begin_request_scope, resolve_identity
+from app.services.chat_history import (
+    HISTORY_WINDOW, load_recent_messages, append_turn, load_messages_between, load_summary, save_summary
+)
+from app.services.database import db
 from app.tools.hr_tools import (
-    db, draft_policy_update, get_employee_details, apply_for_leave, 
+    draft_policy_update, get_employee_details, apply_for_leave, 
     get_upcoming_holidays, onboard_employee, prepare_sensitive_transaction, 
     raise_hr_ticket, list_employees, offboard_employee, check_google_calendar_for_leaves,invite_new_hire, complete_onboarding_profile, send_leave_email_to_hr,send_standard_email, draft_policy_update
 )
@@ -27,21 +32,110 @@ ALL_KEYS = [
     os.getenv("GEMINI_KEY_5")
 ]
 VALID_KEYS = [key for key in ALL_KEYS if key]
-current_key_idx = 0
+# Picks the least-loaded healthy key per turn and benches keys that hit 429s.
+key_pool = GeminiKeyPool(VALID_KEYS)
+
+# 🛡️ The only two tool sets the agent is ever built with (see the security checks below)
+STANDARD_TOOLS = [search_policy, get_employee_details, apply_for_leave, get_upcoming_holidays, raise_hr_ticket, check_google_calendar_for_leaves, complete_onboarding_profile]
+HR_ADMIN_TOOLS = STANDARD_TOOLS + [onboard_employee, offboard_employee, prepare_sensitive_transaction, draft_policy_update, list_employees, invite_new_hire]
 
 # 🛠️ FIX 1: Allow this function to accept a dynamically filtered list of tools!
-def get_agent_executor(tools_to_bind):
-    """Creates a fresh LangGraph agent using the currently active API key and specific tools."""
-    global current_key_idx
-    active_key = VALID_KEYS[current_key_idx]
-    
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        api_key=active_key, 
-        temperature=0
-    )
-    
-    return create_agent(llm, tools_to_bind)
+def get_agent_executor(tools_to_bind, api_key: str):
+    """Returns the cached LangGraph agent for this API key and these specific tools."""
+    return agent_cache.get(api_key, tools_to_bind)
+
+def warm_up_agents() -> int:
+    """Builds every (key, tool set) agent up front; called once at server startup."""
+    return agent_cache.warm_up(VALID_KEYS, [STANDARD_TOOLS, HR_ADMIN_TOOLS])
+
+# ==========================================
+# PROMPT ASSEMBLY & ROLLING SUMMARY
+# ==========================================
+_summary_llms = {}
+_folding = set()
+_background_tasks = set()
+
+def _get_summary_llm(api_key: str):
+    if api_key not in _summary_llms:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        _summary_llms[api_key] = ChatGoogleGenerativeAI(api_key=api_key, **MODEL_CONFIG)
+    return _summary_llms[api_key]
+
+async def prepare_messages(employee_id: str, system_instruction: str, user_prompt: str, template=None):
+    """
+    Loads the rolling summary plus the unsummarized recent turns and fits them into the context budget.
+    Returns (messages, report, fold_through) where fold_through is the timestamp up to which
+    history should be folded into the summary after this turn (None if nothing to fold).
+    """
+    with span("history_load"):
+        summary_doc = await load_summary(db, employee_id)
+        summary = summary_doc.get("summary", "") if summary_doc else ""
+        covered_until = summary_doc.get("covered_until") if summary_doc else None
+        db_history = await load_recent_messages(db, employee_id, after=covered_until)
+
+    with span("prompt_build"):
+        messages, overflow, report = build_messages(system_instruction, summary, db_history, user_prompt, template=template)
+
+    fold_through = None
+    if overflow:
+        fold_through = overflow[-1]["ts"]
+    elif len(db_history) >= HISTORY_WINDOW:
+        # Older unsummarized turns fell outside the load window; fold them too.
+        fold_through = db_history[0]["ts"] - timedelta(milliseconds=1)
+
+    trace = current_trace()
+    if trace is not None:
+        trace.attrs.update(employee_id=employee_id, prompt_tokens=report["total_tokens"])
+    debug_log(f"📏 Prompt for {employee_id}: {report['total_tokens']}/{report['budget']} tokens "
+              f"({report['history_messages_sent']} history msgs sent, {report['history_messages_folded']} folded, "
+              f"~{report['history_tokens_saved']} tokens saved)")
+    return messages, report, fold_through
+
+def schedule_fold(employee_id: str, fold_through):
+    if fold_through is None:
+        return
+    task = asyncio.create_task(fold_history(employee_id, fold_through))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def fold_history(employee_id: str, fold_through):
+    """Updates the stored summary with turns up to fold_through. Runs after the reply, off the critical path."""
+    if employee_id in _folding:
+        return
+    _folding.add(employee_id)
+    try:
+        summary_doc = await load_summary(db, employee_id)
+        previous = summary_doc.get("summary", "") if summary_doc else ""
+        covered_until = summary_doc.get("covered_until") if summary_doc else None
+        if covered_until is not None and covered_until >= fold_through:
+            return
+
+        new_messages = await load_messages_between(db, employee_id, covered_until, fold_through)
+        if not new_messages:
+            return
+
+        lease = key_pool.acquire()
+        if lease is None:
+            summary = extractive_summary(previous, new_messages)
+        else:
+            tokens_used = estimate_tokens(previous) + sum(estimate_tokens(m["content"]) for m in new_messages)
+            try:
+                summary = await summarize_incrementally(_get_summary_llm(lease.api_key), previous, new_messages)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                key_pool.release(lease, tokens_used=tokens_used, rate_limited=rate_limited, failed=not rate_limited)
+                # Still advance the summary, so these turns don't fall out of the prompt window unsummarized.
+                print(f"⚠️ LLM summary failed for {employee_id} ({e}); using an extractive summary instead.")
+                summary = extractive_summary(previous, new_messages)
+            else:
+                key_pool.release(lease, tokens_used=tokens_used)
+
+        await save_summary(db, employee_id, summary, new_messages[-1]["ts"])
+        print(f"🗜️ Folded {len(new_messages)} messages into the summary for {employee_id}.")
+    except Exception as e:
+        print(f"⚠️ Could not update conversation summary for {employee_id}: {e}")
+    finally:
+        _folding.discard(employee_id)
 
 def clean_response(response_content):
     if isinstance(response_content, list):
@@ -49,256 +143,143 @@ def clean_response(response_content):
     return str(response_content)
 
 async def stream_agent_response(user_message: str, employee_id: str = "emp_106", document_context: str = ""):
-    """Streams live tool execution and text tokens back to the frontend."""
-    global current_key_idx 
+    """Yields live tool, token, done and error events; app/services/sse.py turns them into SSE frames."""
     if not user_message and not document_context:
-        yield f"data: {json.dumps({'type': 'error', 'content': 'Empty message.'})}\n\n"
+        yield {'type': 'error', 'content': 'Empty message.'}
         return
         
-    # --- 1. IDENTITY & ACCESS LOOKUP ---
-    from bson import ObjectId
-    from bson.errors import InvalidId
-    
-    try:
-        user_record = await db.users.find_one({"_id": ObjectId(employee_id)})
-    except InvalidId:
-        user_record = await db.users.find_one({"employee_id": employee_id.lower()})
-        
-    if not user_record:
-        user_record = await db.employees.find_one({"employee_id": employee_id.lower()})
-    
-    if user_record:
-        user_name = user_record.get("name", "Unknown")
-        user_department = user_record.get("department", "Employee")
-        onboarding_status = user_record.get("onboarding_status", "Completed")
-        real_emp_id = user_record.get("employee_id", employee_id) 
-        dep_lower = user_department.lower()
-        is_hr_admin = "hr" in dep_lower or "human resources" in dep_lower
-        role_title = "HR Administrator" if is_hr_admin else f"{user_department} Employee"
-    else:
-        user_name = "Guest"
-        role_title = "Unverified User"
-        is_hr_admin = False
-        onboarding_status = "Unknown"
-        real_emp_id = employee_id
+    # --- 1. IDENTITY & ACCESS LOOKUP (cached; see app/services/identity.py) ---
+    begin_request_scope()
+    with span("identity"):
+        identity = await resolve_identity(db, employee_id)
+    is_hr_admin = identity["is_hr_admin"]
 
     # 🛡️ Hardcoded Python-Level Security
-    safe_tools = [search_policy, get_employee_details, apply_for_leave, get_upcoming_holidays, raise_hr_ticket, check_google_calendar_for_leaves,complete_onboarding_profile]
-    if is_hr_admin:
-        safe_tools.extend([onboard_employee, offboard_employee, prepare_sensitive_transaction, draft_policy_update, list_employees, invite_new_hire])
+    safe_tools = HR_ADMIN_TOOLS if is_hr_admin else STANDARD_TOOLS
 
     # --- 2. INJECT DOCUMENT TEXT INTO THE AI'S BRAIN ---
     final_prompt = user_message
     if document_context:
         final_prompt = f"The user has securely attached documents. Here is the extracted text from the files:\n\n{document_context}\n\nUser Question: {user_message}"
 
-    system_instruction = (
-        f"You are the Innvoix HR Agentic AI. Chatting with {user_name}. Role: {role_title}. "
-        f"\n[System Auth ID: {employee_id} | Official HR ID: {real_emp_id}]\n"
-        "\n\n--- SECURITY & ACCESS CONTROL RULES ---\n"
-        "1. Standard Employees can ONLY ask about policies, check leave balances, apply for leave, and raise tickets.\n"
-        "2. ONLY HR Administrators have the security clearance to use: 'onboard_employee', 'offboard_employee', 'prepare_sensitive_transaction', 'draft_policy_update', 'invite_new_hire', and 'list_employees'.\n"
-        "3. If a Standard Employee asks you to perform an HR-only action, you MUST completely refuse.\n"
-        "\n--- WORKFLOW ORCHESTRATION RULES ---\n"
-        f"\n--- ONBOARDING STATUS: {onboarding_status.upper()} ---\n"
-        "INVITING VS ONBOARDING: If HR asks to 'invite' a new hire, you MUST ask HR for the Name, Email, Role, and Department. Do NOT ask for a password (the system auto-generates it). Once they provide those 4 details, immediately call the 'invite_new_hire' tool using those values.\n"        
-        "If the user's status is PENDING: You MUST immediately greet them and tell them they need to complete their onboarding profile. "
-        "You MUST ask them to provide ALL of the following details: \n"
-        "1. Phone Number\n"
-        "2. Home Address\n"
-        "3. Bank Account Number\n"
-        "4. Emergency Contact\n"
-        "Also, politely remind them to use the chat attachment button to upload a copy of their Government ID. "
-        f"Do NOT use the 'complete_onboarding_profile' tool until they have provided all 4 text details in the chat. When calling it, pass the System Auth ID ({employee_id}) into the employee_id argument.\n"
-        "4. ONBOARDING: If an HR Admin asks to onboard someone fully, you must collect their bank and emergency info before calling onboard_employee.\n"
-        "5. OFFBOARDING: When offboarding, ensure you ask for the specific offboard date if it wasn't provided.\n"
-        "6. LEAVE PLANNING: If the user asks to plan a vacation or check holidays, use the check_google_calendar_for_leaves tool.\n"
-        "\n--- DATA PRIVACY & ESCALATION RULES ---\n"
-        "7. DATA MASKING: If you retrieve an employee's personal details, you MUST dynamically mask the data in your final response.\n"
-        "8. TICKET ESCALATION: When an employee asks to speak to HR, use the 'raise_hr_ticket' tool.\n"
-        "\n--- LEAVE APPLICATION WORKFLOW ---\n"
-        "9. WHEN APPLYING FOR LEAVE, YOU MUST FOLLOW THESE EXACT STEPS IN ORDER:\n"
-        "   - First: Use the 'check_google_calendar_for_leaves' tool to check their balance and suggest long weekends.\n"
-        "   - Second: You MUST ask the employee for the specific REASON for their leave.\n"
-        "   - Third: Only after the employee provides the dates AND the reason, use the 'apply_for_leave' tool to submit it.\n"
-        "10. TOOL USAGE: When ANY tool requires an 'employee_id' parameter, you MUST automatically use the Official HR ID ({real_emp_id}). NEVER ask the user for their ID."
-    )
+    # Static rules come precompiled per role; only the short SESSION suffix is built per turn.
+    system_instruction, template = build_system_prompt(identity, employee_id)
     
-    session_record = await db.chat_sessions.find_one({"employee_id": employee_id})
-    db_history = session_record.get("history", []) if session_record else []
-    formatted_memory = [(msg["role"], msg["content"]) for msg in db_history if msg.get("content", "").strip()]
+    messages, prompt_report, fold_through = await prepare_messages(employee_id, system_instruction, final_prompt, template)
+    prompt_tokens = prompt_report["total_tokens"]
+    tried_keys = set()
 
-    formatted_memory.append(("user", final_prompt))
-    messages = [SystemMessage(content=system_instruction)] + formatted_memory
+    while True:
+        lease = key_pool.acquire(exclude=tried_keys)
+        if lease is None:
+            break
+        tried_keys.add(lease.label)
 
-    full_ai_response = ""
-    
-    for attempt in range(len(VALID_KEYS)):
+        full_ai_response = ""
+        output_started = False
         try:
-            agent_executor = get_agent_executor(safe_tools) 
+            agent_executor = get_agent_executor(safe_tools, lease.api_key)
             
             # --- 3. THE MAGIC: STREAMING EVENTS ---
-            async for event in agent_executor.astream_events({"messages": messages}, version="v1"):
-                kind = event["event"]
+            with span("turn"):
+                async for event in agent_executor.astream_events({"messages": messages}, version="v1", config=turn_config()):
+                    kind = event["event"]
                 
-                # Let the frontend know EXACTLY what tool is being used right now
-                if kind == "on_tool_start":
-                    tool_name = event.get("name", "tool")
-                    yield f"data: {json.dumps({'type': 'tool', 'tool': tool_name})}\n\n"
+                    # Let the frontend know EXACTLY what tool is being used right now
+                    if kind == "on_tool_start":
+                        output_started = True
+                        tool_name = event.get("name", "tool")
+                        yield {'type': 'tool', 'tool': tool_name}
                     
-                # Stream the actual text response word-by-word
-                elif kind == "on_chat_model_stream":
-                    chunk = event["data"]["chunk"].content
-                    if chunk and isinstance(chunk, str):
-                        full_ai_response += chunk
-                        yield f"data: {json.dumps({'type': 'token', 'content': chunk})}\n\n"
-                        
-            # Save to history once generation is complete
-            db_history.append({"role": "user", "content": final_prompt})
-            db_history.append({"role": "assistant", "content": full_ai_response})
-            await db.chat_sessions.update_one(
-                {"employee_id": employee_id},
-                {"$set": {"history": db_history}},
-                upsert=True
-            )
-            
-            # Tell the frontend we are finished!
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
-            return # Exit loop on success
-            
+                    # Stream the actual text response word-by-word
+                    elif kind == "on_chat_model_stream":
+                        chunk = event["data"]["chunk"].content
+                        if chunk and isinstance(chunk, str):
+                            output_started = True
+                            full_ai_response += chunk
+                            yield {'type': 'token', 'content': chunk}
+
         except Exception as e:
-            error_msg = str(e).lower()
-            if "429" in error_msg or "quota" in error_msg or "exhausted" in error_msg:
-                print(f"⚠️ API Key {current_key_idx + 1} exhausted during stream. Rotating...")
-                current_key_idx = (current_key_idx + 1) % len(VALID_KEYS)
-                # Note: Seamlessly resuming a broken stream is complex; for a hackathon, we notify the user.
-                yield f"data: {json.dumps({'type': 'error', 'content': 'API Key rotated. Please try again.'})}\n\n"
-                return
+            rate_limited = is_rate_limit_error(e)
+            key_pool.release(lease, rate_limited=rate_limited, failed=not rate_limited)
+            # Nothing reached the user and no tool ran yet, so the turn can be replayed on another key.
+            if rate_limited and not output_started:
+                print(f"🔁 Gemini {lease.label} rate limited before any output. Retrying on another key...")
+                continue
+            if rate_limited:
+                yield {'type': 'error', 'content': 'The AI service hit its rate limit mid-reply. Please try again.'}
             else:
-                yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-                return
-                
-    yield f"data: {json.dumps({'type': 'error', 'content': 'All API keys exhausted!'})}\n\n"
+                yield {'type': 'error', 'content': str(e)}
+            return
+        except BaseException:
+            # The client disconnected and the SSE layer cancelled this run; free the key's slot before unwinding.
+            key_pool.release(lease, failed=True)
+            raise
+
+        key_pool.release(lease, tokens_used=prompt_tokens + estimate_tokens(full_ai_response))
+
+        # Save to history once generation is complete (append-only, never rewrites old turns)
+        with span("history_write"):
+            await append_turn(db, employee_id, final_prompt, full_ai_response, prompt_tokens=prompt_tokens)
+        schedule_fold(employee_id, fold_through)
+        
+        # Tell the frontend we are finished!
+        yield {'type': 'done', 'prompt_tokens': prompt_tokens}
+        return
+
+    yield {'type': 'error', 'content': 'All API keys exhausted!'}
 
 async def get_agent_response(user_message: str, employee_id: str = "emp_106"):
-    global current_key_idx 
     if not user_message or not user_message.strip():
         return "Please type a valid message."
         
-   # --- 1. IDENTITY & ACCESS LOOKUP ---
-    from bson import ObjectId
-    from bson.errors import InvalidId
-    
-    # Check the Auth (users) collection first
-    try:
-        user_record = await db.users.find_one({"_id": ObjectId(employee_id)})
-    except InvalidId:
-        user_record = await db.users.find_one({"employee_id": employee_id.lower()})
-        
-    # NEW FIX: If not in 'users', check the main 'employees' collection!
-    if not user_record:
-        user_record = await db.employees.find_one({"employee_id": employee_id.lower()})
-    
-    if user_record:
-        user_name = user_record.get("name", "Unknown")
-        user_department = user_record.get("department", "Employee")
-        onboarding_status = user_record.get("onboarding_status", "Completed")
-        
-        # CRITICAL: Grab their real 'emp_xxx' ID to tell the LLM, so tools work!
-        real_emp_id = user_record.get("employee_id", employee_id) 
-        
-        dep_lower = user_department.lower()
-        is_hr_admin = "hr" in dep_lower or "human resources" in dep_lower
-        role_title = "HR Administrator" if is_hr_admin else f"{user_department} Employee"
-    else:
-        user_name = "Guest"
-        role_title = "Unverified User"
-        is_hr_admin = False
-        onboarding_status = "Unknown"
-        real_emp_id = employee_id
-
+    # --- 1. IDENTITY & ACCESS LOOKUP (cached; see app/services/identity.py) ---
+    begin_request_scope()
+    with span("identity"):
+        identity = await resolve_identity(db, employee_id)
+    is_hr_admin = identity["is_hr_admin"]
 
     # 🛡️ FIX 2: Hardcoded Python-Level Security
-    # Standard tools everyone gets
-    safe_tools = [search_policy, get_employee_details, apply_for_leave, get_upcoming_holidays, raise_hr_ticket, check_google_calendar_for_leaves,complete_onboarding_profile]
-    
-    # Give HR the keys to the castle
-    if is_hr_admin:
-        safe_tools.extend([onboard_employee, offboard_employee, prepare_sensitive_transaction, draft_policy_update, list_employees, invite_new_hire])
+    # Standard tools everyone gets; HR gets the keys to the castle
+    safe_tools = HR_ADMIN_TOOLS if is_hr_admin else STANDARD_TOOLS
     
-    system_instruction = (
-        f"You are the Innvoix HR Agentic AI. "
-        f"Chatting with {user_name}. Role: {role_title}. "
-        f"\n[System Auth ID: {employee_id} | Official HR ID: {real_emp_id}]\n" # <--- Tells the LLM both IDs
-        "\n\n--- SECURITY & ACCESS CONTROL RULES ---\n"
-        "1. Standard Employees can ONLY ask about policies, check leave balances, apply for leave, and raise tickets.\n"
-        "2. ONLY HR Administrators have the security clearance to use: 'onboard_employee', 'offboard_employee', 'prepare_sensitive_transaction', 'draft_policy_update', 'invite_new_hire', and 'list_employees'.\n"
-        "3. If a Standard Employee asks you to perform an HR-only action, you MUST completely refuse.\n"
-       "\n--- WORKFLOW ORCHESTRATION RULES ---\n"
-        f"\n--- ONBOARDING STATUS: {onboarding_status.upper()} ---\n"
-        "INVITING VS ONBOARDING: If HR asks to 'invite' a new hire, you MUST ask HR for the Name, Email, Role, and Department. Do NOT ask for a password (the system auto-generates it). Once they provide those 4 details, immediately call the 'invite_new_hire' tool using those values.\n"        "If the user's status is PENDING: You MUST immediately greet them and tell them they need to complete their onboarding profile. "
-        "You MUST ask them to provide ALL of the following details: \n"
-        "1. Phone Number\n"
-        "2. Home Address\n"
-        "3. Bank Account Number\n"
-        "4. Emergency Contact\n"
-        "Also, politely remind them to use the chat attachment button to upload a copy of their Government ID. "
-        f"Do NOT use the 'complete_onboarding_profile' tool until they have provided all 4 text details in the chat. When calling it, pass the System Auth ID ({employee_id}) into the employee_id argument.\n"
-        "4. ONBOARDING: If an HR Admin asks to onboard someone fully, you must collect their bank and emergency info before calling onboard_employee.\n"
-        "5. OFFBOARDING: When offboarding, ensure you ask for the specific offboard date if it wasn't provided.\n"
-        "6. LEAVE PLANNING: If the user asks to plan a vacation or check holidays, use the check_google_calendar_for_leaves tool. Extract the month they mention and convert it to a number (e.g., March = 3). Use the dates returned to suggest strategic days off for a long weekend.\n"
-        "\n--- DATA PRIVACY & ESCALATION RULES ---\n"
-        "7. DATA MASKING: If you retrieve an employee's personal details (like Bank Account) from the database, "
-        "you MUST dynamically mask the data in your final response (e.g., output *****6789).\n"
-        "8. TICKET ESCALATION: When an employee asks to speak to HR or raises a complex issue, "
-        "you must analyze the chat history and use the 'raise_hr_ticket' tool. Pass a detailed, bulleted summary "
-        "of their exact problem into the 'issue_summary' parameter so human HR staff can respond quickly.\n"
-        "\n--- LEAVE APPLICATION WORKFLOW ---\n"
-        "9. WHEN APPLYING FOR LEAVE, YOU MUST FOLLOW THESE EXACT STEPS IN ORDER:\n"
-        "   - First: Use the 'check_google_calendar_for_leaves' tool to check their balance and suggest long weekends.\n"
-        "   - Second: You MUST ask the employee for the specific REASON for their leave.\n"
-        "   - Third: Only after the employee provides the dates AND the reason, use the 'apply_for_leave' tool to submit it."
-        "10. TOOL USAGE: When ANY tool requires an 'employee_id' parameter, you MUST automatically use the Official HR ID ({real_emp_id}) provided at the top of this prompt. NEVER ask the user for their ID."
-    )
+    system_instruction, template = build_system_prompt(identity, employee_id)
     
-    session_record = await db.chat_sessions.find_one({"employee_id": employee_id})
-    
-    if session_record:
-        db_history = session_record.get("history", [])
-        formatted_memory = [(msg["role"], msg["content"]) for msg in db_history if msg.get("content", "").strip()]
-    else:
-        db_history = []
-        formatted_memory = []
+    messages, prompt_report, fold_through = await prepare_messages(employee_id, system_instruction, user_message, template)
+    prompt_tokens = prompt_report["total_tokens"]
+    tried_keys = set()
 
-    formatted_memory.append(("user", user_message))
-    messages = [SystemMessage(content=system_instruction)] + formatted_memory
+    while True:
+        lease = key_pool.acquire(exclude=tried_keys)
+        if lease is None:
+            break
+        tried_keys.add(lease.label)
 
-    for attempt in range(len(VALID_KEYS)):
         try:
             # We now pass ONLY the securely filtered tools to the executor
-            agent_executor = get_agent_executor(safe_tools) 
-            response = await agent_executor.ainvoke({"messages": messages})
-            ai_reply = response["messages"][-1].content
-            clean_reply = clean_response(ai_reply)
-            
-            db_history.append({"role": "user", "content": user_message})
-            db_history.append({"role": "assistant", "content": clean_reply})
-            
-            await db.chat_sessions.update_one(
-                {"employee_id": employee_id},
-                {"$set": {"history": db_history}},
-                upsert=True
-            )
-            
-            return clean_reply
-
+            agent_executor = get_agent_executor(safe_tools, lease.api_key)
+            with span("turn"):
+                response = await agent_executor.ainvoke({"messages": messages}, config=turn_config())
         except Exception as e:
-            error_msg = str(e).lower()
-            if "429" in error_msg or "quota" in error_msg or "exhausted" in error_msg:
-                print(f"⚠️ API Key {current_key_idx + 1} exhausted. Rotating to next key...")
-                current_key_idx = (current_key_idx + 1) % len(VALID_KEYS)
-            else:
-                return f"Error processing request: {str(e)}"
+            rate_limited = is_rate_limit_error(e)
+            key_pool.release(lease, rate_limited=rate_limited, failed=not rate_limited)
+            if rate_limited:
+                print(f"⚠️ Gemini {lease.label} exhausted. Retrying on another key...")
+                continue
+            return f"Error processing request: {str(e)}"
+        except BaseException:
+            key_pool.release(lease, failed=True)
+            raise
+
+        ai_reply = response["messages"][-1].content
+        clean_reply = clean_response(ai_reply)
+        key_pool.release(lease, tokens_used=prompt_tokens + estimate_tokens(clean_reply))
+        
+        with span("history_write"):
+            await append_turn(db, employee_id, user_message, clean_reply, prompt_tokens=prompt_tokens)
+        schedule_fold(employee_id, fold_through)
+        
+        return clean_reply
                 
     return "❌ SYSTEM ERROR: All fallback API keys have exhausted their quotas!"
 
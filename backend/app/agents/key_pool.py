@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-key budgets. Defaults match the Gemini free tier for flash models; raise them for paid keys.
+KEY_RPM = float(os.getenv("GEMINI_KEY_RPM", "10"))
+KEY_BURST = float(os.getenv("GEMINI_KEY_BURST", str(max(1.0, KEY_RPM / 2))))
+KEY_TPM = float(os.getenv("GEMINI_KEY_TPM", "250000"))
+COOLDOWN_SECONDS = float(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "60"))
+MAX_COOLDOWN_SECONDS = float(os.getenv("GEMINI_KEY_MAX_COOLDOWN_SECONDS", "600"))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    error_msg = str(error).lower()
+    return "429" in error_msg or "quota" in error_msg or "exhausted" in error_msg
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.level
+
+    def take(self, amount: float, now: float):
+        # May go negative: the debt is paid back by the refill before the key is preferred again.
+        self._refill(now)
+        self.level -= amount
+
+
+class KeyState:
+    def __init__(self, label: str, api_key: str):
+        self.label = label
+        self.api_key = api_key
+        self.requests = TokenBucket(KEY_BURST, KEY_RPM / 60.0)
+        self.tokens = TokenBucket(KEY_TPM, KEY_TPM / 60.0)
+        self.inflight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_429 = 0
+        self.recent = deque()
+        self.total_requests = 0
+        self.total_429 = 0
+        self.total_errors = 0
+        self.total_tokens = 0
+
+    def requests_last_minute(self, now: float) -> int:
+        while self.recent and self.recent[0] < now - 60:
+            self.recent.popleft()
+        return len(self.recent)
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+
+class GeminiKeyPool:
+    """
+    Schedules chat turns across Gemini API keys.
+    Each key has request and token buckets plus a cooldown that starts after a 429 and grows
+    with repeated 429s. acquire() hands out the least-loaded healthy key; callers report back
+    with release() so the pool learns which keys are throttled.
+    """
+
+    def __init__(self, api_keys):
+        self._lock = threading.Lock()
+        self.keys = [KeyState(f"key_{i + 1}", key) for i, key in enumerate(api_keys)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self, exclude=()):
+        """Returns the best KeyState for a new turn, or None if every key is cooling down or excluded."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [k for k in self.keys if k.healthy(now) and k.label not in exclude]
+            if not candidates:
+                return None
+
+            def load(k):
+                has_budget = k.requests.available(now) >= 1 and k.tokens.available(now) > 0
+                return (not has_budget, k.inflight, k.requests_last_minute(now), -k.requests.available(now))
+
+            state = min(candidates, key=load)
+            state.requests.take(1, now)
+            state.inflight += 1
+            state.total_requests += 1
+            state.recent.append(now)
+            return state
+
+    def release(self, state: KeyState, tokens_used: int = 0, rate_limited: bool = False, failed: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            state.inflight = max(0, state.inflight - 1)
+            if tokens_used:
+                state.tokens.take(tokens_used, now)
+                state.total_tokens += tokens_used
+            if rate_limited:
+                state.total_429 += 1
+                state.consecutive_429 += 1
+                cooldown = min(MAX_COOLDOWN_SECONDS, COOLDOWN_SECONDS * (2 ** (state.consecutive_429 - 1)))
+                state.cooldown_until = now + cooldown
+                print(f"⚠️ Gemini {state.label} rate limited. Cooling down for {cooldown:.0f}s.")
+            elif failed:
+                state.total_errors += 1
+            else:
+                state.consecutive_429 = 0
+
+    def snapshot(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": k.label,
+                    "healthy": k.healthy(now),
+                    "cooldown_seconds_left": round(max(0.0, k.cooldown_until - now), 1),
+                    "inflight": k.inflight,
+                    "requests_last_minute": k.requests_last_minute(now),
+                    "request_budget": round(k.requests.available(now), 2),
+                    "token_budget": int(k.tokens.available(now)),
+                    "total_requests": k.total_requests,
+                    "total_429": k.total_429,
+                    "total_errors": k.total_errors,
+                    "total_tokens": k.total_tokens,
+                }
+                for k in self.keys
+            ]
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "background": import the agent stack and build the graphs after the server starts accepting traffic
+# "eager": do it before startup completes (the old behaviour)
+# "off": load on the first chat request only (pods that just serve dashboards never load it)
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "background").lower()
+
+AGENT_MODULE = "app.agents.employee_agent"
+
+_load_task = None
+status = {"state": "not_loaded", "mode": AGENT_WARMUP, "import_ms": None, "warm_up_ms": None, "graphs": 0, "error": None}
+
+
+def _load(warm: bool):
+    """Runs in a worker thread: LangChain, LangGraph and the tools take a while to import."""
+    started = time.perf_counter()
+    from app.agents import employee_agent
+    status["import_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if warm:
+        started = time.perf_counter()
+        try:
+            status["graphs"] = employee_agent.warm_up_agents()
+        except Exception as e:
+            print(f"⚠️ Agent warm-up failed (agents will be built on first use): {e}")
+        status["warm_up_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return employee_agent
+
+
+def load_agents(warm: bool = True) -> asyncio.Future:
+    """Starts (or joins) the one background load of the agent stack."""
+    global _load_task
+    # A cancelled task's exception() raises CancelledError, so check cancelled() first.
+    if _load_task is None or (_load_task.done() and (_load_task.cancelled() or _load_task.exception() is not None)):
+        status["state"] = "loading"
+        _load_task = asyncio.ensure_future(asyncio.to_thread(_load, warm))
+
+        def _done(task):
+            if task.cancelled() or task.exception() is not None:
+                status["state"] = "failed"
+                status["error"] = "cancelled" if task.cancelled() else str(task.exception())
+                print(f"❌ Could not load the agent stack: {status['error']}")
+            else:
+                status["state"] = "ready"
+                print(f"🔥 Agent stack ready (import {status['import_ms']} ms, {status['graphs']} graphs warmed).")
+        _load_task.add_done_callback(_done)
+    return _load_task
+
+
+async def get_agent_module():
+    """
+    The employee agent module, importing it off the event loop if nothing has yet.
+    Requests that arrive during the background warm-up wait for it instead of importing in parallel.
+    """
+    module = sys.modules.get(AGENT_MODULE)
+    if module is not None and status["state"] == "ready":
+        return module
+    return await asyncio.shield(load_agents(warm=False))
+
+
+async def start_agent_warmup():
+    """Called from the lifespan hook."""
+    if AGENT_WARMUP == "eager":
+        await load_agents(warm=True)
+    elif AGENT_WARMUP == "background":
+        load_agents(warm=True)
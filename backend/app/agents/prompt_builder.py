@@ -0,0 +1,146 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Total prompt budget per turn (system + summary + history + new message), in estimated tokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", "6000"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("AGENT_SUMMARY_TOKEN_BUDGET", "400"))
+# Rough per-message framing overhead (role markers etc.).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+# Running totals so the savings from budgeting/summaries are visible (see /api/agents/prompt/stats).
+prompt_stats = {"turns": 0, "prompt_tokens": 0, "history_tokens_saved": 0, "max_prompt_tokens": 0}
+# Per system-prompt template version (see prompt_templates.py), to compare prompt sizes across rewrites.
+template_stats = {}
+
+
+def record_prompt(report: dict):
+    prompt_stats["turns"] += 1
+    prompt_stats["prompt_tokens"] += report["total_tokens"]
+    prompt_stats["history_tokens_saved"] += report["history_tokens_saved"]
+    prompt_stats["max_prompt_tokens"] = max(prompt_stats["max_prompt_tokens"], report["total_tokens"])
+
+    template_id = report.get("template")
+    if template_id:
+        row = template_stats.setdefault(template_id, {
+            "turns": 0, "static_tokens": report["static_tokens"], "system_tokens": 0, "prompt_tokens": 0,
+        })
+        row["turns"] += 1
+        row["system_tokens"] += report["system_tokens"]
+        row["prompt_tokens"] += report["total_tokens"]
+
+
+def get_prompt_stats() -> dict:
+    turns = prompt_stats["turns"]
+    return {
+        **prompt_stats,
+        "budget": CONTEXT_TOKEN_BUDGET,
+        "avg_prompt_tokens": round(prompt_stats["prompt_tokens"] / turns, 1) if turns else 0,
+        "templates": {
+            template_id: {
+                "turns": row["turns"],
+                "static_tokens": row["static_tokens"],
+                "avg_system_tokens": round(row["system_tokens"] / row["turns"], 1),
+                "avg_prompt_tokens": round(row["prompt_tokens"] / row["turns"], 1),
+            }
+            for template_id, row in template_stats.items()
+        },
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local estimate (~4 characters per token). Good enough for budgeting, no tokenizer needed."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_messages(system_instruction: str, summary: str, history: list, user_prompt: str, budget: int = CONTEXT_TOKEN_BUDGET, template=None):
+    """
+    Assembles the agent input under a token budget.
+    The system prompt, rolling summary and new message always go in; history is added newest-first
+    until the budget is spent. Returns (messages, overflow, report) where `overflow` holds the
+    older history messages that did not fit and should be folded into the summary.
+    `template` (a prompt_templates.StaticPrefix) tags the report with the system prompt's version.
+    """
+    history = [msg for msg in history if msg.get("content", "").strip()]
+    if summary:
+        system_instruction = f"{system_instruction}\n\n--- EARLIER CONVERSATION (SUMMARY) ---\n{summary}"
+
+    system_tokens = message_tokens(system_instruction)
+    user_tokens = message_tokens(user_prompt)
+    remaining = budget - system_tokens - user_tokens
+
+    kept = []
+    history_tokens = 0
+    for msg in reversed(history):
+        cost = message_tokens(msg["content"])
+        if cost > remaining:
+            break
+        kept.append(msg)
+        remaining -= cost
+        history_tokens += cost
+    kept.reverse()
+    overflow = history[:len(history) - len(kept)]
+
+    from langchain_core.messages import SystemMessage
+
+    messages = [SystemMessage(content=system_instruction)]
+    messages += [(msg["role"], msg["content"]) for msg in kept]
+    messages.append(("user", user_prompt))
+
+    report = {
+        "budget": budget,
+        "system_tokens": system_tokens,
+        "summary_tokens": estimate_tokens(summary) if summary else 0,
+        "history_tokens": history_tokens,
+        "user_tokens": user_tokens,
+        "total_tokens": system_tokens + history_tokens + user_tokens,
+        "history_messages_sent": len(kept),
+        "history_messages_folded": len(overflow),
+        "history_tokens_saved": sum(message_tokens(msg["content"]) for msg in overflow),
+        "template": template.template_id if template else None,
+        "static_tokens": template.tokens if template else 0,
+    }
+    record_prompt(report)
+    return messages, overflow, report
+
+
+def extractive_summary(previous: str, messages: list, max_tokens: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """Fallback when the LLM is unavailable: keep the newest clipped lines that fit the budget."""
+    lines = previous.splitlines() if previous else []
+    lines += [f"- {msg['role']}: {' '.join(msg['content'].split())[:200]}" for msg in messages]
+    kept, used = [], 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line)
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(reversed(kept))
+
+
+async def summarize_incrementally(llm, previous: str, messages: list, max_tokens: int = SUMMARY_TOKEN_BUDGET) -> str:
+    """
+    Folds `messages` into the existing summary, only sending the new messages plus the old summary.
+    LLM errors propagate so the caller can report them to the key pool; an empty reply falls back
+    to the extractive summary.
+    """
+    transcript = "\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in messages)
+    instruction = (
+        "You maintain a running summary of an HR assistant conversation. "
+        f"Update the summary with the new messages. Keep it under {max_tokens * 3 // 4} words, as terse bullet points. "
+        "Keep facts the assistant may need later: names, IDs, dates, leave requests, ticket/transaction IDs, "
+        "decisions made, and anything still pending. Drop greetings and small talk.\n\n"
+        f"CURRENT SUMMARY:\n{previous or '(none)'}\n\nNEW MESSAGES:\n{transcript}\n\nUPDATED SUMMARY:"
+    )
+    response = await llm.ainvoke(instruction)
+    content = response.content
+    if isinstance(content, list):
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    summary = str(content).strip()
+    return summary or extractive_summary(previous, messages, max_tokens)
@@ -0,0 +1,106 @@
+import hashlib
+from app.agents.prompt_builder import estimate_tokens
+
+# Bump when the rules below are reworded; the content hash is appended automatically, so per-version
+# token stats in /api/agents/prompt/stats never mix two different texts.
+PROMPT_TEMPLATE_VERSION = "v2"
+
+# --- Static rules (identical for every user of a role, so provider-side prefix caching applies) ---
+_INTRO = "You are the Innvoix HR Agentic AI. The current user's identity is in the SESSION section at the end of this prompt."
+
+_SECURITY = [
+    "Standard Employees can ONLY ask about policies, check leave balances, apply for leave, and raise tickets.",
+    "ONLY HR Administrators have the security clearance to use: 'onboard_employee', 'offboard_employee', 'prepare_sensitive_transaction', 'draft_policy_update', 'invite_new_hire', and 'list_employees'.",
+    "If a Standard Employee asks you to perform an HR-only action, you MUST completely refuse.",
+]
+
+_SELF_ONBOARDING = (
+    "SELF-ONBOARDING: If the SESSION onboarding status is PENDING, you MUST immediately greet the user and tell them they need to complete their onboarding profile. "
+    "You MUST ask them to provide ALL of the following details: Phone Number, Home Address, Bank Account Number and Emergency Contact. "
+    "Also, politely remind them to use the chat attachment button to upload a copy of their Government ID. "
+    "Do NOT use the 'complete_onboarding_profile' tool until they have provided all 4 text details in the chat. "
+    "When calling it, pass the System Auth ID from the SESSION section into the employee_id argument."
+)
+
+_HR_WORKFLOWS = [
+    "INVITING VS ONBOARDING: If HR asks to 'invite' a new hire, you MUST ask HR for the Name, Email, Role, and Department. Do NOT ask for a password (the system auto-generates it). Once they provide those 4 details, immediately call the 'invite_new_hire' tool using those values.",
+    "ONBOARDING: If an HR Admin asks to onboard someone fully, you must collect their bank and emergency info before calling onboard_employee.",
+    "OFFBOARDING: When offboarding, ensure you ask for the specific offboard date if it wasn't provided.",
+]
+
+_LEAVE_PLANNING = (
+    "LEAVE PLANNING: If the user asks to plan a vacation or check holidays, use the check_google_calendar_for_leaves tool. "
+    "Extract the month they mention and convert it to a number (e.g., March = 3). Use the dates returned to suggest strategic days off for a long weekend."
+)
+
+_PRIVACY = [
+    "DATA MASKING: If you retrieve an employee's personal details (like Bank Account) from the database, you MUST dynamically mask the data in your final response (e.g., output *****6789).",
+    "TICKET ESCALATION: When an employee asks to speak to HR or raises a complex issue, you must analyze the chat history and use the 'raise_hr_ticket' tool. "
+    "Pass a detailed, bulleted summary of their exact problem into the 'issue_summary' parameter so human HR staff can respond quickly.",
+]
+
+_LEAVE_APPLICATION = (
+    "WHEN APPLYING FOR LEAVE, YOU MUST FOLLOW THESE EXACT STEPS IN ORDER:\n"
+    "   - First: Use the 'check_google_calendar_for_leaves' tool to check their balance and suggest long weekends.\n"
+    "   - Second: You MUST ask the employee for the specific REASON for their leave.\n"
+    "   - Third: Only after the employee provides the dates AND the reason, use the 'apply_for_leave' tool to submit it."
+)
+
+_TOOL_USAGE = (
+    "TOOL USAGE: When ANY tool requires an 'employee_id' parameter, you MUST automatically use the Official HR ID from the SESSION section. "
+    "NEVER ask the user for their ID."
+)
+
+
+def _numbered(sections) -> str:
+    """Renders (heading, [rules]) sections with one running rule number."""
+    parts, number = [], 1
+    for heading, rules in sections:
+        lines = []
+        for rule in rules:
+            lines.append(f"{number}. {rule}")
+            number += 1
+        parts.append(f"--- {heading} ---\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def _compile_static(role: str) -> str:
+    workflows = [_SELF_ONBOARDING] + (_HR_WORKFLOWS if role == "hr_admin" else []) + [_LEAVE_PLANNING]
+    return _INTRO + "\n\n" + _numbered([
+        ("SECURITY & ACCESS CONTROL RULES", _SECURITY),
+        ("WORKFLOW ORCHESTRATION RULES", workflows),
+        ("DATA PRIVACY & ESCALATION RULES", _PRIVACY),
+        ("LEAVE APPLICATION WORKFLOW", [_LEAVE_APPLICATION, _TOOL_USAGE]),
+    ])
+
+
+class StaticPrefix:
+    def __init__(self, role: str):
+        self.role = role
+        self.text = _compile_static(role)
+        digest = hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:8]
+        self.template_id = f"{role}@{PROMPT_TEMPLATE_VERSION}-{digest}"
+        self.tokens = estimate_tokens(self.text)
+
+
+# Compiled once at import; the text never changes for the life of the process.
+STATIC_PREFIXES = {role: StaticPrefix(role) for role in ("employee", "hr_admin")}
+
+
+def session_suffix(identity: dict, employee_id: str) -> str:
+    """The per-user part of the system prompt, kept short; it follows the static rules and only the rolling summary comes after it."""
+    return (
+        "--- SESSION ---\n"
+        f"User: {identity['user_name']} | Role: {identity['role_title']} | Onboarding status: {identity['onboarding_status'].upper()}\n"
+        f"[System Auth ID: {employee_id} | Official HR ID: {identity['real_emp_id']}]"
+    )
+
+
+def build_system_prompt(identity: dict, employee_id: str):
+    """Returns (system_instruction, template) where template carries the id and static token count."""
+    prefix = STATIC_PREFIXES["hr_admin" if identity["is_hr_admin"] else "employee"]
+    return f"{prefix.text}\n\n{session_suffix(identity, employee_id)}", prefix
+
+
+def template_summary() -> dict:
+    return {p.template_id: {"role": p.role, "static_tokens": p.tokens, "static_chars": len(p.text)} for p in STATIC_PREFIXES.values()}
@@ -0,0 +1,76 @@
+import time
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from app.services.telemetry import (
+    LLM_FIRST_TOKEN_SECONDS, TOOL_SECONDS, STAGE_SECONDS, current_trace, is_debug
+)
+
+
+class StageTimingCallback(AsyncCallbackHandler):
+    """
+    Times every LLM call (including time to first token) and every tool call of one agent turn,
+    into the stage histograms and the request's trace. One instance per turn.
+    """
+
+    def __init__(self):
+        self.trace = current_trace()
+        self._runs = {}   # run_id -> (kind, name, started, first_token_at)
+
+    def _start(self, run_id, kind: str, name: str):
+        self._runs[run_id] = [kind, name, time.perf_counter(), None]
+
+    def _end(self, run_id, outcome: str = "ok"):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        kind, name, started, first_token_at = run
+        duration = time.perf_counter() - started
+        attrs = {"outcome": outcome}
+        if kind == "llm":
+            STAGE_SECONDS.observe(duration, stage="llm")
+            if first_token_at is not None:
+                attrs["first_token_ms"] = round((first_token_at - started) * 1000, 2)
+        else:
+            TOOL_SECONDS.observe(duration, tool=name, outcome=outcome)
+            STAGE_SECONDS.observe(duration, stage="tool")
+            attrs["tool"] = name
+        if self.trace is not None:
+            self.trace.add_span(kind, started, duration, parent="turn", **attrs)
+
+    # --- LLM ---
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", "chat_model")
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", "llm")
+
+    async def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run[3] is None:
+            run[3] = time.perf_counter()
+            LLM_FIRST_TOKEN_SECONDS.observe(run[3] - run[2])
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, outcome=type(error).__name__)
+
+    # --- Tools ---
+    async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name") or "tool")
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, outcome=type(error).__name__)
+
+
+def turn_config() -> dict:
+    """RunnableConfig for one agent turn: stage timing always, full callback logging in debug mode."""
+    callbacks = [StageTimingCallback()]
+    if is_debug():
+        from langchain_core.tracers.stdout import ConsoleCallbackHandler
+        callbacks.append(ConsoleCallbackHandler())
+    return {"callbacks": callbacks}
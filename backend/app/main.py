@@ -1,29 +1,44 @@
 import os
-import certifi 
+import asyncio
 import shutil
 import datetime
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, File, UploadFile, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from bson import ObjectId
+from bson.errors import InvalidId
 import json
 
 import uvicorn
-from app.agents.employee_agent import stream_agent_response
-
-# --- LangChain & Pinecone Imports ---
-from pinecone import Pinecone
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
+
+# --- LangChain & Vector Store Imports ---
 import base64
-from fastapi.responses import Response, StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 
 # --- Agent Imports ---
-from app.agents.employee_agent import get_agent_response
+from app.agents.loader import get_agent_module, start_agent_warmup, status as agent_loader_status
+from app.agents.agent_cache import agent_cache
+from app.agents.prompt_builder import get_prompt_stats
+from app.agents.prompt_templates import template_summary
+from app.services.identity import identity_cache_stats
+from app.services.policy_retriever import get_policy_retriever
+from app.services.vector_store import VECTOR_STORE_BACKEND, delete_source
+from app.services.ingestion import forget_file
+from app.services.ingest_jobs import IngestJobRunner, IngestQueueFull, staging_path
+from app.services.indexes import ensure_indexes, check_query_plans, explain_query_shapes, CHECK_QUERY_PLANS
+from app.services.name_search import backfill_search_fields
+from app.services.sequences import get_sequence_allocator
+from app.services.pagination import paginate, build_projection, created_range, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.blob_store import get_blob_store, blob_response
+from app.services.email_outbox import get_outbox
+from app.services.holidays import get_holiday_provider
+from app.services.sse import sse_stream, stream_stats
+from app.services.chat_coalescing import chat_coalescer, request_key, reply_events, collect_reply
+from app.services.telemetry import TracingMiddleware, render_metrics, recent_traces, get_trace, debug_log
+from app.services.text_extraction import get_text_extractor, UploadTooLarge, TooManyPages
+from app.services.database import db, connect_to_mongo, close_mongo_connection, pool_metrics
 
 # Ensure policy data folder exists
 os.makedirs("data/policies", exist_ok=True)
@@ -32,30 +47,47 @@ os.makedirs("data/policies", exist_ok=True)
 
 
 # ==========================================
-# 1. DATABASE CONNECTION (Robust SSL Setup)
+# 1. DATABASE CONNECTION (shared pooled client)
 # ==========================================
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-
-print(f"🔌 Connecting to MongoDB...")
 
-try:
-    client = AsyncIOMotorClient(
-        MONGO_URI, 
-        tlsCAFile=certifi.where(),
-        serverSelectionTimeoutMS=5000,
-        connectTimeoutMS=10000,
-        socketTimeoutMS=10000
-    )
-    db = client["innvoix_hr"]
-    print("✅ Database Connection Successful")
-except Exception as e:
-    print(f"❌ Critical DB Error: {e}")
+# `db` (imported above) resolves to the one pooled client shared by the endpoints, agent tools
+# and background jobs. It is opened and closed by the lifespan hook below.
 
 # ==========================================
 # 2. APP SETUP & CORS
 # ==========================================
-app = FastAPI(title="Innvoix HR Agent API")
+ingest_runner = IngestJobRunner(db)
+blob_store = get_blob_store()
+email_outbox = get_outbox()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await connect_to_mongo()
+    try:
+        await ensure_indexes(db)
+        backfilled = await backfill_search_fields(db)
+        if backfilled:
+            print(f"🔎 Added name search fields to {backfilled} employees.")
+        await get_sequence_allocator().seed_all()
+        if CHECK_QUERY_PLANS:
+            await check_query_plans(db)
+    except Exception as e:
+        print(f"⚠️ Could not bootstrap MongoDB indexes: {e}")
+    await ingest_runner.start()
+    await email_outbox.start()
+    # Warm this year's holidays in the background; the server accepts traffic meanwhile.
+    holiday_prefetch = asyncio.create_task(get_holiday_provider().prefetch())
+    # LangChain/LangGraph and the agent graphs load in a worker thread while traffic is served (AGENT_WARMUP).
+    await start_agent_warmup()
+    yield
+    await ingest_runner.stop()
+    await email_outbox.stop()
+    holiday_prefetch.cancel()
+    get_text_extractor().shutdown()
+    await close_mongo_connection()
+
+app = FastAPI(title="Innvoix HR Agent API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -63,7 +95,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+# Times every request into /metrics and keeps sampled span trees (send X-Debug-Trace: 1 to trace one request).
+app.add_middleware(TracingMiddleware)
 
 # ==========================================
 # 3. PYDANTIC MODELS (Merged)
@@ -103,6 +138,21 @@ def format_mongo_doc(doc):
         doc["_id"] = str(doc["_id"])
     return doc
 
+# Never send passwords or bank details to the dashboards.
+EMPLOYEE_LIST_FIELDS = ["employee_id", "name", "email", "role", "department", "onboarding_status", "casual_leaves_left", "sick_leaves_left"]
+
+def page_response(docs, next_cursor):
+    return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs], "next_cursor": next_cursor}
+
+async def list_collection(collection, query, fields, limit, cursor, sort_field="_id", exclude=None):
+    """One page of a dashboard list: filters, optional `fields` projection and a keyset `cursor`."""
+    projection = build_projection(fields, exclude=exclude)
+    try:
+        docs, next_cursor = await paginate(collection, query, sort_field=sort_field, limit=limit, cursor=cursor, projection=projection)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page_response(docs, next_cursor)
+
 # ==========================================
 # Root Endpoint
 # ==========================================
@@ -110,6 +160,60 @@ def format_mongo_doc(doc):
 def read_root():
     return {"status": "Active", "message": "Innvoix Backend is Connected and Running! 🚀"}
 
+@app.get("/api/metrics/mongo")
+async def get_mongo_pool_stats():
+    """Connection-pool checkout waits and open connections of the shared MongoDB client."""
+    return {"status": "success", "data": pool_metrics.snapshot()}
+
+@app.get("/api/notifications/outbox/stats")
+async def get_outbox_stats():
+    """Outbound email queue: messages per delivery status and SMTP connections opened."""
+    return {"status": "success", "data": await email_outbox.stats()}
+
+@app.get("/api/notifications/outbox/{message_id}")
+async def get_outbox_message(message_id: str):
+    """Delivery status (queued / sending / sent / failed / skipped), attempts and last error of one email."""
+    try:
+        message = await email_outbox.get(ObjectId(message_id))
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid message ID format.")
+    if not message:
+        raise HTTPException(status_code=404, detail="Email not found.")
+    return {"status": "success", "data": format_mongo_doc(message)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: stage, LLM first-token, tool, HTTP and MongoDB command histograms."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/metrics/traces")
+async def list_traces(limit: int = Query(50, ge=1, le=200)):
+    """Most recent sampled (or debug) request traces."""
+    return {"status": "success", "data": recent_traces(limit)}
+
+@app.get("/api/metrics/traces/{trace_id}")
+async def get_trace_detail(trace_id: str):
+    """Span tree of one kept trace (the X-Trace-Id response header of a sampled request)."""
+    trace = get_trace(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found (not sampled, or already evicted)")
+    return {"status": "success", "data": trace}
+
+@app.get("/api/metrics/streams")
+async def get_stream_stats():
+    """Chat SSE streams: time to first byte, total duration, frames per stream and client disconnects."""
+    return {"status": "success", "data": stream_stats.snapshot()}
+
+@app.get("/api/chat/coalescing/stats")
+async def get_chat_coalescing_stats():
+    """Agent runs started, duplicate requests that joined an in-flight run instead, and runs cancelled."""
+    return {"status": "success", "data": chat_coalescer.get_stats()}
+
+@app.get("/api/metrics/mongo/query-plans")
+async def get_query_plans():
+    """Winning plan of every hot query shape; any `collscan: true` entry is missing an index."""
+    return {"status": "success", "data": await explain_query_shapes(db)}
+
 # ==========================================
 # 4. AUTH & USER ENDPOINTS
 # ==========================================
@@ -159,13 +263,26 @@ async def get_user_profile(user_id: str):
         raise HTTPException(status_code=400, detail="Invalid User ID format")
 
 @app.get("/api/employees")
-async def get_all_employees():
+async def get_all_employees(
+    department: str = None, status: str = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+    fields: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str = None,
+):
     """Updated by Dharani: Returns only standard employees."""
+    query = {"role": "employee", **created_range(created_from, created_to)}
+    if department:
+        query["department"] = department
+    if status:
+        query["onboarding_status"] = status
     try:
-        docs = await db["users"].find({"role": "employee"}).to_list(100)
-        return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs]}
+        docs, next_cursor = await paginate(
+            db["users"], query, limit=limit, cursor=cursor,
+            projection=build_projection(fields, allowed=EMPLOYEE_LIST_FIELDS),
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception:
-        return {"status": "error", "data": []}
+        return {"status": "error", "data": [], "next_cursor": None}
+    return page_response(docs, next_cursor)
 
 # ==========================================
 # 5. AGENTIC CHAT ENDPOINT
@@ -173,15 +290,52 @@ async def get_all_employees():
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     try:
-        print(f"📩 Chat Received from {request.employee_id}: {request.message}")
-        response = await get_agent_response(request.message, employee_id=request.employee_id)
-        print(f"📤 Agent Reply: {response}")
+        debug_log(f"📩 Chat Received from {request.employee_id}: {request.message}")
+        agents = await get_agent_module()
+        # An identical request still in flight (double submit, retry after a timeout) is joined, not re-run.
+        events = chat_coalescer.events(
+            request_key("chat", request.employee_id, request.message),
+            lambda: reply_events(agents.get_agent_response(request.message, employee_id=request.employee_id)),
+        )
+        response = await collect_reply(events)
+        debug_log(f"📤 Agent Reply: {response}")
         return {"response": response}
     except Exception as e:
         print(f"❌ Agent Error: {e}")
         # Dharani's fix: Returns a string to the frontend instead of crashing
         return {"response": f"Sorry, my AI brain encountered an error: {str(e)}"}
 
+@app.get("/api/agents/cache/stats")
+async def get_agent_cache_stats():
+    """How many compiled agent graphs are cached and how often they are reused."""
+    return {"status": "success", "data": {**agent_cache.stats(), "loader": agent_loader_status}}
+
+@app.get("/api/agents/keys")
+async def get_key_pool_state():
+    """Per-key request rate, remaining budgets and cooldowns of the Gemini key pool."""
+    agents = await get_agent_module()
+    return {"status": "success", "data": agents.key_pool.snapshot()}
+
+@app.get("/api/agents/identity/stats")
+async def get_identity_cache_stats():
+    """Hit/miss counters of the identity and employee-record caches used on every chat turn."""
+    return {"status": "success", "data": identity_cache_stats()}
+
+@app.get("/api/agents/holidays/stats")
+async def get_holiday_cache_stats():
+    """Calendar cache hits, remote fetches and stale serves of the holiday provider."""
+    return {"status": "success", "data": get_holiday_provider().get_stats()}
+
+@app.get("/api/chat/extraction/stats")
+async def get_extraction_stats():
+    """Document text extraction: parses done vs. served from the content-hash cache."""
+    return {"status": "success", "data": get_text_extractor().get_stats()}
+
+@app.get("/api/agents/prompt/stats")
+async def get_prompt_size_stats():
+    """Prompt size per turn against the context budget, tokens saved by the rolling summary, and the compiled static prompts."""
+    return {"status": "success", "data": {**get_prompt_stats(), "compiled_templates": template_summary()}}
+
 # ==========================================
 # 6. TICKETS ENDPOINTS (Dharani's Updates)
 # ==========================================
@@ -194,9 +348,16 @@ async def create_new_ticket(ticket: TicketCreate):
     return {"status": "success", "message": "Ticket created"}
 
 @app.get("/api/tickets")
-async def get_all_tickets():
-    docs = await db["tickets"].find().sort("date", -1).to_list(100)
-    return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs]}
+async def get_all_tickets(
+    status: str = None, employee_id: str = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+    fields: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str = None,
+):
+    query = {**created_range(created_from, created_to)}
+    if status:
+        query["status"] = status
+    if employee_id:
+        query["employee_id"] = employee_id
+    return await list_collection(db["tickets"], query, fields, limit, cursor, sort_field="date")
 
 @app.put("/api/tickets/{ticket_id}")
 async def update_ticket_status(ticket_id: str, status_update: TicketUpdate):
@@ -213,22 +374,38 @@ async def update_ticket_status(ticket_id: str, status_update: TicketUpdate):
 # 7. HR DASHBOARD GET ENDPOINTS (Devaroopa's Data)
 # ==========================================
 @app.get("/api/leaves")
-async def get_leave_requests():
-    cursor = db.leave_requests.find()
-    docs = await cursor.to_list(length=100)
-    return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs]}
+async def get_leave_requests(
+    status: str = None, employee_id: str = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+    fields: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str = None,
+):
+    query = {**created_range(created_from, created_to)}
+    if status:
+        query["status"] = status
+    if employee_id:
+        query["emp_id"] = employee_id
+    return await list_collection(db.leave_requests, query, fields, limit, cursor)
 
 @app.get("/api/approvals")
-async def get_pending_approvals():
-    cursor = db.pending_approvals.find()
-    docs = await cursor.to_list(length=100)
-    return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs]}
+async def get_pending_approvals(
+    status: str = None, employee_id: str = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+    fields: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str = None,
+):
+    query = {**created_range(created_from, created_to)}
+    if status:
+        query["status"] = status
+    if employee_id:
+        query["emp_id"] = employee_id
+    return await list_collection(db.pending_approvals, query, fields, limit, cursor)
 
 @app.get("/api/policies/drafts")
-async def get_policy_drafts():
-    cursor = db.policy_drafts.find()
-    docs = await cursor.to_list(length=100)
-    return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs]}
+async def get_policy_drafts(
+    department: str = None, created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+    fields: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str = None,
+):
+    query = {**created_range(created_from, created_to)}
+    if department:
+        query["target_audience"] = department
+    return await list_collection(db.policy_drafts, query, fields, limit, cursor)
 
 # ==========================================
 # 8. HR DASHBOARD PUT ENDPOINTS (Approvals)
@@ -258,68 +435,59 @@ async def handle_leave_approval(req_id: str, action: ApprovalAction):
         return {"status": "success", "message": f"Leave {req_id} rejected."}
 
 # ==========================================
-# 9. POLICY DOCUMENT MANAGEMENT (Pinecone)
+# 9. POLICY DOCUMENT MANAGEMENT (Vector Store)
 # ==========================================
-@app.post("/api/policies/upload")
+def save_upload(source, file_path: str):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+@app.post("/api/policies/upload", status_code=202)
 async def upload_new_policy(file: UploadFile = File(...)):
+    """Saves the PDF and queues it for background ingestion. Poll the returned status_url for progress."""
     print(f"📥 Received new policy document: {file.filename}")
-    file_path = f"data/policies/{file.filename}"
+    # Staged under a per-upload name; the job moves it to data/policies/ once no other job for that file is running.
+    file_path = staging_path(file.filename)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await asyncio.to_thread(save_upload, file.file, file_path)
         
     try:
-        print("📄 Loading and splitting document...")
-        loader = PyPDFLoader(file_path)
-        docs = loader.load()
-        
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        chunks = text_splitter.split_documents(docs)
-        
-        print(f"🧠 Embedding {len(chunks)} chunks into Pinecone Cloud...")
-        # Force it to use your specific key variable and correct model name
-        google_key = os.getenv("GEMINI_KEY_1") or os.getenv("GOOGLE_API_KEY")
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model="gemini-embedding-001",
-            google_api_key=google_key
-        )
-        index_name = os.getenv("PINECONE_INDEX_NAME")
-        
-        PineconeVectorStore.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            index_name=index_name
-        )
-        
-        # --- NEW CODE: Convert PDF to Base64 to store in MongoDB ---
-        with open(file_path, "rb") as pdf_file:
-            encoded_string = base64.b64encode(pdf_file.read()).decode('utf-8')
-            
-        await db.active_policies.insert_one({
-            "filename": file.filename,
-            "status": "Active Vectorized",
-            "file_data": encoded_string  # <-- The physical file is now in the DB!
-        })
-        
-        return {"status": "success", "message": f"Policy '{file.filename}' successfully uploaded to Pinecone!"}
-
-    except Exception as e:
-        print(f"❌ Error vectorizing document: {str(e)}")
+        job = await ingest_runner.submit(file.filename, file_path)
+    except IngestQueueFull as e:
         if os.path.exists(file_path):
             os.remove(file_path)
-        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "status": "accepted",
+        "job_id": job["_id"],
+        "status_url": f"/api/policies/jobs/{job['_id']}",
+        "message": f"Policy '{file.filename}' queued for processing."
+    }
+
+@app.get("/api/policies/jobs/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Status and progress (pages, chunks embedded) of a policy ingestion job."""
+    job = await ingest_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found.")
+    job["job_id"] = job.pop("_id")
+    return {"status": "success", "data": job}
 
 @app.get("/api/policies/active")
-async def get_active_policies():
-    cursor = db.active_policies.find()
-    docs = await cursor.to_list(length=100)
-    return {"status": "success", "data": [format_mongo_doc(doc) for doc in docs]}
+async def get_active_policies(
+    created_from: datetime.datetime = None, created_to: datetime.datetime = None,
+    fields: str = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: str = None,
+):
+    # The PDF itself is only served by the download endpoint.
+    return await list_collection(
+        db.active_policies, created_range(created_from, created_to), fields, limit, cursor, exclude=["file_data"]
+    )
 
 @app.delete("/api/policies/{policy_id}")
 async def delete_policy(policy_id: str):
     print(f"🗑️ Deleting policy record: {policy_id}")
     
-    policy_doc = await db.active_policies.find_one({"_id": ObjectId(policy_id)})
+    policy_doc = await db.active_policies.find_one({"_id": ObjectId(policy_id)}, {"file_data": 0})
     if not policy_doc:
          raise HTTPException(status_code=404, detail="Policy not found in database.")
          
@@ -327,75 +495,87 @@ async def delete_policy(policy_id: str):
     file_path = f"data/policies/{filename}"
 
     await db.active_policies.delete_one({"_id": ObjectId(policy_id)})
+    await blob_store.release(policy_doc.get("blob_id"))
     
     if os.path.exists(file_path):
         os.remove(file_path)
         print(f"Removed physical file: {file_path}")
 
     try:
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
-        index.delete(filter={"source": file_path})
-        print(f"☁️ Purged all chunks for {filename} from Pinecone.")
+        delete_source(file_path)
+        forget_file(file_path)
+        print(f"☁️ Purged all chunks for {filename} from the {VECTOR_STORE_BACKEND} vector store.")
     except Exception as e:
-        print(f"⚠️ Warning: Could not purge from Pinecone: {str(e)}")
+        print(f"⚠️ Warning: Could not purge from the vector store: {str(e)}")
+
+    # Never serve cached chunks from a deleted policy.
+    get_policy_retriever().invalidate()
 
     return {"status": "success", "message": f"Policy '{filename}' successfully deleted from the AI Knowledge Base."}
 
+@app.get("/api/policies/retriever/stats")
+async def get_retriever_stats():
+    """Hit/miss counters for the policy search caches (used to size them)."""
+    return {"status": "success", "data": get_policy_retriever().stats()}
+
 # ==========================================
 # 10. POLICY PDF DOWNLOAD ENDPOINT
 # ==========================================
 @app.get("/api/policies/download/{policy_id}")
-async def download_policy(policy_id: str):
-    """Fetches the Base64 PDF string from MongoDB and serves it as a downloadable file."""
+async def download_policy(policy_id: str, request: Request):
+    """Streams the policy PDF from the blob store (supports Range, ETag and conditional GETs)."""
     print(f"📥 Fetching PDF download for policy: {policy_id}")
     
-    policy_doc = await db.active_policies.find_one({"_id": ObjectId(policy_id)})
-    
-    if not policy_doc or "file_data" not in policy_doc:
+    try:
+        policy_doc = await db.active_policies.find_one({"_id": ObjectId(policy_id)}, {"file_data": 0})
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid policy ID format.")
+
+    if policy_doc and not policy_doc.get("blob_id"):
+        # Uploaded before the blob store existed: move its inline Base64 copy over once.
+        legacy = await db.active_policies.find_one({"_id": policy_doc["_id"]}, {"file_data": 1})
+        if legacy and "file_data" in legacy:
+            blob = await blob_store.put_bytes(base64.b64decode(legacy["file_data"]), policy_doc["filename"], "application/pdf")
+            await db.active_policies.update_one({"_id": policy_doc["_id"]}, {"$set": blob, "$unset": {"file_data": ""}})
+            policy_doc.update(blob)
+
+    response = None
+    if policy_doc and policy_doc.get("blob_id"):
+        response = await blob_response(blob_store, request, policy_doc["blob_id"], policy_doc["filename"])
+    if response is None:
          raise HTTPException(status_code=404, detail="PDF data not found in database.")
-         
-    # Decode the Base64 string back into raw PDF bytes
-    pdf_bytes = base64.b64decode(policy_doc["file_data"])
-    
-    # Serve it to the frontend as a real file!
-    return Response(
-        content=pdf_bytes, 
-        media_type="application/pdf", 
-        headers={"Content-Disposition": f"attachment; filename={policy_doc['filename']}"}
-    )
+    return response
 
 @app.post("/api/chat/upload_document")
 async def chat_document_upload(employee_id: str, document_type: str, file: UploadFile = File(...)):
-    import base64
-    file_bytes = await file.read()
-    
-    # Extract text if it's a PDF so the AI can read it!
-    extracted_text = ""
-    temp_path = f"data/policies/temp_{file.filename}"
+    extractor = get_text_extractor()
     try:
-        with open(temp_path, "wb") as f:
-            f.write(file_bytes)
-            
-        if file.filename.lower().endswith('.pdf'):
-            loader = PyPDFLoader(temp_path)
-            docs = loader.load()
-            extracted_text = "\n".join([doc.page_content for doc in docs])
-        else:
-            extracted_text = file_bytes.decode('utf-8', errors='ignore')
-    except Exception as e:
-        print(f"Could not extract text: {e}")
+        temp_path, sha256, size = await extractor.spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    try:
+        # Extract text so the AI can read it! (process pool; cached by content hash)
+        extracted_text = ""
+        try:
+            extracted_text = await extractor.extract(temp_path, sha256, file.filename)
+        except TooManyPages as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except Exception as e:
+            print(f"Could not extract text: {e}")
+
+        # Save the file to the blob store (deduplicated by content hash); the record only points at it
+        content_type = file.content_type or ("application/pdf" if file.filename.lower().endswith(".pdf") else "application/octet-stream")
+        blob = await blob_store.put_file(temp_path, file.filename, content_type, sha256=sha256)
     finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
-    
-    # Save secure Base64 to MongoDB vault
-    encoded_string = base64.b64encode(file_bytes).decode('utf-8')
+
     await db.employee_documents.insert_one({
         "employee_id": employee_id,
         "document_type": document_type, 
         "filename": file.filename,
-        "file_data": encoded_string,
+        **blob,
         "upload_date": datetime.datetime.utcnow(),
     })
     
@@ -407,10 +587,16 @@ async def chat_document_upload(employee_id: str, document_type: str, file: Uploa
     }
 # --- 1. NEW REAL-TIME STREAMING ENDPOINT ---
 @app.post("/api/chat/stream")
-async def chat_stream_endpoint(request: StreamChatRequest):
+async def chat_stream_endpoint(request: StreamChatRequest, http_request: Request):
+    agents = await get_agent_module()
+    events = chat_coalescer.events(
+        request_key("stream", request.employee_id, request.message, request.document_context),
+        lambda: agents.stream_agent_response(request.message, request.employee_id, request.document_context),
+    )
     return StreamingResponse(
-        stream_agent_response(request.message, request.employee_id, request.document_context), 
-        media_type="text/event-stream"
+        sse_stream(events, http_request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 if __name__ == "__main__":
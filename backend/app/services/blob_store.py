@@ -0,0 +1,246 @@
+import os
+import base64
+import hashlib
+import asyncio
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from bson import ObjectId
+from pymongo import ReturnDocument
+from fastapi.responses import Response, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BLOB_BUCKET = os.getenv("BLOB_BUCKET", "blobs")
+# GridFS chunk size; also the unit downloads are streamed in.
+BLOB_CHUNK_BYTES = int(os.getenv("BLOB_CHUNK_BYTES", str(255 * 1024)))
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+class BlobStore:
+    """
+    Content-addressed file storage in GridFS.
+    Files are stored once per SHA-256 (re-uploading the same PDF reuses the stored copy) and
+    reference-counted, so several policy/document records can point at one blob.
+    """
+
+    def __init__(self, db=None, bucket_name: str = BLOB_BUCKET):
+        # Without a db, the shared client's database is used (GridFS needs the real Motor database).
+        self.db = db
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._bucket_client = None
+
+    @property
+    def database(self):
+        from app.services.database import get_db
+        return self.db if self.db is not None else get_db()
+
+    @property
+    def bucket(self):
+        database = self.database
+        if self._bucket is None or self._bucket_client is not database.client:
+            self._bucket = AsyncIOMotorGridFSBucket(database, bucket_name=self.bucket_name, chunk_size_bytes=BLOB_CHUNK_BYTES)
+            self._bucket_client = database.client
+        return self._bucket
+
+    @property
+    def files(self):
+        return self.database[f"{self.bucket_name}.files"]
+
+    # --- Writes ---
+    async def put_bytes(self, data: bytes, filename: str, content_type: str = "application/octet-stream") -> dict:
+        sha256 = hashlib.sha256(data).hexdigest()
+        existing = await self._claim_existing(sha256)
+        if existing:
+            return existing
+
+        stream = self.bucket.open_upload_stream(filename, metadata=self._metadata(sha256, content_type))
+        await stream.write(data)
+        await stream.close()
+        return self._describe(stream._id, sha256, len(data), content_type)
+
+    async def put_file(self, path: str, filename: str, content_type: str = "application/octet-stream", sha256: str = None) -> dict:
+        """Streams a file from disk into GridFS without holding it in memory."""
+        from app.services.ingestion import file_sha256
+
+        sha256 = sha256 or await asyncio.to_thread(file_sha256, path)
+        existing = await self._claim_existing(sha256)
+        if existing:
+            return existing
+
+        stream = self.bucket.open_upload_stream(filename, metadata=self._metadata(sha256, content_type))
+        size = 0
+        with open(path, "rb") as source:
+            while True:
+                block = await asyncio.to_thread(source.read, READ_BLOCK_BYTES)
+                if not block:
+                    break
+                await stream.write(block)
+                size += len(block)
+        await stream.close()
+        return self._describe(stream._id, sha256, size, content_type)
+
+    async def release(self, blob_id):
+        """Drops one reference; the GridFS file is deleted when nothing points at it any more."""
+        if not blob_id:
+            return
+        doc = await self.files.find_one_and_update(
+            {"_id": ObjectId(blob_id)}, {"$inc": {"metadata.refs": -1}}, return_document=ReturnDocument.AFTER
+        )
+        if not doc or doc.get("metadata", {}).get("refs", 0) > 0:
+            return
+        # Claims only match refs > 0, so nothing can re-reference this file now; the flag makes
+        # sure only one of several concurrent releases deletes it.
+        doomed = await self.files.find_one_and_update(
+            {"_id": doc["_id"], "metadata.refs": {"$lte": 0}, "metadata.deleting": {"$ne": True}},
+            {"$set": {"metadata.deleting": True}},
+        )
+        if doomed:
+            await self.bucket.delete(doc["_id"])
+
+    async def _claim_existing(self, sha256: str):
+        doc = await self.files.find_one_and_update(
+            {"metadata.sha256": sha256, "metadata.refs": {"$gt": 0}},
+            {"$inc": {"metadata.refs": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc:
+            return self._describe(doc["_id"], sha256, doc["length"], doc["metadata"].get("content_type"))
+        return None
+
+    @staticmethod
+    def _metadata(sha256: str, content_type: str) -> dict:
+        return {"sha256": sha256, "content_type": content_type, "refs": 1}
+
+    @staticmethod
+    def _describe(blob_id, sha256: str, size: int, content_type: str) -> dict:
+        """The fields a record stores to point at its blob."""
+        return {"blob_id": str(blob_id), "sha256": sha256, "size": size, "content_type": content_type}
+
+    # --- Reads ---
+    async def stat(self, blob_id):
+        return await self.files.find_one({"_id": ObjectId(blob_id)})
+
+    async def iter_range(self, blob_id, start: int, end: int):
+        """Yields bytes [start, end] (inclusive) one GridFS chunk at a time."""
+        grid_out = await self.bucket.open_download_stream(ObjectId(blob_id))
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            chunk = chunk[:remaining]
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _parse_range(header: str, size: int):
+    """
+    Single 'bytes=start-end' / 'bytes=start-' / 'bytes=-suffix' range -> (start, end), or
+    None to serve the whole file (also for malformed ranges). Raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    if not (start_text or end_text).isdigit() or (end_text and not end_text.isdigit()):
+        return None  # malformed: ignore the header, as RFC 9110 allows
+    if start_text == "":
+        length = int(end_text)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    if end_text and start > int(end_text):
+        return None  # e.g. bytes=9-2 is invalid, not unsatisfiable: RFC 9110 says ignore it
+    end = int(end_text) if end_text else size - 1
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+async def blob_response(store: BlobStore, request, blob_id, filename: str, disposition: str = "attachment"):
+    """
+    Streams a blob with ETag / Last-Modified validators, conditional GETs (304) and byte ranges (206),
+    so browsers and PDF viewers can cache, resume and seek instead of re-downloading the whole file.
+    """
+    info = await store.stat(blob_id)
+    if not info:
+        return None
+
+    size = info["length"]
+    etag = f'"{info["metadata"]["sha256"]}"'
+    uploaded = info["uploadDate"].replace(tzinfo=datetime.timezone.utc, microsecond=0)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(uploaded, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": f'{disposition}; filename="{filename}"',
+    }
+    media_type = info["metadata"].get("content_type") or "application/octet-stream"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    if not if_none_match and request.headers.get("if-modified-since"):
+        try:
+            if uploaded <= parsedate_to_datetime(request.headers["if-modified-since"]):
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = _parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if size == 0:
+        return Response(content=b"", media_type=media_type, headers=headers)
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(store.iter_range(blob_id, start, end), status_code=status_code, media_type=media_type, headers=headers)
+
+
+async def migrate_inline_files(db, store: BlobStore = None) -> int:
+    """Moves legacy base64 `file_data` payloads out of policy/document records into the blob store."""
+    store = store or BlobStore(db)
+    migrated = 0
+    for collection, default_type in (("active_policies", "application/pdf"), ("employee_documents", "application/octet-stream")):
+        async for doc in db[collection].find({"file_data": {"$exists": True}}, {"file_data": 1, "filename": 1}):
+            filename = doc.get("filename", "file")
+            content_type = "application/pdf" if filename.lower().endswith(".pdf") else default_type
+            blob = await store.put_bytes(base64.b64decode(doc["file_data"]), filename, content_type)
+            await db[collection].update_one({"_id": doc["_id"]}, {"$set": blob, "$unset": {"file_data": ""}})
+            migrated += 1
+    return migrated
+
+
+_store = None
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
+
+
+if __name__ == "__main__":
+    async def _main():
+        from app.services.database import get_db, close_mongo_connection
+        count = await migrate_inline_files(get_db())
+        print(f"✅ Moved {count} inline files into GridFS.")
+        await close_mongo_connection()
+
+    asyncio.run(_main())
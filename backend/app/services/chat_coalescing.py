@@ -0,0 +1,140 @@
+import os
+import asyncio
+import hashlib
+from dotenv import load_dotenv
+
+from app.services.telemetry import debug_log
+
+load_dotenv()
+
+# Identical chat requests (same endpoint, employee, message and attached documents) that arrive while the first
+# one is still running share its agent run instead of starting another LLM call.
+COALESCE_CHAT = os.getenv("COALESCE_CHAT", "true").lower() in ("1", "true", "yes")
+
+_END = object()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()[:16]
+
+
+def request_key(endpoint: str, employee_id: str, message: str, document_context: str = "") -> tuple:
+    """
+    Runs are only shared within one endpoint: /chat and /api/chat/stream call different agent
+    entry points (one-shot reply vs. streamed events), so they never join each other's runs.
+    """
+    return (endpoint, (employee_id or "").strip().lower(), _digest(message), _digest(document_context))
+
+
+class ChatRun:
+    """
+    One in-flight agent run and everyone listening to it.
+    Events are kept for the life of the run so late joiners replay them from the start. The run
+    belongs to no single request: it continues while anyone is listening and is cancelled when
+    the last listener goes away.
+    """
+
+    def __init__(self, key: tuple, events):
+        self.key = key
+        self.history = []
+        self.subscribers = set()
+        self.listeners = 0   # handed out by ChatCoalescer.events(), including ones not iterating yet
+        self.done = False
+        self.task = asyncio.ensure_future(self._run(events))
+
+    async def _run(self, events):
+        try:
+            async for event in events:
+                self._publish(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._publish({"type": "error", "content": str(e)})
+        finally:
+            self.done = True
+            for queue in self.subscribers:
+                queue.put_nowait(_END)
+
+    def _publish(self, event: dict):
+        self.history.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def join(self):
+        self.listeners += 1
+        return self._follow()
+
+    async def _follow(self):
+        queue = asyncio.Queue()
+        for event in self.history:
+            queue.put_nowait(event)
+        if self.done:
+            queue.put_nowait(_END)
+        self.subscribers.add(queue)
+        try:
+            while True:
+                event = await queue.get()
+                if event is _END:
+                    return
+                yield event
+        finally:
+            self.subscribers.discard(queue)
+            self.listeners -= 1
+            if self.listeners == 0 and not self.done:
+                # Every client left (see app/services/sse.py): stop the LLM calls and tools.
+                self.task.cancel()
+
+
+class ChatCoalescer:
+    def __init__(self, enabled: bool = COALESCE_CHAT):
+        self.enabled = enabled
+        self._runs = {}
+        self.stats = {"runs": 0, "joined": 0, "cancelled": 0}
+
+    def events(self, key: tuple, start):
+        """
+        Event stream for this request: a new run from `start()` (a callable returning an async
+        iterator of event dicts), or the in-flight run of an identical request.
+        """
+        if not self.enabled:
+            return start()
+
+        run = self._runs.get(key)
+        if run is None or run.done:
+            run = ChatRun(key, start())
+            self._runs[key] = run
+            self.stats["runs"] += 1
+            run.task.add_done_callback(lambda task: self._finished(key, run, task))
+        else:
+            self.stats["joined"] += 1
+            debug_log(f"🔗 Duplicate {key[0]} request from {key[1]} joined the in-flight run ({run.listeners} already listening).")
+        return run.join()
+
+    def _finished(self, key: tuple, run: ChatRun, task):
+        if self._runs.get(key) is run:
+            del self._runs[key]
+        if task.cancelled():
+            self.stats["cancelled"] += 1
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "enabled": self.enabled, "in_flight": len(self._runs)}
+
+
+async def reply_events(reply):
+    """Adapts a one-shot reply (an awaitable returning the full text) to the event stream format."""
+    yield {"type": "token", "content": await reply}
+    yield {"type": "done"}
+
+
+async def collect_reply(events) -> str:
+    """The whole reply text of an event stream; errors come back as text, like get_agent_response."""
+    parts = []
+    async for event in events:
+        if event["type"] == "token":
+            parts.append(event["content"])
+        elif event["type"] == "error":
+            return f"Error processing request: {event['content']}"
+    return "".join(parts)
+
+
+chat_coalescer = ChatCoalescer()
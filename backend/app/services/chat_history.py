@@ -0,0 +1,163 @@
+import os
+import asyncio
+import datetime
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Each chat message is its own document in `chat_turns`, indexed by (employee_id, ts).
+# Appending a turn is O(1) and loading only pulls the recent window the prompt needs.
+HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+# A migration claim older than this is assumed to belong to a process that died mid-migration.
+MIGRATION_CLAIM_MINUTES = int(os.getenv("CHAT_MIGRATION_CLAIM_MINUTES", "5"))
+
+
+async def ensure_history_indexes(db):
+    # Declared with the rest of the app's indexes; created here too for the standalone migration.
+    from app.services.indexes import INDEX_SPECS
+    await db.chat_turns.create_indexes(INDEX_SPECS["chat_turns"])
+    await db.chat_summaries.create_indexes(INDEX_SPECS["chat_summaries"])
+
+
+async def load_recent_messages(db, employee_id: str, limit: int = HISTORY_WINDOW, after=None) -> list:
+    """
+    Returns the last `limit` messages (oldest first) as {"role", "content", "ts"} dicts.
+    `after` skips messages already folded into the rolling summary.
+    """
+    query = {"employee_id": employee_id}
+    if after is not None:
+        query["ts"] = {"$gt": after}
+    cursor = db.chat_turns.find(query, {"_id": 0, "role": 1, "content": 1, "ts": 1}).sort("ts", -1).limit(limit)
+    messages = await cursor.to_list(length=limit)
+
+    # Employees who chatted before the turn store existed still have a whole-array session.
+    if not messages and after is None and await migrate_session(db, employee_id):
+        messages = await db.chat_turns.find(query, {"_id": 0, "role": 1, "content": 1, "ts": 1}).sort("ts", -1).limit(limit).to_list(length=limit)
+
+    messages.reverse()
+    return messages
+
+
+async def append_turn(db, employee_id: str, user_content: str, assistant_content: str, prompt_tokens: int = None):
+    """Stores one user/assistant exchange as two appended documents."""
+    now = datetime.datetime.utcnow()
+    user_turn = {"employee_id": employee_id, "role": "user", "content": user_content, "ts": now}
+    if prompt_tokens is not None:
+        user_turn["prompt_tokens"] = prompt_tokens
+    # Mongo dates have millisecond precision; keep the assistant reply strictly after the question.
+    await db.chat_turns.insert_many([
+        user_turn,
+        {"employee_id": employee_id, "role": "assistant", "content": assistant_content, "ts": now + datetime.timedelta(milliseconds=1)},
+    ])
+
+
+async def load_messages_between(db, employee_id: str, after, through) -> list:
+    """All messages with after < ts <= through, oldest first (used when folding into the summary)."""
+    ts_range = {"$lte": through}
+    if after is not None:
+        ts_range["$gt"] = after
+    cursor = db.chat_turns.find({"employee_id": employee_id, "ts": ts_range}, {"_id": 0, "role": 1, "content": 1, "ts": 1}).sort("ts", 1)
+    return await cursor.to_list(length=None)
+
+
+# ==========================================
+# ROLLING SUMMARY (older turns folded into one stored paragraph)
+# ==========================================
+async def load_summary(db, employee_id: str):
+    return await db.chat_summaries.find_one({"employee_id": employee_id})
+
+
+async def save_summary(db, employee_id: str, summary: str, covered_until):
+    """Stores the summary unless a newer one (covering more turns) was saved concurrently."""
+    try:
+        await db.chat_summaries.update_one(
+            {"employee_id": employee_id, "$or": [{"covered_until": {"$lt": covered_until}}, {"covered_until": {"$exists": False}}]},
+            {"$set": {"summary": summary, "covered_until": covered_until, "updated_at": datetime.datetime.utcnow()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A newer summary already exists, so the filter didn't match and the upsert collided with it.
+        pass
+
+
+# ==========================================
+# MIGRATION (chat_sessions.history -> chat_turns)
+# ==========================================
+async def migrate_session(db, employee_id: str) -> bool:
+    """Moves one legacy history array into chat_turns. Returns True if anything was migrated."""
+    session = await db.chat_sessions.find_one({"employee_id": employee_id, "history.0": {"$exists": True}})
+    if not session:
+        return False
+
+    base = session["_id"].generation_time.replace(tzinfo=None) if hasattr(session["_id"], "generation_time") else datetime.datetime(2000, 1, 1)
+    turns = [
+        {
+            # Deterministic ids: a retried migration re-inserts the same documents instead of duplicating them.
+            "_id": f"{session['_id']}:{i}",
+            "employee_id": employee_id,
+            "role": msg.get("role", "user"),
+            "content": msg.get("content", ""),
+            "ts": base + datetime.timedelta(milliseconds=i),
+            "migrated": True,
+        }
+        for i, msg in enumerate(session["history"])
+    ]
+    # Claim the session first so two concurrent requests can't migrate it at once; a stale claim is taken over.
+    now = datetime.datetime.utcnow()
+    claimed_at = now.replace(microsecond=now.microsecond // 1000 * 1000)  # as Mongo stores it, so _release_claim can match it
+    stale_before = claimed_at - datetime.timedelta(minutes=MIGRATION_CLAIM_MINUTES)
+    claimed = await db.chat_sessions.update_one(
+        {
+            "_id": session["_id"],
+            "history.0": {"$exists": True},
+            "$or": [{"migrating": {"$exists": False}}, {"migrating": {"$lt": stale_before}}],
+        },
+        {"$set": {"migrating": claimed_at}}
+    )
+    if claimed.modified_count == 0:
+        return False
+    try:
+        await db.chat_turns.insert_many(turns, ordered=False)
+    except BulkWriteError as e:
+        # Turns already stored by an earlier, interrupted attempt are fine; anything else is not.
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])) or e.details.get("writeConcernErrors"):
+            await _release_claim(db, session["_id"], claimed_at)
+            raise
+    except BaseException:
+        await _release_claim(db, session["_id"], claimed_at)
+        raise
+    # Only drop the big array once its turns are safely stored.
+    await db.chat_sessions.update_one(
+        {"_id": session["_id"]},
+        {"$unset": {"history": "", "migrating": ""}, "$set": {"migrated_to_turns": datetime.datetime.utcnow()}}
+    )
+    return True
+
+
+async def _release_claim(db, session_id, claimed_at):
+    """Lets the next request retry a failed migration instead of hiding the legacy history for good."""
+    try:
+        await db.chat_sessions.update_one({"_id": session_id, "migrating": claimed_at}, {"$unset": {"migrating": ""}})
+    except Exception as e:
+        print(f"⚠️ Could not release the migration claim on chat session {session_id}: {e}")
+
+
+async def migrate_all_sessions(db) -> int:
+    await ensure_history_indexes(db)
+    migrated = 0
+    async for session in db.chat_sessions.find({"history.0": {"$exists": True}}, {"employee_id": 1}):
+        if await migrate_session(db, session["employee_id"]):
+            migrated += 1
+            print(f"   - Migrated history for {session['employee_id']}")
+    return migrated
+
+
+if __name__ == "__main__":
+    async def _main():
+        from app.services.database import get_db, close_mongo_connection
+        count = await migrate_all_sessions(get_db())
+        print(f"✅ Migrated {count} chat sessions to chat_turns.")
+        await close_mongo_connection()
+
+    asyncio.run(_main())
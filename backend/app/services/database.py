@@ -1,46 +1,198 @@
 import os
+import time
+import threading
+import certifi
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 from dotenv import load_dotenv
 
+from app.services.telemetry import mongo_command_metrics
+
 # 1. Load the secrets from .env
-load_dotenv()
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+# 2. Connection settings (all overridable from .env)
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME", "innvoix_hr")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+# zstd/snappy need extra packages (zstandard, python-snappy); zlib always works.
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+# Atlas (mongodb+srv) needs TLS with certifi's CA bundle; a local mongod usually has no TLS.
+MONGO_TLS = os.getenv("MONGO_TLS", "auto").lower()
+
+# Checkout wait histogram buckets, in milliseconds.
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Records how long requests wait to check a connection out of the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.bucket_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+            self.checked_out = 0
+            self.connections_open = 0
+
+    def _record_wait(self, wait_ms: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if wait_ms <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+            else:
+                self.bucket_counts[-1] += 1
+
+    # --- pymongo callbacks (run on Motor's worker threads) ---
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        duration = getattr(event, "duration", None)  # pymongo >= 4.7 reports it directly
+        if duration is not None:
+            wait_ms = duration * 1000
+        else:
+            started = getattr(self._local, "started", None)
+            wait_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        self._record_wait(wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open = max(0, self.connections_open - 1)
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checked_out_now": self.checked_out,
+                "connections_open": self.connections_open,
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+                "wait_ms_buckets": {
+                    **{f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS_MS, self.bucket_counts)},
+                    "gt_max": self.bucket_counts[-1],
+                },
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+            }
+
+
+pool_metrics = PoolMetrics()
 
-# 2. Fetch the URI
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("DB_NAME", "hr_agent_db")
 
 class Database:
     client: AsyncIOMotorClient = None
 
-db = Database()
 
-async def get_database():
+_state = Database()
+
+
+def _use_tls() -> bool:
+    if MONGO_TLS in ("true", "1", "yes"):
+        return True
+    if MONGO_TLS in ("false", "0", "no"):
+        return False
+    return MONGO_URI.startswith("mongodb+srv://") or "tls=true" in MONGO_URI or "ssl=true" in MONGO_URI
+
+
+def get_client() -> AsyncIOMotorClient:
+    """
+    The one MongoDB client for the whole process (endpoints, agent tools, background jobs).
+    Normally created by the FastAPI lifespan hook; created on first use for scripts/CLIs.
+    """
+    if _state.client is None:
+        options = dict(
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            event_listeners=[pool_metrics, mongo_command_metrics],
+        )
+        if MONGO_COMPRESSORS:
+            options["compressors"] = MONGO_COMPRESSORS
+        if _use_tls():
+            options["tlsCAFile"] = certifi.where()
+        _state.client = AsyncIOMotorClient(MONGO_URI, **options)
+    return _state.client
+
+
+def get_db():
+    return get_client()[DB_NAME]
+
+
+class _DatabaseProxy:
     """
-    Initializes the MongoDB connection. 
-    This is called once when the server starts.
+    Module-level handle (`from app.services.database import db`) that always resolves to the
+    shared client's database, so importing modules never create clients of their own.
     """
-    if db.client is None:
-        if not MONGO_URI:
-            print("❌ ERROR: MONGO_URI is missing in .env file.")
-            return None
-        
-        print("🔌 Connecting to MongoDB Atlas...")
-        try:
-            # Create the async client
-            db.client = AsyncIOMotorClient(MONGO_URI)
-            
-            # Ping the server to verify connection
-            await db.client.admin.command('ping')
-            print("✅ Successfully connected to MongoDB Atlas!")
-            
-        except Exception as e:
-            print(f"❌ Connection Failed: {e}")
-            raise e
-
-    return db.client[DB_NAME]
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+db = _DatabaseProxy()
+
+
+async def connect_to_mongo():
+    """Creates the shared client and verifies the connection. Called once when the server starts."""
+    print("🔌 Connecting to MongoDB...")
+    client = get_client()
+    try:
+        await client.admin.command('ping')
+        print("✅ Database Connection Successful")
+    except Exception as e:
+        # Keep serving: endpoints report DB errors individually, and the pool reconnects on its own.
+        print(f"❌ Critical DB Error: {e}")
+    return client
+
 
 async def close_mongo_connection():
     """Closes the connection when server stops."""
-    if db.client:
-        db.client.close()
-        print("🔌 MongoDB connection closed.")
\ No newline at end of file
+    if _state.client:
+        _state.client.close()
+        _state.client = None
+        print("🔌 MongoDB connection closed.")
@@ -0,0 +1,329 @@
+import os
+import ssl
+import queue
+import time
+import asyncio
+import datetime
+import smtplib
+from email.message import EmailMessage
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+from app.services.telemetry import observe_stage
+
+load_dotenv()
+
+# --- SMTP settings (defaults match the Gmail setup in the README) ---
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+# "ssl" (implicit TLS, port 465), "starttls" (port 587) or "none" (local SMTP stand-in)
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "ssl").lower()
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "20"))
+SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+
+# --- Outbox settings ---
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+# Pooled connections unused for longer than this are closed instead of reused (servers drop them).
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+# A message stuck in "sending" this long (worker crashed mid-batch) goes back on the queue.
+EMAIL_STALE_SECONDS = float(os.getenv("EMAIL_STALE_SECONDS", "300"))
+
+
+def email_enabled() -> bool:
+    return bool(SENDER_EMAIL) and (bool(SENDER_PASSWORD) or SMTP_SECURITY == "none")
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+class SMTPConnectionPool:
+    """
+    Reusable, logged-in SMTP connections for the worker threads.
+    Connections are checked with NOOP before reuse and replaced when the server has dropped them.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self.connects = 0
+
+    def _connect(self):
+        if SMTP_SECURITY == "ssl":
+            conn = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT, context=ssl.create_default_context())
+        else:
+            conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_SECURITY == "starttls":
+                conn.starttls(context=ssl.create_default_context())
+        if SENDER_PASSWORD:
+            conn.login(SENDER_EMAIL, SENDER_PASSWORD)
+        self.connects += 1
+        return conn
+
+    def acquire(self):
+        while True:
+            try:
+                conn, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - released_at < SMTP_IDLE_SECONDS:
+                try:
+                    if conn.noop()[0] == 250:
+                        return conn
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self.discard(conn)
+
+    def release(self, conn):
+        if self._idle.qsize() >= self.size:
+            self.discard(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+
+    def discard(self, conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(conn)
+
+
+def _build_message(doc: dict) -> EmailMessage:
+    msg = EmailMessage()
+    msg.set_content(doc["body"])
+    msg["Subject"] = doc["subject"]
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = doc["to"]
+    return msg
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Rejected recipients/senders and 5xx replies will fail the same way on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class EmailOutbox:
+    """
+    Mongo-backed outbound email queue (`email_outbox` collection).
+    Tools only enqueue. Background workers claim batches of due messages, send each batch over one
+    pooled SMTP connection in a worker thread, and retry failures with exponential backoff.
+    Every message keeps its delivery status (queued / sending / sent / failed / skipped).
+    """
+
+    def __init__(self, db, workers: int = EMAIL_WORKERS, batch_size: int = EMAIL_BATCH_SIZE):
+        self.db = db
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = SMTPConnectionPool(workers)
+        self._tasks = []
+        self._wakeup = None
+        self._next_recovery = 0.0
+        self.counts = {"sent": 0, "retried": 0, "failed": 0, "recovered": 0}
+
+    @property
+    def messages(self):
+        return self.db.email_outbox
+
+    # --- Producer side ---
+    async def enqueue(self, to_email: str, subject: str, body: str, kind: str = "standard"):
+        ids = await self.enqueue_many([{"to": to_email, "subject": subject, "body": body}], kind=kind)
+        return ids[0] if ids else None
+
+    async def enqueue_many(self, messages: list, kind: str = "standard") -> list:
+        """One insert for the whole list (e.g. a department-wide policy notice)."""
+        messages = [m for m in messages if m.get("to")]
+        if not messages:
+            return []
+        enabled = email_enabled()
+        if not enabled:
+            print("⚠️ Email credentials not set. Recording emails as skipped.")
+        now = _now()
+        docs = [{
+            "to": m["to"],
+            "subject": m["subject"],
+            "body": m["body"],
+            "kind": kind,
+            "status": "queued" if enabled else "skipped",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "last_error": None,
+            "created_at": now,
+            "sent_at": None,
+        } for m in messages]
+        result = await self.messages.insert_many(docs)
+        if enabled and self._wakeup is not None:
+            self._wakeup.set()
+        return result.inserted_ids
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        await self._requeue_stale()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.pool.close_all)
+
+    async def _requeue_stale(self):
+        """
+        Puts messages stuck in "sending" (a crashed worker, or a batch whose result could not be
+        recorded) back on the queue. Runs at startup and then every EMAIL_STALE_SECONDS.
+        """
+        self._next_recovery = time.monotonic() + EMAIL_STALE_SECONDS
+        try:
+            stale_before = _now() - datetime.timedelta(seconds=EMAIL_STALE_SECONDS)
+            result = await self.messages.update_many(
+                {"status": "sending", "locked_at": {"$lt": stale_before}},
+                {"$set": {"status": "queued", "next_attempt_at": _now()}},
+            )
+            self.counts["recovered"] += result.modified_count
+        except Exception as e:
+            print(f"⚠️ Could not recover interrupted emails: {e}")
+
+    # --- Workers ---
+    async def _worker(self, worker_num: int):
+        while True:
+            try:
+                if time.monotonic() >= self._next_recovery:
+                    await self._requeue_stale()
+                batch = await self._claim_batch()
+                if batch:
+                    results = await asyncio.to_thread(self._send_batch, batch)
+                    await self._record(batch, results)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Email worker {worker_num} error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=EMAIL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim_batch(self) -> list:
+        batch = []
+        while len(batch) < self.batch_size:
+            doc = await self.messages.find_one_and_update(
+                {"status": "queued", "next_attempt_at": {"$lte": _now()}},
+                {"$set": {"status": "sending", "locked_at": _now()}, "$inc": {"attempts": 1}},
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if doc is None:
+                break
+            batch.append(doc)
+        return batch
+
+    def _send_batch(self, batch: list) -> list:
+        """Runs in a worker thread. Returns one exception (or None) per message."""
+        results = []
+        conn = None
+        for doc in batch:
+            error = None
+            for _ in range(2):  # one reconnect if the pooled connection died mid-batch
+                started = time.perf_counter()
+                try:
+                    if conn is None:
+                        conn = self.pool.acquire()
+                    conn.send_message(_build_message(doc))
+                    observe_stage("smtp_send", time.perf_counter() - started)
+                    error = None
+                    break
+                except smtplib.SMTPServerDisconnected as e:
+                    error, conn = e, None
+                except Exception as e:
+                    error = e
+                    # A refused message leaves the session usable; anything else may not have.
+                    if not isinstance(e, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                        if conn is not None:
+                            self.pool.discard(conn)
+                        conn = None
+                    break
+            results.append(error)
+        if conn is not None:
+            self.pool.release(conn)
+        return results
+
+    async def _record(self, batch: list, results: list):
+        for doc, error in zip(batch, results):
+            # One failed write must not strand the rest of the batch in "sending";
+            # a message left there is re-queued by _requeue_stale.
+            try:
+                await self._record_one(doc, error)
+            except Exception as e:
+                print(f"⚠️ Could not record delivery status of email {doc['_id']}: {e}")
+
+    async def _record_one(self, doc: dict, error):
+        if error is None:
+            await self.messages.update_one(
+                {"_id": doc["_id"]}, {"$set": {"status": "sent", "sent_at": _now(), "last_error": None}}
+            )
+            self.counts["sent"] += 1
+            return
+
+        if _is_permanent(error) or doc["attempts"] >= EMAIL_MAX_ATTEMPTS:
+            await self.messages.update_one({"_id": doc["_id"]}, {"$set": {"status": "failed", "last_error": str(error)}})
+            self.counts["failed"] += 1
+            print(f"❌ Failed to send email to {doc['to']}: {error}")
+        else:
+            delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * (2 ** (doc["attempts"] - 1)))
+            await self.messages.update_one({"_id": doc["_id"]}, {"$set": {
+                "status": "queued",
+                "last_error": str(error),
+                "next_attempt_at": _now() + datetime.timedelta(seconds=delay),
+            }})
+            self.counts["retried"] += 1
+
+    # --- Status ---
+    async def get(self, message_id):
+        return await self.messages.find_one({"_id": message_id}, {"body": 0})
+
+    async def stats(self) -> dict:
+        counts = await self.messages.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]).to_list(length=None)
+        return {
+            "enabled": email_enabled(),
+            "smtp_host": SMTP_HOST,
+            "by_status": {row["_id"]: row["count"] for row in counts},
+            "smtp_connections_opened": self.pool.connects,
+            "since_start": dict(self.counts),
+        }
+
+
+_outbox = None
+
+
+def get_outbox() -> EmailOutbox:
+    global _outbox
+    if _outbox is None:
+        from app.services.database import db
+        _outbox = EmailOutbox(db)
+    return _outbox
+
+
+async def enqueue_email(to_email: str, subject: str, body: str, kind: str = "standard"):
+    return await get_outbox().enqueue(to_email, subject, body, kind=kind)
@@ -0,0 +1,228 @@
+import os
+import json
+import asyncio
+import datetime
+import threading
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GOOGLE_CALENDAR_ID = os.getenv("GOOGLE_CALENDAR_ID")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# "google" (live Google Calendar) or "file" (a JSON list of events for tests and offline dev,
+# by default the sample calendar shipped in data/)
+HOLIDAY_CALENDAR_SOURCE = os.getenv("HOLIDAY_CALENDAR_SOURCE", "google").lower()
+HOLIDAY_CALENDAR_FILE = os.getenv("HOLIDAY_CALENDAR_FILE", os.path.join(BACKEND_DIR, "data", "holiday_calendar.sample.json"))
+# Holidays change rarely: a cached month is fresh for this long, and served stale after that
+# whenever the calendar API is slow or down.
+HOLIDAY_CACHE_TTL = float(os.getenv("HOLIDAY_CACHE_TTL_SECONDS", "21600"))
+HOLIDAY_FETCH_TIMEOUT = float(os.getenv("HOLIDAY_FETCH_TIMEOUT_SECONDS", "5"))
+
+SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+SERVICE_ACCOUNT_FILE = os.path.join(BACKEND_DIR, 'data', 'google_credentials.json')
+
+
+def _event(summary: str, start: str) -> dict:
+    return {"summary": summary, "start": start}
+
+
+def _month_of(start: str):
+    return int(start[:4]), int(start[5:7])
+
+
+class GoogleCalendarSource:
+    """Google Calendar API. Credentials are loaded once; each worker thread builds its own client."""
+
+    name = "google"
+
+    def __init__(self):
+        self._creds = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _credentials(self):
+        with self._lock:
+            if self._creds is None:
+                from google.oauth2 import service_account
+
+                env_creds = os.getenv("GOOGLE_CREDENTIALS_JSON")
+                if env_creds:
+                    self._creds = service_account.Credentials.from_service_account_info(json.loads(env_creds), scopes=SCOPES)
+                else:
+                    self._creds = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+            return self._creds
+
+    def _service(self):
+        # httplib2 clients are not thread-safe, so one client per thread.
+        service = getattr(self._local, "service", None)
+        if service is None:
+            from googleapiclient.discovery import build
+            service = build('calendar', 'v3', credentials=self._credentials(), cache_discovery=False)
+            self._local.service = service
+        return service
+
+    def fetch(self, calendar_id: str, time_min: datetime.datetime, time_max: datetime.datetime) -> list:
+        """Blocking; run it in a thread."""
+        events, page_token = [], None
+        while True:
+            result = self._service().events().list(
+                calendarId=calendar_id,
+                timeMin=time_min.isoformat() + 'Z',
+                timeMax=time_max.isoformat() + 'Z',
+                singleEvents=True,
+                orderBy='startTime',
+                pageToken=page_token,
+            ).execute()
+            for item in result.get('items', []):
+                start = item['start'].get('dateTime', item['start'].get('date'))
+                events.append(_event(item.get('summary', 'Untitled'), start))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return events
+
+
+class FileCalendarSource:
+    """
+    Events from a JSON file, either Google's shape ({"summary", "start": {"date": ...}})
+    or the short form ({"summary", "date"}). Stands in for Google Calendar in tests.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str = HOLIDAY_CALENDAR_FILE):
+        self.path = path
+
+    def fetch(self, calendar_id: str, time_min: datetime.datetime, time_max: datetime.datetime) -> list:
+        with open(self.path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        events = []
+        for item in items:
+            start = item.get("date") or item.get("start", {}).get("dateTime") or item.get("start", {}).get("date")
+            if start and time_min.isoformat()[:10] <= start[:10] < time_max.isoformat()[:10]:
+                events.append(_event(item.get("summary", "Untitled"), start))
+        return sorted(events, key=lambda e: e["start"])
+
+
+class HolidayProvider:
+    """
+    Calendar events per (calendar, month), cached in memory and in Mongo (`holiday_cache`).
+    A miss fetches the whole year in one API call, off the event loop. When a refresh is slow
+    or fails, the last known events are served instead of an error.
+    """
+
+    def __init__(self, db, source=None, calendar_id: str = GOOGLE_CALENDAR_ID, ttl_seconds: float = HOLIDAY_CACHE_TTL):
+        self.db = db
+        self.source = source or (FileCalendarSource() if HOLIDAY_CALENDAR_SOURCE == "file" else GoogleCalendarSource())
+        self.calendar_id = calendar_id or "default"
+        self.ttl_seconds = ttl_seconds
+        self._months = {}     # (year, month) -> {"events", "fetched_at"}
+        self._inflight = {}   # year -> Future of the running refresh
+        self.stats = {"memory_hits": 0, "mongo_hits": 0, "remote_fetches": 0, "stale_served": 0, "fetch_errors": 0}
+
+    def _key(self, year: int, month: int) -> str:
+        return f"{self.source.name}:{self.calendar_id}:{year}-{month:02d}"
+
+    def _fresh(self, entry) -> bool:
+        age = (datetime.datetime.utcnow() - entry["fetched_at"]).total_seconds()
+        return age < self.ttl_seconds
+
+    async def get_month(self, year: int, month: int):
+        """Returns (events, info) where info says where the events came from and how old they are."""
+        entry = self._months.get((year, month))
+        source = "memory"
+        if entry is None:
+            entry = await self._load_cached(year, month)
+            source = "mongo"
+        if entry is not None and self._fresh(entry):
+            self.stats["memory_hits" if source == "memory" else "mongo_hits"] += 1
+            return entry["events"], {"source": source, "fetched_at": entry["fetched_at"], "stale": False}
+
+        try:
+            # shield: a timeout here must not cancel the shared refresh; it finishes in the background.
+            await asyncio.wait_for(asyncio.shield(self.refresh_year(year)), timeout=HOLIDAY_FETCH_TIMEOUT)
+            entry = self._months[(year, month)]
+            return entry["events"], {"source": "remote", "fetched_at": entry["fetched_at"], "stale": False}
+        except Exception as e:
+            if entry is None:
+                raise
+            self.stats["stale_served"] += 1
+            print(f"⚠️ Calendar refresh failed ({type(e).__name__}); serving cached holidays from {entry['fetched_at']:%Y-%m-%d %H:%M}.")
+            return entry["events"], {"source": source, "fetched_at": entry["fetched_at"], "stale": True}
+
+    def refresh_year(self, year: int) -> asyncio.Future:
+        """Starts (or joins) the one refresh of `year` that is allowed to run at a time."""
+        future = self._inflight.get(year)
+        if future is None:
+            future = asyncio.ensure_future(self._refresh_year(year))
+            self._inflight[year] = future
+            future.add_done_callback(lambda f: self._inflight.pop(year, None))
+            # Nobody may be waiting (prefetch, or all callers timed out): don't log "never retrieved".
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    async def _refresh_year(self, year: int):
+        time_min = datetime.datetime(year, 1, 1)
+        time_max = datetime.datetime(year + 1, 1, 1)
+        try:
+            events = await asyncio.to_thread(self.source.fetch, self.calendar_id, time_min, time_max)
+        except Exception:
+            self.stats["fetch_errors"] += 1
+            raise
+        self.stats["remote_fetches"] += 1
+
+        by_month = {month: [] for month in range(1, 13)}
+        for event in events:
+            event_year, event_month = _month_of(event["start"])
+            if event_year == year:
+                by_month[event_month].append(event)
+
+        fetched_at = datetime.datetime.utcnow()
+        for month, month_events in by_month.items():
+            self._months[(year, month)] = {"events": month_events, "fetched_at": fetched_at}
+        try:
+            await self.db.holiday_cache.bulk_write([
+                UpdateOne(
+                    {"_id": self._key(year, month)},
+                    {"$set": {"events": month_events, "fetched_at": fetched_at}},
+                    upsert=True,
+                )
+                for month, month_events in by_month.items()
+            ], ordered=False)
+        except Exception as e:
+            print(f"⚠️ Could not persist holiday cache: {e}")
+
+    async def _load_cached(self, year: int, month: int):
+        try:
+            doc = await self.db.holiday_cache.find_one({"_id": self._key(year, month)})
+        except Exception:
+            return None
+        if doc is None:
+            return None
+        entry = {"events": doc["events"], "fetched_at": doc["fetched_at"]}
+        self._months[(year, month)] = entry
+        return entry
+
+    async def prefetch(self, years=None):
+        """Warms the current year (and next year from October on) after startup."""
+        today = datetime.date.today()
+        years = years or ([today.year, today.year + 1] if today.month >= 10 else [today.year])
+        for year in years:
+            try:
+                await self.refresh_year(year)
+            except Exception as e:
+                print(f"⚠️ Holiday prefetch for {year} failed (will retry on demand): {e}")
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "source": self.source.name, "cached_months": len(self._months), "ttl_seconds": self.ttl_seconds}
+
+
+_provider = None
+
+
+def get_holiday_provider() -> HolidayProvider:
+    global _provider
+    if _provider is None:
+        from app.services.database import db
+        _provider = HolidayProvider(db)
+    return _provider
@@ -0,0 +1,135 @@
+import os
+import asyncio
+import contextvars
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+
+from app.services.cache import TTLCache
+
+load_dotenv()
+
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "60"))
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "4096"))
+
+# Auth ID (Mongo _id string or emp_xxx) -> resolved identity dict
+_identity_cache = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL, name="identities")
+# Lower-cased employee_id -> `employees` document
+_employee_cache = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL, name="employee_records")
+
+# Per chat turn: lower-cased employee_id -> asyncio Task resolving to the `employees` document.
+# Tools that run during the turn await the same lookup instead of hitting Mongo again.
+_request_memo = contextvars.ContextVar("identity_request_memo", default=None)
+
+
+def begin_request_scope():
+    """
+    Starts a fresh memo for one chat turn. Each request runs in its own task (and context copy),
+    so the memo never leaks into other requests; it is simply dropped when the task ends.
+    """
+    _request_memo.set({})
+
+
+def _build_identity(employee_id: str, user_record) -> dict:
+    if user_record:
+        user_department = user_record.get("department", "Employee")
+        dep_lower = user_department.lower()
+        is_hr_admin = "hr" in dep_lower or "human resources" in dep_lower
+        return {
+            "found": True,
+            "user_name": user_record.get("name", "Unknown"),
+            "department": user_department,
+            "onboarding_status": user_record.get("onboarding_status", "Completed"),
+            # CRITICAL: their real 'emp_xxx' ID is what the tools need
+            "real_emp_id": user_record.get("employee_id", employee_id),
+            "is_hr_admin": is_hr_admin,
+            "role_title": "HR Administrator" if is_hr_admin else f"{user_department} Employee",
+        }
+    return {
+        "found": False,
+        "user_name": "Guest",
+        "department": "",
+        "onboarding_status": "Unknown",
+        "real_emp_id": employee_id,
+        "is_hr_admin": False,
+        "role_title": "Unverified User",
+    }
+
+
+async def resolve_identity(db, employee_id: str) -> dict:
+    """
+    Who is chatting and what they may do. Served from a TTL cache. The frontend sends the `users`
+    ObjectId, which only `users` can match; an emp_xxx ID is looked up in `users` and `employees`
+    concurrently, so a miss costs one round trip instead of up to three.
+    """
+    identity = _identity_cache.get(employee_id)
+    if identity is None:
+        try:
+            user_record = await db.users.find_one({"_id": ObjectId(employee_id)})
+        except InvalidId:
+            user_record, employee_record = await asyncio.gather(
+                db.users.find_one({"employee_id": employee_id.lower()}),
+                get_employee_record(db, employee_id),
+            )
+            user_record = user_record or employee_record
+        identity = _build_identity(employee_id, user_record)
+        _identity_cache.set(employee_id, identity)
+
+    # The tools look the employee up by the emp_xxx ID: start that lookup now, in the turn's memo.
+    if identity["found"]:
+        _prefetch_employee_record(db, identity["real_emp_id"])
+    return identity
+
+
+async def get_employee_record(db, employee_id: str):
+    """`employees` document by exact employee_id, via the request memo and the TTL cache."""
+    key = employee_id.lower()
+    memo = _request_memo.get()
+    if memo is not None and key in memo:
+        return await memo[key]
+
+    record = _employee_cache.get(key)
+    if record is not None:
+        return record
+
+    task = asyncio.ensure_future(_fetch_employee_record(db, key))
+    if memo is not None:
+        memo[key] = task
+    return await task
+
+
+async def _fetch_employee_record(db, key: str):
+    record = await db.employees.find_one({"employee_id": key})
+    if record is not None:
+        _employee_cache.set(key, record)
+    return record
+
+
+def _prefetch_employee_record(db, employee_id: str):
+    memo = _request_memo.get()
+    key = employee_id.lower()
+    if memo is None or key in memo or _employee_cache.get(key) is not None:
+        return
+    task = asyncio.ensure_future(_fetch_employee_record(db, key))
+    # Turns that call no tool never await it; retrieve a failure so it isn't logged as unhandled.
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    memo[key] = task
+
+
+def invalidate_identity(employee_id: str = None):
+    """Drops cached identity/employee data after a write (onboarding, offboarding, invites)."""
+    key = employee_id.lower() if employee_id else None
+    if key:
+        _employee_cache.pop(key)
+        memo = _request_memo.get()
+        if memo is not None:
+            memo.pop(key, None)
+    _identity_cache.discard_where(
+        lambda auth_id, identity: (key is not None and (auth_id.lower() == key or identity["real_emp_id"].lower() == key))
+        # Unknown users were cached as Guests; an invite may have just created them.
+        or not identity["found"]
+    )
+
+
+def identity_cache_stats() -> dict:
+    return {"identities": _identity_cache.stats(), "employee_records": _employee_cache.stats()}
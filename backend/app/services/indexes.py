@@ -0,0 +1,179 @@
+import os
+import sys
+import asyncio
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Run explain() on every query shape at startup and warn about collection scans.
+CHECK_QUERY_PLANS = os.getenv("MONGO_CHECK_QUERY_PLANS", "false").lower() in ("1", "true", "yes")
+
+# Every index the app relies on. Declared once here and created idempotently at startup
+# (create_indexes is a no-op for indexes that already exist with the same spec).
+INDEX_SPECS = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("employee_id", ASCENDING)], name="employee_id"),
+        IndexModel([("role", ASCENDING), ("_id", DESCENDING)], name="role_id"),
+    ],
+    "employees": [
+        IndexModel([("employee_id", ASCENDING)], name="employee_id"),
+        # Name search (see app/services/name_search.py)
+        IndexModel([("name_norm", ASCENDING)], name="name_norm"),
+        IndexModel([("name_tokens", ASCENDING)], name="name_tokens"),
+        IndexModel([("name_trigrams", ASCENDING)], name="name_trigrams"),
+        IndexModel([("department_norm", ASCENDING)], name="department_norm"),
+    ],
+    "chat_sessions": [
+        IndexModel([("employee_id", ASCENDING)], name="employee_id"),
+    ],
+    "chat_turns": [
+        IndexModel([("employee_id", ASCENDING), ("ts", DESCENDING)], name="employee_ts"),
+    ],
+    "chat_summaries": [
+        IndexModel([("employee_id", ASCENDING)], unique=True, name="employee_unique"),
+    ],
+    "leave_requests": [
+        IndexModel([("req_id", ASCENDING)], name="req_id"),
+        IndexModel([("status", ASCENDING), ("_id", DESCENDING)], name="status_id"),
+    ],
+    "pending_approvals": [
+        IndexModel([("trx_id", ASCENDING)], name="trx_id"),
+        IndexModel([("status", ASCENDING), ("_id", DESCENDING)], name="status_id"),
+    ],
+    "policy_drafts": [
+        IndexModel([("target_audience", ASCENDING), ("_id", DESCENDING)], name="audience_id"),
+    ],
+    "hr_tickets": [
+        IndexModel([("ticket_id", ASCENDING)], name="ticket_id"),
+    ],
+    "tickets": [
+        # Keyset pages of the dashboard list: (date, _id), optionally per status.
+        IndexModel([("date", DESCENDING), ("_id", DESCENDING)], name="date_id"),
+        IndexModel([("status", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)], name="status_date_id"),
+    ],
+    "holidays": [
+        IndexModel([("date", ASCENDING)], name="date"),
+    ],
+    "employee_documents": [
+        IndexModel([("employee_id", ASCENDING)], name="employee_id"),
+    ],
+    "blobs.files": [
+        IndexModel([("metadata.sha256", ASCENDING)], name="sha256"),
+    ],
+    "email_outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_due"),
+    ],
+    "ingest_jobs": [
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+}
+
+# The filter/sort shapes the code actually issues, checked by explain_query_shapes().
+# Values are placeholders: only the shape matters to the planner.
+QUERY_SHAPES = [
+    ("login", "users", {"email": "a@b.c", "password": "x"}, None),
+    ("user_by_employee_id", "users", {"employee_id": "emp_001"}, None),
+    ("list_employee_users", "users", {"role": "employee"}, {"_id": -1}),
+    ("employee_by_id", "employees", {"employee_id": "emp_001"}, None),
+    ("employee_name_prefix", "employees", {"$or": [{"name_norm": {"$regex": "^jane d"}}, {"name_tokens": {"$regex": "^jane"}}]}, None),
+    ("employee_name_trigrams", "employees", {"name_trigrams": {"$in": ["  j", " ja", "jan"]}}, None),
+    ("employees_by_department", "employees", {"department_norm": {"$regex": "^engineering"}}, None),
+    ("legacy_chat_session", "chat_sessions", {"employee_id": "emp_001", "history.0": {"$exists": True}}, None),
+    ("recent_chat_turns", "chat_turns", {"employee_id": "emp_001"}, {"ts": -1}),
+    ("chat_summary", "chat_summaries", {"employee_id": "emp_001"}, None),
+    ("leave_by_req_id", "leave_requests", {"req_id": "REQ-1"}, None),
+    ("approval_by_trx_id", "pending_approvals", {"trx_id": "TRX-1"}, None),
+    ("hr_ticket_by_id", "hr_tickets", {"ticket_id": "TKT-1"}, None),
+    ("tickets_by_date", "tickets", {}, {"date": -1, "_id": -1}),
+    ("tickets_by_status", "tickets", {"status": "Pending"}, {"date": -1, "_id": -1}),
+    ("leaves_by_status", "leave_requests", {"status": "Pending HR Approval"}, {"_id": -1}),
+    ("approvals_by_status", "pending_approvals", {"status": "AWAITING_HUMAN_APPROVAL"}, {"_id": -1}),
+    ("holidays_by_date", "holidays", {}, {"date": 1}),
+    ("blob_by_sha256", "blobs.files", {"metadata.sha256": "0" * 64}, None),
+    ("due_emails", "email_outbox", {"status": "queued", "next_attempt_at": {"$lte": 0}}, {"next_attempt_at": 1}),
+    ("pending_ingest_jobs", "ingest_jobs", {"status": {"$in": ["queued", "running"]}}, None),
+]
+
+
+async def ensure_indexes(db) -> dict:
+    """Creates every declared index. A failure on one collection is reported, not fatal."""
+    created, failed = {}, {}
+    for collection, models in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # Usually an existing index with the same keys but different options/name.
+            failed[collection] = str(e)
+            print(f"⚠️ Index bootstrap failed for '{collection}': {e}")
+    return {"created": created, "failed": failed}
+
+
+def _plan_stages(plan) -> list:
+    """Flattens an explain() plan tree into its list of stage names."""
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        stages += _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def explain_query_shapes(db, shapes=QUERY_SHAPES) -> list:
+    """
+    Runs explain (queryPlanner verbosity, nothing is executed) for each query shape and reports
+    the winning plan's stages. Any COLLSCAN means a hot query is missing its index.
+    """
+    report = []
+    for name, collection, query_filter, sort in shapes:
+        find = {"find": collection, "filter": query_filter}
+        if sort:
+            find["sort"] = sort
+        try:
+            explained = await db.command({"explain": find, "verbosity": "queryPlanner"})
+        except OperationFailure as e:
+            report.append({"name": name, "collection": collection, "stages": [], "collscan": False, "error": str(e)})
+            continue
+        stages = _plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({
+            "name": name,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            "error": None,
+        })
+    return report
+
+
+async def check_query_plans(db) -> list:
+    """Logs every query shape that would scan its whole collection. Returns the offending entries."""
+    offenders = [entry for entry in await explain_query_shapes(db) if entry["collscan"]]
+    for entry in offenders:
+        print(f"🐢 Query '{entry['name']}' on '{entry['collection']}' does a collection scan: {' -> '.join(entry['stages'])}")
+    return offenders
+
+
+if __name__ == "__main__":
+    # python -m app.services.indexes [--check]
+    # Creates the indexes; with --check, also explains every query shape and exits 1 on any COLLSCAN
+    # (meant for CI against a local mongod).
+    async def _main():
+        from app.services.database import get_db, close_mongo_connection
+        db = get_db()
+        result = await ensure_indexes(db)
+        print(f"✅ Indexes ensured on {len(result['created'])} collections ({len(result['failed'])} failed).")
+        offenders = []
+        if "--check" in sys.argv:
+            for entry in await explain_query_shapes(db):
+                status = "COLLSCAN" if entry["collscan"] else ("ERROR" if entry["error"] else "ok")
+                print(f"   {status:8} {entry['name']:24} {' -> '.join(entry['stages']) or entry['error']}")
+                if entry["collscan"]:
+                    offenders.append(entry)
+        await close_mongo_connection()
+        return 1 if offenders or result["failed"] else 0
+
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,268 @@
+import os
+import uuid
+import asyncio
+import datetime
+from dotenv import load_dotenv
+
+from app.services.blob_store import get_blob_store
+from app.services.ingestion import DATA_FOLDER, load_manifest, plan_file, record_file
+from app.services.policy_retriever import get_policy_retriever
+from app.services.vector_store import delete_source, upsert_embeddings
+
+load_dotenv()
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "50"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+# Uploads wait here, one file per job, until their job owns the policy's path in DATA_FOLDER.
+STAGING_DIR = os.getenv("INGEST_STAGING_DIR", "data/ingest_staging")
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+# langchain_community is slow to import; it is only loaded (in a worker thread) when a job runs.
+def _load_pages(file_path: str):
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(file_path).load()
+
+
+def _split_pages(pages):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100).split_documents(pages)
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def staging_path(filename: str) -> str:
+    """A fresh path for one upload, so two uploads of the same filename never share a file."""
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    return os.path.join(STAGING_DIR, f"{uuid.uuid4().hex}-{os.path.basename(filename)}")
+
+
+def _remove(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+class IngestJobRunner:
+    """
+    In-process policy ingestion queue.
+    Uploads are recorded in the Mongo `ingest_jobs` collection and processed by a bounded pool
+    of asyncio workers; all parsing, hashing and file IO runs in threads so the event loop stays free.
+    Jobs for the same policy file run one at a time (plan -> upsert -> delete -> record), so two
+    uploads of one filename can never plan from the same manifest entry.
+    """
+
+    def __init__(self, db, workers: int = INGEST_WORKERS, queue_max: int = INGEST_QUEUE_MAX):
+        self.db = db
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_max)
+        self._tasks = []
+        self._source_locks = {}
+
+    def _source_lock(self, source: str) -> asyncio.Lock:
+        lock = self._source_locks.get(source)
+        if lock is None:
+            lock = self._source_locks[source] = asyncio.Lock()
+        return lock
+
+    @property
+    def jobs(self):
+        return self.db.ingest_jobs
+
+    # --- Lifecycle ---
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+        # Jobs interrupted by a restart go back on the queue; the ones that no longer fit are failed
+        # rather than left "queued" forever.
+        try:
+            stale = await self.jobs.find({"status": {"$in": ["queued", "running"]}}).sort("created_at", 1).to_list(length=None)
+        except Exception as e:
+            print(f"⚠️ Could not recover pending ingestion jobs: {e}")
+            return
+        for job in stale:
+            # A running job may already have moved its staged upload to the policy path.
+            staged = os.path.exists(job["file_path"]) or (job["status"] == "running" and os.path.exists(job.get("source", "")))
+            if staged and not self.queue.full():
+                await self.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "queued", "updated_at": _now()}})
+                self.queue.put_nowait(job["_id"])
+            else:
+                await self._fail(job["_id"], "Upload was interrupted by a server restart. Please upload again.")
+                if job["file_path"] != job.get("source", job["file_path"]):
+                    await asyncio.to_thread(_remove, job["file_path"])
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # --- Public API ---
+    async def submit(self, filename: str, file_path: str) -> dict:
+        """Queues a staged upload (see staging_path); the job moves it into DATA_FOLDER once it is live."""
+        if self.queue.full():
+            raise IngestQueueFull("Too many policy uploads are already queued. Please try again shortly.")
+
+        job = {
+            "_id": uuid.uuid4().hex,
+            "filename": filename,
+            "file_path": file_path,
+            "source": os.path.join(DATA_FOLDER, os.path.basename(filename)),
+            "status": "queued",
+            "progress": {"pages": 0, "chunks_total": 0, "chunks_embedded": 0, "chunks_deleted": 0},
+            "error": None,
+            "policy_id": None,
+            "created_at": _now(),
+            "updated_at": _now(),
+        }
+        await self.jobs.insert_one(job)
+        try:
+            self.queue.put_nowait(job["_id"])
+        except asyncio.QueueFull:
+            # Another upload took the last slot while the job was being inserted.
+            await self.jobs.delete_one({"_id": job["_id"]})
+            raise IngestQueueFull("Too many policy uploads are already queued. Please try again shortly.")
+        return job
+
+    async def get(self, job_id: str):
+        return await self.jobs.find_one({"_id": job_id})
+
+    # --- Workers ---
+    async def _worker(self, worker_num: int):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                job = await self.get(job_id)
+                if job:
+                    await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Ingestion job {job_id} failed: {e}")
+                await self._fail(job_id, str(e))
+            finally:
+                self.queue.task_done()
+
+    async def _update(self, job_id: str, fields: dict = None, inc: dict = None):
+        update = {"$set": {**(fields or {}), "updated_at": _now()}}
+        if inc:
+            update["$inc"] = inc
+        await self.jobs.update_one({"_id": job_id}, update)
+
+    async def _fail(self, job_id: str, error: str):
+        await self._update(job_id, {"status": "failed", "error": error, "finished_at": _now()})
+
+    async def _run(self, job: dict):
+        # Jobs queued before staging existed carry no "source": their upload already sits at file_path.
+        source = job.get("source", job["file_path"])
+        async with self._source_lock(source):
+            await self._run_locked(job, source)
+
+    async def _run_locked(self, job: dict, source: str):
+        job_id, staged_path = job["_id"], job["file_path"]
+        print(f"📄 Ingestion job {job_id}: processing {job['filename']}")
+        await self._update(job_id, {"status": "running", "started_at": _now()})
+
+        # The upload is parsed where it was staged; the live file at `source` is only replaced once the
+        # new version is recorded, so a failed job leaves the previous policy fully intact.
+        # (After a restart the staged file may already have been moved into place.)
+        path = staged_path if os.path.exists(staged_path) else source
+
+        retriever = get_policy_retriever()
+        embedded, recorded = [], False
+        try:
+            pages = await asyncio.to_thread(_load_pages, path)
+            await self._update(job_id, {"progress.pages": len(pages)})
+
+            chunks = await asyncio.to_thread(_split_pages, pages)
+            for chunk in chunks:
+                chunk.metadata["source"] = source
+            manifest = await asyncio.to_thread(load_manifest)
+            plan = await asyncio.to_thread(plan_file, source, manifest, chunks, path)
+            await self._update(job_id, {"progress.chunks_total": len(chunks)})
+
+            if plan["purge_source"]:
+                # Must run before the upsert: the filter also matches the new chunks (see plan_file).
+                await asyncio.to_thread(delete_source, source)
+
+            await self._embed_and_upsert(job_id, retriever, plan["embed"], embedded)
+
+            if plan["delete"]:
+                await asyncio.to_thread(retriever.get_vector_store().delete, ids=plan["delete"])
+                await self._update(job_id, {"progress.chunks_deleted": len(plan["delete"])})
+            await asyncio.to_thread(record_file, source, plan["sha256"], plan["ids"])
+            recorded = True
+            if path != source:
+                await asyncio.to_thread(os.replace, path, source)
+
+            # New chunks are live: cached search results may now be incomplete.
+            retriever.invalidate()
+
+            # The PDF goes to the blob store; the policy record only carries metadata.
+            blob = await get_blob_store().put_file(source, job["filename"], "application/pdf")
+            result = await self.db.active_policies.insert_one({
+                "filename": job["filename"],
+                "status": "Active Vectorized",
+                **blob,
+                "uploaded_at": _now(),
+            })
+        except Exception:
+            if embedded and not recorded:
+                await self._discard_embedded(retriever, embedded)
+            # Only the staged copy is ever removed; `source` is the live policy.
+            if path != source:
+                await asyncio.to_thread(_remove, path)
+            raise
+
+        await self._update(job_id, {"status": "completed", "policy_id": str(result.inserted_id), "finished_at": _now()})
+        print(f"✅ Ingestion job {job_id}: {job['filename']} is live ({len(plan['embed'])} chunks embedded).")
+
+    async def _discard_embedded(self, retriever, ids: list):
+        """
+        Removes vectors this job wrote but never recorded in the manifest; otherwise nothing would
+        ever delete them and they would stay searchable. New chunk IDs are never in the manifest
+        entry, and the source lock means no other job can have recorded them meanwhile.
+        """
+        try:
+            await asyncio.to_thread(retriever.get_vector_store().delete, ids=list(ids))
+            retriever.invalidate()
+        except Exception as e:
+            print(f"⚠️ Could not remove {len(ids)} orphaned policy vectors: {e}")
+
+    async def _embed_and_upsert(self, job_id: str, retriever, to_embed, embedded: list):
+        """
+        Embeds chunks in fixed-size batches, several batches in flight at once.
+        IDs are appended to `embedded` before their batch is written, so a failed job can remove them.
+        """
+        embeddings = retriever.get_embeddings()
+        vector_store = retriever.get_vector_store()
+        semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+        async def process(batch):
+            async with semaphore:
+                texts = [chunk.page_content for _, chunk in batch]
+                vectors = await embeddings.aembed_documents(texts)
+                embedded.extend(chunk_id for chunk_id, _ in batch)
+                await asyncio.to_thread(
+                    upsert_embeddings,
+                    vector_store,
+                    [chunk_id for chunk_id, _ in batch],
+                    texts,
+                    vectors,
+                    [chunk.metadata for _, chunk in batch],
+                )
+            await self._update(job_id, inc={"progress.chunks_embedded": len(batch)})
+
+        batches = [to_embed[i:i + EMBED_BATCH_SIZE] for i in range(0, len(to_embed), EMBED_BATCH_SIZE)]
+        # Let every batch finish before reporting a failure: a batch still writing after the
+        # job's cleanup would leave vectors behind that nothing tracks.
+        results = await asyncio.gather(*(process(batch) for batch in batches), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
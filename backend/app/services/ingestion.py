@@ -1,68 +1,207 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
+import json
+import hashlib
+import argparse
+import threading
 from dotenv import load_dotenv
 
+from app.services.vector_store import VECTOR_STORE_BACKEND, build_embeddings, build_vector_store, check_backend_config, delete_source
+
 load_dotenv()
 
 DATA_FOLDER = "data/policies"
+# Remembers which file/chunk hashes are already embedded, so re-runs only touch what changed.
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "data/vector_store/ingest_manifest.json")
+
+_manifest_lock = threading.Lock()
+
+
+# ==========================================
+# MANIFEST (file hash -> deterministic chunk IDs)
+# ==========================================
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return {"version": 1, "files": {}}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict):
+    os.makedirs(os.path.dirname(MANIFEST_PATH) or ".", exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def assign_chunk_ids(source: str, chunks) -> list:
+    """
+    Deterministic IDs: sha256(source | chunk text | occurrence).
+    The same text in the same file always maps to the same vector, so upserts replace instead of duplicating.
+    """
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        occurrence = seen.get(content_hash, 0)
+        seen[content_hash] = occurrence + 1
+        ids.append(hashlib.sha256(f"{source}|{content_hash}|{occurrence}".encode("utf-8")).hexdigest()[:32])
+    return ids
+
+def load_and_split(pdf_path: str):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    docs = PyPDFLoader(pdf_path).load()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    return text_splitter.split_documents(docs)
+
+
+# ==========================================
+# PLANNING & SYNC
+# ==========================================
+def plan_file(source: str, manifest: dict, chunks=None, path: str = None) -> dict:
+    """
+    Works out what has to change for one PDF.
+    Unchanged files (same sha256) are skipped without even being parsed.
+    `path` is where the file's bytes are when they are not (yet) at `source`, e.g. a staged upload.
+    """
+    entry = manifest["files"].get(source)
+    file_hash = file_sha256(path or source)
+    if entry and entry.get("sha256") == file_hash and chunks is None:
+        return {"source": source, "sha256": file_hash, "unchanged": True, "embed": [], "delete": [], "ids": entry["chunks"]}
+
+    if chunks is None:
+        chunks = load_and_split(source)
+    ids = assign_chunk_ids(source, chunks)
+    previous = set(entry["chunks"]) if entry else set()
 
-def ingest_docs():
+    return {
+        "source": source,
+        "sha256": file_hash,
+        "unchanged": False,
+        # No manifest entry: any vectors for this file predate deterministic IDs (random IDs from
+        # the old from_documents ingestion) and must go, or every chunk would be indexed twice.
+        "purge_source": entry is None,
+        "embed": [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in previous],
+        "delete": sorted(previous - set(ids)),
+        "ids": ids,
+    }
+
+def apply_plan(vector_store, plan: dict, manifest: dict):
+    """Upserts new chunks, deletes vanished ones, and records the result in the manifest."""
+    if plan.get("purge_source"):
+        delete_source(plan["source"])
+    if plan["embed"]:
+        ids = [chunk_id for chunk_id, _ in plan["embed"]]
+        vector_store.add_documents([chunk for _, chunk in plan["embed"]], ids=ids)
+    if plan["delete"]:
+        vector_store.delete(ids=plan["delete"])
+    manifest["files"][plan["source"]] = {"sha256": plan["sha256"], "chunks": plan["ids"]}
+
+def ingest_file(vector_store, pdf_path: str, chunks=None) -> dict:
+    """Incrementally syncs a single PDF (used by the upload endpoint)."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        plan = plan_file(pdf_path, manifest, chunks=chunks)
+        if not plan["unchanged"]:
+            apply_plan(vector_store, plan, manifest)
+            save_manifest(manifest)
+        return plan
+
+def record_file(source: str, file_hash: str, chunk_ids: list):
+    """Marks a file as fully synced (used by the background ingestion jobs)."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest["files"][source] = {"sha256": file_hash, "chunks": list(chunk_ids)}
+        save_manifest(manifest)
+
+def forget_file(source: str) -> list:
+    """Drops a deleted policy from the manifest and returns the chunk IDs it owned."""
+    with _manifest_lock:
+        manifest = load_manifest()
+        entry = manifest["files"].pop(source, None)
+        if entry:
+            save_manifest(manifest)
+        return entry["chunks"] if entry else []
+
+def ingest_docs(dry_run: bool = False):
     """
-    Reads PDFs from data/policies, chunks them, 
-    and saves them to the Pinecone Cloud Vector Database.
+    Reads PDFs from data/policies, chunks them,
+    and syncs them to the configured vector store (Pinecone Cloud or the local index).
+    Only new or changed chunks are embedded; chunks that disappeared are deleted.
     """
-    
+
     if not os.getenv("GEMINI_KEY_1") and not os.getenv("GEMINI_KEY_2") and not os.getenv("GEMINI_KEY_3"):
         print("❌ Error: GEMINI_KEY_1, GEMINI_KEY_2, or GEMINI_KEY_3 is missing in .env")
         return
-        
-    if not os.getenv("PINECONE_API_KEY") or not os.getenv("PINECONE_INDEX_NAME"):
-        print("❌ Error: PINECONE_API_KEY or PINECONE_INDEX_NAME is missing in .env")
+
+    config_error = check_backend_config()
+    if config_error:
+        print(f"❌ Error: {config_error}")
         return
 
     print("📄 Loading Policies...")
-    documents = []
-    
+
     # Ensure the folder exists to prevent crashes
     if not os.path.exists(DATA_FOLDER):
         os.makedirs(DATA_FOLDER)
         print(f"📁 Created '{DATA_FOLDER}' folder. Please place your PDFs there and run again.")
         return
-    
-    for file in os.listdir(DATA_FOLDER):
-        if file.endswith(".pdf"):
-            pdf_path = os.path.join(DATA_FOLDER, file)
-            loader = PyPDFLoader(pdf_path)
-            docs = loader.load()
-            documents.extend(docs)
-            print(f"   - Loaded: {file}")
-
-    if not documents:
-        print("⚠️ No PDFs found in data/policies/")
-        return
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = text_splitter.split_documents(documents)
-    print(f"✂️ Split into {len(chunks)} chunks.")
-    
-    try:
-        print(f"🧠 Embedding {len(chunks)} chunks into Pinecone...")
-        embeddings = GoogleGenerativeAIEmbeddings(model="gemini-embedding-001")
-        index_name = os.getenv("PINECONE_INDEX_NAME")
-        
-        # This automatically embeds and uploads the chunks to your Pinecone cloud
-        PineconeVectorStore.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            index_name=index_name
-        )
-        print("✅ Ingestion Complete! Pinecone Knowledge Base Updated.")
-        
-    except Exception as e:
-        print(f"❌ Error during Pinecone ingestion: {e}")
+    with _manifest_lock:
+        manifest = load_manifest()
+        sources = [os.path.join(DATA_FOLDER, file) for file in sorted(os.listdir(DATA_FOLDER)) if file.endswith(".pdf")]
+
+        plans = []
+        for source in sources:
+            plan = plan_file(source, manifest)
+            plans.append(plan)
+            status = "unchanged" if plan["unchanged"] else f"{len(plan['embed'])} to embed, {len(plan['delete'])} to delete"
+            print(f"   - {source}: {status}")
+
+        # Files removed from the folder lose all their vectors.
+        for source in sorted(set(manifest["files"]) - set(sources)):
+            plans.append({"source": source, "removed": True, "embed": [], "delete": manifest["files"][source]["chunks"]})
+            print(f"   - {source}: removed, {len(manifest['files'][source]['chunks'])} to delete")
+
+        total_embed = sum(len(plan["embed"]) for plan in plans)
+        total_delete = sum(len(plan["delete"]) for plan in plans)
+        report = {"files": len(sources), "embed": total_embed, "delete": total_delete, "dry_run": dry_run}
+        print(f"✂️ Plan: {total_embed} chunks to embed, {total_delete} vectors to delete.")
+
+        if dry_run:
+            print("🧪 Dry run: no embeddings were requested and the vector store was not modified.")
+            return report
+
+        if not total_embed and not total_delete:
+            print("✅ Knowledge Base already up to date.")
+            return report
+
+        try:
+            print(f"🧠 Syncing with the {VECTOR_STORE_BACKEND} vector store...")
+            vector_store = build_vector_store(build_embeddings())
+            for plan in plans:
+                if plan.get("removed"):
+                    vector_store.delete(ids=plan["delete"])
+                    manifest["files"].pop(plan["source"], None)
+                elif not plan["unchanged"]:
+                    apply_plan(vector_store, plan, manifest)
+                # Persist after every file so a crash never loses completed work.
+                save_manifest(manifest)
+            print("✅ Ingestion Complete! Knowledge Base Updated.")
+        except Exception as e:
+            print(f"❌ Error during ingestion: {e}")
+
+        return report
 
 if __name__ == "__main__":
-    ingest_docs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Incrementally ingest policy PDFs into the vector store.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the planned embeds and deletes.")
+    args = parser.parse_args()
+    ingest_docs(dry_run=args.dry_run)
@@ -0,0 +1,267 @@
+import os
+import json
+import uuid
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Each write produces a new numbered pair of files; CURRENT_FILE names the live pair. Files are
+# never replaced while mapped (Windows refuses that), and other processes can see a new version.
+CURRENT_FILE = "current.json"
+VECTORS_FILE = "vectors-{version}.npy"
+METADATA_FILE = "metadata-{version}.json"
+# Written by earlier versions of this module; still read when there is no CURRENT_FILE.
+LEGACY_VECTORS_FILE = "vectors.npy"
+LEGACY_METADATA_FILE = "metadata.json"
+
+
+def _matches(metadata: dict, filter: dict) -> bool:
+    """Pinecone-style metadata filter: {"source": "x"} or {"source": {"$in": [...]}}."""
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$nin" in condition and value in condition["$nin"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    """
+    In-process, NumPy-backed vector index persisted on disk.
+
+    Vectors are stored L2-normalized in a float32 .npy file that is memory-mapped on load,
+    so cosine search is one matrix-vector product. Row metadata (id, text, metadata) sits
+    beside it in a JSON file. A write saves a new numbered pair of files and then swaps the
+    small CURRENT_FILE pointer; our corpus is small and written rarely, reads are the hot path.
+
+    Readers take no lock: vectors, rows and sources are published together as one
+    `_state` tuple, so a search always sees a consistent snapshot while a write is
+    rebuilding the files (writes run in a worker thread during ingestion).
+    Writers first reload if another process (e.g. the ingestion CLI) published a newer version.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._version, self._state = self._load()
+
+    # --- Persistence ---
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _disk_version(self) -> int:
+        """The version named by CURRENT_FILE, or 0 for a legacy / empty directory."""
+        try:
+            with open(self._path(CURRENT_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)["version"]
+        except FileNotFoundError:
+            return 0
+
+    def _load(self):
+        """Reads the live files into (version, (vectors, rows, sources)) without publishing them."""
+        version = self._disk_version()
+        if version:
+            vectors_path = self._path(VECTORS_FILE.format(version=version))
+            metadata_path = self._path(METADATA_FILE.format(version=version))
+        else:
+            vectors_path = self._path(LEGACY_VECTORS_FILE)
+            metadata_path = self._path(LEGACY_METADATA_FILE)
+        if not os.path.exists(vectors_path) or not os.path.exists(metadata_path):
+            vectors, rows = None, []
+        else:
+            vectors = np.load(vectors_path, mmap_mode="r")
+            with open(metadata_path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        sources = np.array([row["metadata"].get("source") for row in rows], dtype=object)
+        return version, (vectors, rows, sources)
+
+    def _refresh(self):
+        """Called under the write lock: picks up a version written by another process."""
+        if self._disk_version() != self._version:
+            self._version, self._state = self._load()
+
+    def _save(self, vectors, rows):
+        version = max(self._version, self._disk_version()) + 1
+        np.save(self._path(VECTORS_FILE.format(version=version)), np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(self._path(METADATA_FILE.format(version=version)), "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+
+        tmp_current = self._path(CURRENT_FILE + ".tmp")
+        with open(tmp_current, "w", encoding="utf-8") as f:
+            json.dump({"version": version}, f)
+        os.replace(tmp_current, self._path(CURRENT_FILE))
+
+        self._version, self._state = self._load()
+        self._remove_old_versions()
+
+    def _remove_old_versions(self):
+        """
+        Best effort: a file still mapped by a search in flight (or by another process) cannot be
+        deleted on Windows; it is retried after the next write.
+        """
+        stale = [LEGACY_VECTORS_FILE, LEGACY_METADATA_FILE]
+        for name in os.listdir(self.directory):
+            for pattern in (VECTORS_FILE, METADATA_FILE):
+                prefix, suffix = pattern.split("{version}")
+                number = name[len(prefix):-len(suffix)] if name.startswith(prefix) and name.endswith(suffix) else ""
+                if number.isdigit() and int(number) < self._version:
+                    stale.append(name)
+        for name in stale:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+    # --- Writes ---
+    def upsert(self, ids, vectors, texts, metadatas):
+        new_vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(new_vectors, axis=1, keepdims=True)
+        new_vectors = new_vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self._refresh()
+            current_vectors, current_rows, _ = self._state
+            incoming = set(ids)
+            keep = [i for i, row in enumerate(current_rows) if row["id"] not in incoming]
+            rows = [current_rows[i] for i in keep]
+            if current_vectors is not None and len(keep):
+                if current_vectors.shape[1] != new_vectors.shape[1]:
+                    raise ValueError(
+                        f"Embedding dimension {new_vectors.shape[1]} does not match index dimension {current_vectors.shape[1]}."
+                    )
+                vectors_out = np.vstack([np.asarray(current_vectors[keep]), new_vectors])
+            else:
+                vectors_out = new_vectors
+
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                rows.append({"id": doc_id, "text": text, "metadata": metadata or {}})
+            self._save(vectors_out, rows)
+
+    def delete(self, ids=None, filter: dict = None) -> int:
+        with self._lock:
+            self._refresh()
+            current_vectors, current_rows, _ = self._state
+            if not current_rows:
+                return 0
+            drop = set(ids or [])
+            keep = [
+                i for i, row in enumerate(current_rows)
+                if row["id"] not in drop and not (filter and _matches(row["metadata"], filter))
+            ]
+            removed = len(current_rows) - len(keep)
+            if removed:
+                if keep:
+                    vectors_out = np.asarray(current_vectors[keep])
+                else:
+                    vectors_out = np.zeros((0, current_vectors.shape[1]), dtype=np.float32)
+                self._save(vectors_out, [current_rows[i] for i in keep])
+            return removed
+
+    # --- Reads ---
+    def search(self, vector, k: int = 4, filter: dict = None):
+        """Returns [(row, cosine_score)] for the k nearest rows that pass the filter."""
+        vectors, rows, sources = self._state
+        if vectors is None or not rows:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = vectors @ query
+
+        if filter:
+            if set(filter) == {"source"} and not isinstance(filter["source"], dict):
+                mask = sources == filter["source"]
+            else:
+                mask = np.array([_matches(row["metadata"], filter) for row in rows], dtype=bool)
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, len(rows))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(rows[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def __len__(self):
+        return len(self._state[1])
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain adapter so the local index is a drop-in for PineconeVectorStore."""
+
+    def __init__(self, embedding, index: LocalVectorIndex):
+        self._embedding = embedding
+        self.index = index
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        if texts:
+            self.index.upsert(ids, embeddings, texts, metadatas)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas, ids)
+
+    async def aadd_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        embeddings = await self._embedding.aembed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas, ids)
+
+    def delete(self, ids=None, **kwargs):
+        self.index.delete(ids=ids, filter=kwargs.get("filter"))
+        return True
+
+    async def adelete(self, ids=None, **kwargs):
+        return self.delete(ids=ids, **kwargs)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        return [
+            (Document(id=row["id"], page_content=row["text"], metadata=row["metadata"]), score)
+            for row, score in self.index.search(embedding, k=k, filter=filter)
+        ]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    async def asimilarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs):
+        # Sub-millisecond CPU work; a thread hop would cost more than the search itself.
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k=k, filter=filter)
+
+    async def asimilarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        embedding = await self._embedding.aembed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory: str = None, **kwargs):
+        from app.services.vector_store import LOCAL_VECTOR_STORE_DIR
+        store = cls(embedding, LocalVectorIndex(directory or LOCAL_VECTOR_STORE_DIR))
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,158 @@
+import os
+import re
+import asyncio
+import unicodedata
+from difflib import SequenceMatcher
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How many candidates each index lookup may return before ranking.
+NAME_CANDIDATE_LIMIT = int(os.getenv("NAME_SEARCH_CANDIDATE_LIMIT", "50"))
+# Lowest ranked score that still counts as a possible match.
+MIN_NAME_SCORE = float(os.getenv("NAME_SEARCH_MIN_SCORE", "0.45"))
+# A match is only used without asking when it scores at least this and clearly beats the runner-up.
+CONFIDENT_NAME_SCORE = float(os.getenv("NAME_SEARCH_CONFIDENT_SCORE", "0.75"))
+AMBIGUITY_MARGIN = float(os.getenv("NAME_SEARCH_AMBIGUITY_MARGIN", "0.05"))
+
+
+def normalize_name(text: str) -> str:
+    """'  Séna  O'Brien-Kumar ' -> 'sena o brien kumar' (accents dropped, lower-case, punctuation as spaces)."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def name_trigrams(normalized: str) -> list:
+    """Character trigrams of each word, padded so short words and word starts still produce grams."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return sorted(grams)
+
+
+def search_fields(name: str = None, department: str = None) -> dict:
+    """Derived, indexed fields to $set whenever an employee's name or department is written."""
+    fields = {}
+    if name is not None:
+        normalized = normalize_name(name)
+        fields.update({
+            "name_norm": normalized,
+            "name_tokens": normalized.split(),
+            "name_trigrams": name_trigrams(normalized),
+        })
+    if department is not None:
+        fields["department_norm"] = normalize_name(department)
+    return fields
+
+
+def department_filter(department: str) -> dict:
+    """Index-backed, case-insensitive department prefix match ('eng' -> Engineering)."""
+    return {"department_norm": {"$regex": f"^{re.escape(normalize_name(department))}"}}
+
+
+def score_name(query: str, candidate: str) -> float:
+    """Ranks a normalized candidate name against a normalized query (1.0 = exact)."""
+    if not query or not candidate:
+        return 0.0
+    if candidate == query:
+        return 1.0
+    if candidate.startswith(query):
+        return 0.95
+    candidate_tokens = candidate.split()
+    if all(any(token.startswith(q) for token in candidate_tokens) for q in query.split()):
+        return 0.9
+    query_grams, candidate_grams = set(name_trigrams(query)), set(name_trigrams(candidate))
+    overlap = len(query_grams & candidate_grams) / len(query_grams | candidate_grams)
+    return 0.6 * SequenceMatcher(None, query, candidate).ratio() + 0.4 * overlap
+
+
+async def find_employees_by_name(db, name: str, limit: int = 5) -> list:
+    """
+    Ranked employees whose name matches `name`, best first, as (score, employee) pairs.
+    Tries anchored prefix lookups on the normalized name and its words first; falls back to a
+    trigram lookup (typos, partial words) only when those find nothing. Every lookup uses an index.
+    """
+    query = normalize_name(name)
+    if not query:
+        return []
+
+    prefix_branches = [{"name_norm": {"$regex": f"^{re.escape(query)}"}}]
+    prefix_branches += [{"name_tokens": {"$regex": f"^{re.escape(token)}"}} for token in query.split() if len(token) > 1]
+    candidates = await db.employees.find({"$or": prefix_branches}).limit(NAME_CANDIDATE_LIMIT).to_list(length=NAME_CANDIDATE_LIMIT)
+
+    if not candidates:
+        grams = name_trigrams(query)
+        candidates = await db.employees.aggregate([
+            {"$match": {"name_trigrams": {"$in": grams}}},
+            {"$addFields": {"_gram_overlap": {"$size": {"$setIntersection": ["$name_trigrams", grams]}}}},
+            {"$sort": {"_gram_overlap": -1}},
+            {"$limit": NAME_CANDIDATE_LIMIT},
+        ]).to_list(length=NAME_CANDIDATE_LIMIT)
+
+    ranked = []
+    for emp in candidates:
+        score = score_name(query, emp.get("name_norm") or normalize_name(emp.get("name", "")))
+        if score >= MIN_NAME_SCORE:
+            ranked.append((score, emp))
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+    return ranked[:limit]
+
+
+async def resolve_employee(db, employee_id_or_name: str):
+    """
+    Exact employee ID first, then ranked name search.
+    Returns (employee, candidates): `employee` is set only for an exact ID or one confident name match;
+    otherwise `candidates` lists every plausible employee so the agent can ask which one was meant.
+    """
+    from app.services.identity import get_employee_record
+
+    emp = await get_employee_record(db, employee_id_or_name)
+    if emp:
+        return emp, []
+
+    ranked = await find_employees_by_name(db, employee_id_or_name)
+    if not ranked:
+        return None, []
+
+    top_score = ranked[0][0]
+    contenders = [emp for score, emp in ranked if score >= top_score - AMBIGUITY_MARGIN]
+    if top_score >= CONFIDENT_NAME_SCORE and len(contenders) == 1:
+        return contenders[0], []
+    return None, [emp for _, emp in ranked]
+
+
+def describe_candidates(query: str, candidates: list) -> str:
+    lines = "\n".join(
+        f"- {emp.get('name', 'Unknown')} (ID: {emp.get('employee_id', 'N/A')}, Dept: {emp.get('department', 'N/A')})"
+        for emp in candidates
+    )
+    return f"No exact match for '{query}'. Possible employees:\n{lines}\nAsk the user which one they mean and retry with the employee ID."
+
+
+async def backfill_search_fields(db) -> int:
+    """Adds the derived search fields to employees written before they existed (or by other tools)."""
+    updated = 0
+    batch = []
+    cursor = db.employees.find({"name_norm": {"$exists": False}}, {"name": 1, "department": 1})
+    async for emp in cursor:
+        fields = search_fields(emp.get("name", ""), emp.get("department") or "")
+        batch.append(UpdateOne({"_id": emp["_id"]}, {"$set": fields}))
+        if len(batch) >= 500:
+            updated += (await db.employees.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.employees.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    async def _main():
+        from app.services.database import get_db, close_mongo_connection
+        count = await backfill_search_fields(get_db())
+        print(f"✅ Added name search fields to {count} employees.")
+        await close_mongo_connection()
+
+    asyncio.run(_main())
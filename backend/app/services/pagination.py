@@ -0,0 +1,110 @@
+import base64
+import datetime
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, DESCENDING
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_field: str, value, last_id) -> str:
+    """Opaque continuation token: the sort key of the last row returned (never an offset)."""
+    payload = json_util.dumps({"f": sort_field, "v": value, "id": last_id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, sort_field: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        if payload["f"] != sort_field:
+            raise ValueError("cursor belongs to a different sort order")
+        return payload["v"], payload["id"]
+    except Exception as e:
+        raise InvalidCursor(f"Invalid pagination cursor: {e}")
+
+
+def _get_path(doc: dict, field: str):
+    for part in field.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _after(sort_field: str, direction: int, value, last_id) -> dict:
+    """Filter for rows strictly after (value, last_id) in the (sort_field, _id) order."""
+    op = "$gt" if direction == ASCENDING else "$lt"
+    tie = {"_id": {op: last_id}}
+    if sort_field == "_id":
+        return tie
+    if value is None:
+        # Missing values sort first ascending and last descending.
+        tie_on_null = {sort_field: None, **tie}
+        return {"$or": [tie_on_null, {sort_field: {"$ne": None}}]} if direction == ASCENDING else tie_on_null
+    branches = [{sort_field: {op: value}}, {sort_field: value, **tie}]
+    if direction == DESCENDING:
+        branches.append({sort_field: None})
+    return {"$or": branches}
+
+
+def created_range(created_from: datetime.datetime = None, created_to: datetime.datetime = None) -> dict:
+    """Date-range filter on insertion time, read from the ObjectId, so it works on every collection."""
+    bounds = {}
+    if created_from:
+        bounds["$gte"] = ObjectId.from_datetime(created_from)
+    if created_to:
+        bounds["$lt"] = ObjectId.from_datetime(created_to)
+    return {"_id": bounds} if bounds else {}
+
+
+def build_projection(fields: str = None, allowed=None, exclude=None):
+    """
+    `fields=name,email` -> inclusion projection, limited to `allowed` when given.
+    Without `fields` (or when none of them are allowed), returns the endpoint's default:
+    `allowed` as an inclusion projection, else `exclude` as an exclusion projection.
+    """
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        if allowed is not None:
+            requested = [f for f in requested if f in allowed]
+        requested = [f for f in requested if f not in (exclude or ())]
+        if requested:
+            return {f: 1 for f in requested}
+    if allowed is not None:
+        return {f: 1 for f in allowed}
+    if exclude:
+        return {f: 0 for f in exclude}
+    return None
+
+
+async def paginate(collection, query: dict = None, sort_field: str = "_id", direction: int = DESCENDING,
+                   limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, projection: dict = None):
+    """
+    Keyset pagination over (sort_field, _id). Each page is an index range scan that starts
+    where the previous page ended, so page N costs the same as page 1 however large the collection.
+    Returns (docs, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    filters = [query] if query else []
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_field)
+        filters.append(_after(sort_field, direction, value, last_id))
+    final_query = {"$and": filters} if len(filters) > 1 else (filters[0] if filters else {})
+
+    if projection and any(projection.values()) and sort_field != "_id":
+        projection = {**projection, sort_field: 1}  # needed to build the next cursor
+
+    sort = [("_id", direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+    docs = await collection.find(final_query, projection).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(sort_field, _get_path(last, sort_field) if sort_field != "_id" else None, last["_id"])
+    return docs, next_cursor
@@ -0,0 +1,125 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+from app.services.cache import TTLCache
+from app.services.vector_store import VECTOR_STORE_BACKEND, build_embeddings, build_vector_store
+from app.services.telemetry import span
+from app.services.semantic_cache import SemanticCache
+
+load_dotenv()
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("POLICY_EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.getenv("POLICY_EMBEDDING_CACHE_TTL", "86400"))
+RESULT_CACHE_SIZE = int(os.getenv("POLICY_RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL = float(os.getenv("POLICY_RESULT_CACHE_TTL", "900"))
+# Cosine similarity above which two questions are treated as the same question.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("POLICY_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("POLICY_SEMANTIC_CACHE_SIZE", "256"))
+
+
+def normalize_query(query: str) -> str:
+    """Collapses case and whitespace so trivially different phrasings share a cache entry."""
+    return " ".join(query.lower().split())
+
+
+class PolicyRetriever:
+    """
+    Process-wide policy retriever.
+    Owns a single embeddings client and vector store connection, and caches
+    query embeddings and top-k results so repeated questions skip the network.
+    """
+
+    def __init__(self):
+        self._embeddings = None
+        self._vector_store = None
+        self._init_lock = threading.Lock()
+
+        # Query embeddings never go stale (same text -> same vector), so they survive invalidation.
+        self.embedding_cache = TTLCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL, name="policy_embeddings")
+        # Results depend on the indexed corpus, so they are dropped whenever a policy changes.
+        self.result_cache = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, name="policy_results")
+        # Near-duplicate questions reuse an earlier answer instead of another vector search.
+        self.semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+        self.corpus_version = 0
+
+    # --- Connections (built once, reused by every search) ---
+    def get_embeddings(self):
+        if self._embeddings is None:
+            with self._init_lock:
+                if self._embeddings is None:
+                    self._embeddings = build_embeddings()
+        return self._embeddings
+
+    def get_vector_store(self):
+        if self._vector_store is None:
+            embeddings = self.get_embeddings()
+            with self._init_lock:
+                if self._vector_store is None:
+                    self._vector_store = build_vector_store(embeddings)
+        return self._vector_store
+
+    # --- Queries ---
+    async def aembed_query(self, query: str):
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            with span("embedding"):
+                embedding = await self.get_embeddings().aembed_query(query)
+            self.embedding_cache.set(key, embedding)
+        return embedding
+
+    async def asearch(self, query: str, k: int = 3):
+        """Returns the top-k policy chunks for the query, serving repeats from cache."""
+        version = self.corpus_version
+        cache_key = (version, normalize_query(query), k)
+
+        docs = self.result_cache.get(cache_key)
+        if docs is not None:
+            return docs
+
+        embedding = await self.aembed_query(query)
+
+        match = self.semantic_cache.lookup(embedding, k, version)
+        if match is not None:
+            docs, score, matched_query = match
+            print(f"♻️ Reusing results of '{matched_query}' (similarity {score:.3f})")
+        else:
+            with span("vector_search", backend=VECTOR_STORE_BACKEND):
+                docs = await self.get_vector_store().asimilarity_search_by_vector(embedding, k=k)
+            if version == self.corpus_version:
+                self.semantic_cache.store(query, embedding, k, docs, version)
+
+        # Don't cache a result that raced with a policy upload/delete.
+        if version == self.corpus_version:
+            self.result_cache.set(cache_key, docs)
+        return docs
+
+    # --- Maintenance ---
+    def invalidate(self):
+        """Called whenever the policy corpus changes (upload or delete)."""
+        self.corpus_version += 1
+        self.result_cache.clear()
+        self.semantic_cache.reset(self.corpus_version)
+
+    def stats(self) -> dict:
+        return {
+            "corpus_version": self.corpus_version,
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "semantic_cache": self.semantic_cache.stats(),
+        }
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_policy_retriever() -> PolicyRetriever:
+    """Returns the shared retriever for this process."""
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = PolicyRetriever()
+    return _retriever
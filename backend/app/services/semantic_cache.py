@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Reuses retrieval results for queries whose embedding is close (cosine) to one we already answered,
+    e.g. "how many sick days" vs "sick leave count".
+
+    Vectors live in one preallocated float32 matrix (max_entries x dim), so memory is bounded
+    and a lookup is a single matrix-vector product. Least recently used entries are evicted first.
+    Entries are scoped to a corpus version; a newer version wipes them, and callers still holding
+    an older one (a request that started before the policy change) neither read nor write.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 256):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.corpus_version = 0
+        self._vectors = None
+        self._entries = OrderedDict()  # slot -> {"query", "k", "docs"}
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _sync_version(self, corpus_version: int) -> bool:
+        """Moves forward to a newer corpus version; returns False for a stale one."""
+        if corpus_version > self.corpus_version:
+            self._entries.clear()
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            self.corpus_version = corpus_version
+        return corpus_version == self.corpus_version
+
+    def lookup(self, embedding, k: int, corpus_version: int):
+        """Returns (docs, similarity, matched_query) for the nearest cached query above the threshold, else None."""
+        query_vec = self._unit(embedding)
+        with self._lock:
+            if not self._sync_version(corpus_version):
+                self.misses += 1
+                return None
+            slots = [slot for slot, entry in self._entries.items() if entry["k"] == k]
+            if not slots or self._vectors is None or self._vectors.shape[1] != query_vec.shape[0]:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors[slots] @ query_vec
+            best = int(np.argmax(similarities))
+            score = float(similarities[best])
+            if score < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = slots[best]
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            entry = self._entries[slot]
+            return entry["docs"], score, entry["query"]
+
+    def store(self, query: str, embedding, k: int, docs, corpus_version: int):
+        query_vec = self._unit(embedding)
+        with self._lock:
+            if not self._sync_version(corpus_version):
+                return
+            if self._vectors is None or self._vectors.shape[1] != query_vec.shape[0]:
+                self._vectors = np.zeros((self.max_entries, query_vec.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+            if not self._free_slots:
+                evicted_slot, _ = self._entries.popitem(last=False)
+                self._free_slots.append(evicted_slot)
+                self.evictions += 1
+
+            slot = self._free_slots.pop()
+            self._vectors[slot] = query_vec
+            self._entries[slot] = {"query": query, "k": k, "docs": docs}
+
+    def reset(self, corpus_version: int):
+        with self._lock:
+            self._sync_version(corpus_version)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "threshold": self.threshold,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "corpus_version": self.corpus_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "saved_round_trips": self.hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_bytes": int(self._vectors.nbytes) if self._vectors is not None else 0,
+        }
@@ -0,0 +1,118 @@
+import os
+import asyncio
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# IDs reserved per round trip. Each process hands out its block locally, so a restart leaves a
+# gap in the numbering (never a duplicate). Set to 1 for gap-free, strictly increasing IDs.
+SEQUENCE_BLOCK_SIZE = int(os.getenv("SEQUENCE_BLOCK_SIZE", "10"))
+
+# name -> (prefix, numeric floor, [(collection, id field), ...] the existing IDs live in)
+SEQUENCES = {
+    "hr_ticket": ("TKT-", 1000, [("hr_tickets", "ticket_id")]),
+    "transaction": ("TRX-", 1000, [("pending_approvals", "trx_id")]),
+    "employee": ("emp_", 100, [("employees", "employee_id"), ("users", "employee_id")]),
+}
+
+
+class SequenceAllocator:
+    """
+    Unique, increasing numbers from the Mongo `counters` collection.
+    A block of numbers is reserved with one atomic find_one_and_update($inc), so concurrent
+    requests and processes never get the same ID and most IDs cost no round trip at all.
+    """
+
+    def __init__(self, db, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.db = db
+        self.block_size = max(1, block_size)
+        self._blocks = {}  # name -> [next, last]
+        self._locks = {}
+        self._seeded = set()
+
+    @property
+    def counters(self):
+        return self.db.counters
+
+    async def next_value(self, name: str) -> int:
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            block = self._blocks.get(name)
+            if block is None or block[0] > block[1]:
+                if name in SEQUENCES and name not in self._seeded:
+                    await self.seed(name)
+                    self._seeded.add(name)
+                doc = await self.counters.find_one_and_update(
+                    {"_id": name},
+                    {"$inc": {"value": self.block_size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                block = [doc["value"] - self.block_size + 1, doc["value"]]
+                self._blocks[name] = block
+            value = block[0]
+            block[0] += 1
+            return value
+
+    async def next_id(self, name: str) -> str:
+        prefix = SEQUENCES[name][0]
+        return f"{prefix}{await self.next_value(name)}"
+
+    async def seed(self, name: str):
+        """
+        Starts the counter above every ID already in use (the IDs used to be count()+N, so they
+        are neither dense nor guaranteed unique). Runs once per sequence; $max makes it idempotent.
+        """
+        if await self.counters.find_one({"_id": name}, {"_id": 1}):
+            return
+        prefix, floor, sources = SEQUENCES[name]
+        highest = floor - 1
+        for collection, field in sources:
+            highest = max(highest, await self._max_suffix(collection, field, prefix))
+        await self.counters.update_one({"_id": name}, {"$max": {"value": highest}}, upsert=True)
+
+    async def _max_suffix(self, collection: str, field: str, prefix: str) -> int:
+        pipeline = [
+            {"$match": {field: {"$regex": f"^{prefix}"}}},
+            {"$group": {"_id": None, "highest": {"$max": {"$convert": {
+                "input": {"$substrCP": [f"${field}", len(prefix), 32]},
+                "to": "int",
+                "onError": None,
+                "onNull": None,
+            }}}}},
+        ]
+        result = await self.db[collection].aggregate(pipeline).to_list(length=1)
+        return (result[0]["highest"] or 0) if result else 0
+
+    async def seed_all(self):
+        for name in SEQUENCES:
+            await self.seed(name)
+
+
+_allocator = None
+
+
+def get_sequence_allocator() -> SequenceAllocator:
+    global _allocator
+    if _allocator is None:
+        from app.services.database import db
+        _allocator = SequenceAllocator(db)
+    return _allocator
+
+
+async def next_id(name: str) -> str:
+    """'hr_ticket' -> 'TKT-1042', 'transaction' -> 'TRX-1007', 'employee' -> 'emp_131'."""
+    return await get_sequence_allocator().next_id(name)
+
+
+if __name__ == "__main__":
+    async def _main():
+        from app.services.database import get_db, close_mongo_connection
+        allocator = SequenceAllocator(get_db())
+        await allocator.seed_all()
+        for doc in await allocator.counters.find({"_id": {"$in": list(SEQUENCES)}}).to_list(length=None):
+            print(f"✅ Counter '{doc['_id']}' starts after {doc['value']}")
+        await close_mongo_connection()
+
+    asyncio.run(_main())
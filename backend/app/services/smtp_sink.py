@@ -0,0 +1,95 @@
+import os
+import sys
+import asyncio
+from email import message_from_bytes
+from email.policy import default as default_policy
+
+
+class SMTPSink:
+    """
+    A tiny local SMTP server that accepts every message and keeps it (no TLS, no auth).
+    Stand-in for Gmail in development and tests:
+        python -m app.services.smtp_sink 1025 [outdir]
+    with SMTP_HOST=localhost SMTP_PORT=1025 SMTP_SECURITY=none in .env.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1025, outdir: str = None):
+        self.host = host
+        self.port = port
+        self.outdir = outdir
+        self.messages = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+
+        reply("220 innvoix-smtp-sink ready")
+        sender, recipients = None, []
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                command = raw.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb in ("HELO", "EHLO"):
+                    reply("250 innvoix-smtp-sink")
+                elif verb == "MAIL":
+                    sender, recipients = command.split(":", 1)[-1].strip(" <>"), []
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[-1].strip(" <>"))
+                    reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    lines = []
+                    while True:
+                        line = await reader.readline()
+                        if not line or line in (b".\r\n", b".\n"):
+                            break
+                        lines.append(line[1:] if line.startswith(b"..") else line)
+                    self._store(sender, recipients, b"".join(lines))
+                    reply("250 OK: queued")
+                elif verb in ("RSET", "NOOP"):
+                    if verb == "RSET":
+                        sender, recipients = None, []
+                    reply("250 OK")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _store(self, sender: str, recipients: list, data: bytes):
+        message = message_from_bytes(data, policy=default_policy)
+        self.messages.append({"from": sender, "to": recipients, "subject": message["Subject"], "message": message})
+        print(f"📨 [smtp-sink] {sender} -> {', '.join(recipients)}: {message['Subject']}")
+        if self.outdir:
+            os.makedirs(self.outdir, exist_ok=True)
+            with open(os.path.join(self.outdir, f"{len(self.messages):05d}.eml"), "wb") as f:
+                f.write(data)
+
+
+if __name__ == "__main__":
+    async def _main():
+        port = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+        sink = await SMTPSink(port=port, outdir=sys.argv[2] if len(sys.argv) > 2 else None).start()
+        print(f"📭 SMTP sink listening on {sink.host}:{sink.port}")
+        await asyncio.Event().wait()
+
+    asyncio.run(_main())
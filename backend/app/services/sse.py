@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tokens are buffered into one frame until this much time has passed since the first buffered
+# token, or the buffer reaches SSE_FLUSH_CHARS. The first token of a stream is always sent at once.
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "40"))
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", "400"))
+# Comment frames keep proxies and load balancers from closing a stream while a slow tool runs.
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_DISCONNECT_POLL_SECONDS = float(os.getenv("SSE_DISCONNECT_POLL_SECONDS", "1"))
+SSE_QUEUE_SIZE = 256
+SSE_RECENT_STREAMS = 500
+
+HEARTBEAT_FRAME = b": ping\n\n"
+_END = object()
+
+
+def encode_event(event: dict) -> bytes:
+    return b"data: " + json.dumps(event, separators=(",", ":"), default=str).encode() + b"\n\n"
+
+
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+
+class StreamStats:
+    """Counters and recent TTFB / duration samples of SSE streams, for /api/metrics/streams."""
+
+    def __init__(self, keep: int = SSE_RECENT_STREAMS):
+        self.recent = deque(maxlen=keep)
+        self.active = 0
+        self.totals = {"started": 0, "completed": 0, "disconnected": 0, "errors": 0, "frames": 0, "heartbeats": 0, "tokens": 0}
+
+    def record(self, summary: dict):
+        self.recent.append(summary)
+        self.totals[summary["outcome"]] += 1
+        self.totals["frames"] += summary["frames"]
+        self.totals["heartbeats"] += summary["heartbeats"]
+        self.totals["tokens"] += summary["tokens"]
+
+    def snapshot(self) -> dict:
+        ttfb = [s["ttfb_ms"] for s in self.recent if s["ttfb_ms"] is not None]
+        duration = [s["duration_ms"] for s in self.recent]
+        return {
+            **self.totals,
+            "active": self.active,
+            "tokens_per_frame": round(self.totals["tokens"] / self.totals["frames"], 2) if self.totals["frames"] else None,
+            "ttfb_ms": {"p50": _percentile(ttfb, 0.50), "p95": _percentile(ttfb, 0.95), "p99": _percentile(ttfb, 0.99)},
+            "duration_ms": {"p50": _percentile(duration, 0.50), "p95": _percentile(duration, 0.95), "p99": _percentile(duration, 0.99)},
+            "recent": list(self.recent)[-20:],
+        }
+
+
+stream_stats = StreamStats()
+
+
+async def _pump(events, queue: asyncio.Queue):
+    try:
+        async for event in events:
+            await queue.put(event)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put({"type": "error", "content": str(e)})
+    finally:
+        await events.aclose()
+        try:
+            queue.put_nowait(_END)
+        except asyncio.QueueFull:
+            pass  # the consumer is gone (it only stops reading after a disconnect)
+
+
+async def sse_stream(events, request=None, label: str = "chat", stats: StreamStats = stream_stats):
+    """
+    Turns an async iterator of event dicts into SSE frames.
+    The producer runs in its own task: consecutive 'token' events are merged into one frame,
+    idle periods get heartbeat comments, and when the client goes away the producer task is
+    cancelled so the agent run (LLM calls and tools) stops with it.
+    """
+    stream_id = uuid.uuid4().hex[:12]
+    queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    producer = asyncio.create_task(_pump(events, queue))
+    started = time.perf_counter()
+    summary = {"stream_id": stream_id, "label": label, "ttfb_ms": None, "frames": 0, "heartbeats": 0, "tokens": 0}
+    outcome = "disconnected"
+    stats.active += 1
+    stats.totals["started"] += 1
+
+    buffer, buffered_chars, flush_at = [], 0, None
+    last_frame = next_disconnect_check = time.monotonic()
+
+    def frame(event: dict) -> bytes:
+        if summary["ttfb_ms"] is None:
+            summary["ttfb_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        summary["frames"] += 1
+        return encode_event(event)
+
+    def flush() -> bytes:
+        nonlocal buffer, buffered_chars, flush_at
+        data = frame({"type": "token", "content": "".join(buffer)})
+        buffer, buffered_chars, flush_at = [], 0, None
+        return data
+
+    try:
+        while True:
+            now = time.monotonic()
+            deadline = min(last_frame + SSE_HEARTBEAT_SECONDS, next_disconnect_check + SSE_DISCONNECT_POLL_SECONDS if request else float("inf"))
+            if flush_at is not None:
+                deadline = min(deadline, flush_at)
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=max(0.0, deadline - now))
+            except asyncio.TimeoutError:
+                item = None
+
+            now = time.monotonic()
+            if request is not None and now >= next_disconnect_check + SSE_DISCONNECT_POLL_SECONDS:
+                next_disconnect_check = now
+                if await request.is_disconnected():
+                    break
+
+            if item is _END:
+                if buffer:
+                    yield flush()
+                if outcome != "errors":
+                    outcome = "completed"
+                break
+
+            if item is None:
+                if buffer and now >= flush_at:
+                    yield flush()
+                    last_frame = now
+                elif now - last_frame >= SSE_HEARTBEAT_SECONDS:
+                    summary["heartbeats"] += 1
+                    yield HEARTBEAT_FRAME
+                    last_frame = now
+                continue
+
+            if item.get("type") == "token":
+                summary["tokens"] += 1
+                buffer.append(item["content"])
+                buffered_chars += len(item["content"])
+                if flush_at is None:
+                    flush_at = now + SSE_FLUSH_MS / 1000
+                if summary["ttfb_ms"] is None or buffered_chars >= SSE_FLUSH_CHARS:
+                    yield flush()
+                    last_frame = now
+                continue
+
+            # Tool, done and error events keep their order relative to the text around them.
+            if buffer:
+                yield flush()
+            if item.get("type") == "error":
+                outcome = "errors"
+            yield frame(item)
+            last_frame = now
+    finally:
+        # Runs on normal completion, on a detected disconnect and when the server cancels the response.
+        if not producer.done():
+            producer.cancel()
+            print(f"✂️ SSE stream {stream_id} ({label}) closed by client. Cancelled the agent run.")
+        await asyncio.gather(producer, return_exceptions=True)
+        stats.active -= 1
+        stats.record({
+            **summary,
+            "outcome": outcome,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
@@ -0,0 +1,301 @@
+import os
+import time
+import uuid
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from pymongo import monitoring
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Share of requests whose span tree is kept (see /api/metrics/traces). Histograms always record.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Per-request debug mode: send this header with "1" to trace the request, print its span tree,
+# and log LangChain callbacks for that turn only (what `langchain.debug = True` did for every turn).
+TRACE_DEBUG_HEADER = os.getenv("TRACE_DEBUG_HEADER", "x-debug-trace").lower()
+
+# Seconds; spans from sub-millisecond cache hits to multi-second LLM calls.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# ==========================================
+# METRICS (Prometheus text exposition)
+# ==========================================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames + ('le',), key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in items]
+        return lines
+
+
+STAGE_SECONDS = Histogram("hr_agent_stage_seconds", "Duration of each stage of a chat turn.", ["stage"])
+LLM_FIRST_TOKEN_SECONDS = Histogram("hr_agent_llm_first_token_seconds", "Time from an LLM call's start to its first streamed token.")
+TOOL_SECONDS = Histogram("hr_agent_tool_seconds", "Duration of each agent tool call.", ["tool", "outcome"])
+HTTP_SECONDS = Histogram("hr_agent_http_request_seconds", "HTTP request duration, including streamed bodies.", ["method", "route", "status"])
+MONGO_COMMAND_SECONDS = Histogram("hr_agent_mongo_command_seconds", "MongoDB command round trips.", ["command", "outcome"])
+TRACES_TOTAL = Counter("hr_agent_traces_total", "Requests seen by the tracer, by whether their spans were kept.", ["sampled"])
+
+METRICS = [STAGE_SECONDS, LLM_FIRST_TOKEN_SECONDS, TOOL_SECONDS, HTTP_SECONDS, MONGO_COMMAND_SECONDS, TRACES_TOTAL]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ==========================================
+# TRACES & SPANS
+# ==========================================
+class Trace:
+    def __init__(self, name: str, sampled: bool, debug: bool = False):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.sampled = sampled or debug
+        self.debug = debug
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = None
+        self.attrs = {}
+        self.spans = []
+
+    def add_span(self, name: str, started: float, duration: float, parent=None, **attrs) -> dict:
+        span = {
+            "name": name,
+            "start_ms": round((started - self._t0) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+            "parent": parent,
+            **attrs,
+        }
+        if self.sampled:
+            self.spans.append(span)
+        return span
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "debug": self.debug,
+            **self.attrs,
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_recent_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def is_debug() -> bool:
+    trace = _current_trace.get()
+    return bool(trace and trace.debug)
+
+
+def start_trace(name: str, debug: bool = False) -> Trace:
+    trace = Trace(name, sampled=random.random() < TRACE_SAMPLE_RATE, debug=debug)
+    _current_trace.set(trace)
+    TRACES_TOTAL.inc(sampled=str(trace.sampled).lower())
+    return trace
+
+
+def finish_trace(trace: Trace):
+    trace.duration_ms = round((time.perf_counter() - trace._t0) * 1000, 2)
+    if trace.sampled:
+        _recent_traces.append(trace)
+    if trace.debug:
+        print(format_trace(trace))
+
+
+def observe_stage(stage: str, seconds: float, **attrs):
+    """Records a stage that was timed elsewhere (e.g. in a worker thread) on the current trace."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None and trace.sampled:
+        trace.add_span(stage, time.perf_counter() - seconds, seconds, parent=_current_span.get(), **attrs)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """
+    Times a block: always into the stage histogram, and into the request's trace when it is sampled.
+    Works around awaits (`with span("history_load"): await ...`); nested spans record their parent.
+    """
+    started = time.perf_counter()
+    token = _current_span.set(stage)
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            pass  # an async generator closed from another context
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None and trace.sampled:
+            if error:
+                attrs["error"] = error
+            trace.add_span(stage, started, duration, parent=_current_span.get(), **attrs)
+
+
+def debug_log(message: str):
+    """Prints only while handling a request in debug mode; the hot path stays quiet otherwise."""
+    if is_debug():
+        print(f"[trace {_current_trace.get().trace_id}] {message}")
+
+
+def get_trace(trace_id: str):
+    for trace in _recent_traces:
+        if trace.trace_id == trace_id:
+            return trace.as_dict()
+    return None
+
+
+def recent_traces(limit: int = 50) -> list:
+    return [
+        {"trace_id": t.trace_id, "name": t.name, "duration_ms": t.duration_ms, "spans": len(t.spans), "debug": t.debug, **t.attrs}
+        for t in list(_recent_traces)[-limit:][::-1]
+    ]
+
+
+def format_trace(trace: Trace) -> str:
+    lines = [f"🧭 Trace {trace.trace_id} {trace.name} {trace.duration_ms} ms"]
+    for s in sorted(trace.spans, key=lambda s: s["start_ms"]):
+        extra = " ".join(f"{k}={v}" for k, v in s.items() if k not in ("name", "start_ms", "duration_ms", "parent"))
+        indent = "    " if s["parent"] else "  "
+        lines.append(f"{indent}+{s['start_ms']:>9.2f} ms  {s['name']:<24} {s['duration_ms']:>9.2f} ms  {extra}")
+    return "\n".join(lines)
+
+
+# ==========================================
+# INTEGRATIONS
+# ==========================================
+class TracingMiddleware:
+    """
+    Plain ASGI middleware (so streamed bodies are timed to their last byte): starts a trace per
+    HTTP request, honours the debug header, returns X-Trace-Id for kept traces and records
+    the request histogram by route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        debug = headers.get(TRACE_DEBUG_HEADER.encode(), b"").lower() in (b"1", b"true", b"yes")
+        trace = start_trace(f"{scope['method']} {scope['path']}", debug=debug)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace.sampled:
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"x-trace-id", trace.trace_id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+            trace.attrs["status"] = status
+            finish_trace(trace)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Command round-trip histogram (pymongo callbacks run on Motor's worker threads)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+
+mongo_command_metrics = MongoCommandMetrics()
@@ -0,0 +1,187 @@
+import os
+import uuid
+import shutil
+import hashlib
+import asyncio
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+from app.services.cache import TTLCache
+
+load_dotenv()
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "100"))
+# Pages per process-pool task; small PDFs are parsed in a single task.
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "10"))
+EXTRACT_CACHE_SIZE = int(os.getenv("EXTRACT_CACHE_SIZE", "256"))
+EXTRACT_CACHE_TTL = float(os.getenv("EXTRACT_CACHE_TTL", "86400"))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", "data/uploads/tmp")
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class TooManyPages(Exception):
+    pass
+
+
+# --- Process-pool workers (top-level so they can be pickled) ---
+def _pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def _pdf_extract_pages(path: str, start: int, end: int) -> list:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+class TextExtractor:
+    """
+    Turns uploaded documents into text for the chat prompt without blocking the event loop.
+    PDFs are parsed in a process pool (pages split across workers), and results are cached by
+    the file's SHA-256 and type (PDF or plain text) in memory and in Mongo (`extracted_texts`), so a re-upload is instant.
+    """
+
+    def __init__(self, db, workers: int = EXTRACT_WORKERS):
+        self.db = db
+        self.workers = max(1, workers)
+        self._pool = None
+        self._cache = TTLCache(EXTRACT_CACHE_SIZE, EXTRACT_CACHE_TTL, name="extracted_texts")
+        self._inflight = {}
+        self.stats = {"extractions": 0, "memory_hits": 0, "mongo_hits": 0}
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def spool_upload(self, upload, max_bytes: int = UPLOAD_MAX_BYTES):
+        """
+        Streams an UploadFile to a temp file while hashing it, so the request never holds the
+        whole file in memory. Returns (path, sha256, size); raises UploadTooLarge past `max_bytes`.
+        """
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        path = os.path.join(UPLOAD_TMP_DIR, uuid.uuid4().hex)
+        digest, size = hashlib.sha256(), 0
+        try:
+            with open(path, "wb") as out:
+                while True:
+                    block = await upload.read(READ_BLOCK_BYTES)
+                    if not block:
+                        break
+                    size += len(block)
+                    if size > max_bytes:
+                        raise UploadTooLarge(f"File is larger than the {max_bytes // (1024 * 1024)} MB upload limit.")
+                    digest.update(block)
+                    await asyncio.to_thread(out.write, block)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return path, digest.hexdigest(), size
+
+    async def extract(self, path: str, sha256: str, filename: str) -> str:
+        # The same bytes give different text as a PDF (pypdf) and as anything else (raw decode),
+        # so results are cached per (kind, sha256).
+        kind = "pdf" if filename.lower().endswith(".pdf") else "text"
+        key = f"{kind}:{sha256}"
+        text = self._cache.get(key)
+        if text is not None:
+            self.stats["memory_hits"] += 1
+            return text
+
+        doc = await self.db.extracted_texts.find_one({"_id": key}, {"text": 1})
+        if doc is not None:
+            self.stats["mongo_hits"] += 1
+            self._cache.set(key, doc["text"])
+            return doc["text"]
+
+        # The same file uploaded twice at once is only parsed once.
+        future = self._inflight.get(key)
+        if future is None:
+            # The shared job outlives this request (which deletes `path` when it ends), so it works on its own link.
+            future = asyncio.ensure_future(self._extract_owned(_own_copy(path), key, kind))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _extract_owned(self, path: str, key: str, kind: str) -> str:
+        try:
+            return await self._extract_and_store(path, key, kind)
+        finally:
+            await asyncio.to_thread(_remove, path)
+
+    async def _extract_and_store(self, path: str, key: str, kind: str) -> str:
+        if kind == "pdf":
+            text, pages = await self._extract_pdf(path)
+        else:
+            text, pages = await asyncio.to_thread(_read_text, path), None
+        self.stats["extractions"] += 1
+        self._cache.set(key, text)
+        await self.db.extracted_texts.update_one(
+            {"_id": key},
+            {"$set": {"text": text, "kind": kind, "pages": pages, "created_at": datetime.datetime.utcnow()}},
+            upsert=True,
+        )
+        return text
+
+    async def _extract_pdf(self, path: str):
+        loop = asyncio.get_running_loop()
+        pages = await loop.run_in_executor(self.pool, _pdf_page_count, path)
+        if pages > EXTRACT_MAX_PAGES:
+            raise TooManyPages(f"PDF has {pages} pages; the limit is {EXTRACT_MAX_PAGES}.")
+
+        step = max(EXTRACT_PAGES_PER_TASK, -(-pages // self.workers))
+        tasks = [
+            loop.run_in_executor(self.pool, _pdf_extract_pages, path, start, min(start + step, pages))
+            for start in range(0, pages, step)
+        ]
+        page_texts = [text for part in await asyncio.gather(*tasks) for text in part]
+        return "\n".join(page_texts), pages
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "workers": self.workers, "memory_cache": self._cache.stats()}
+
+
+def _own_copy(path: str) -> str:
+    """A second name for the spooled file (a hard link; a copy where links are unsupported)."""
+    owned = f"{path}.{uuid.uuid4().hex[:8]}.extract"
+    try:
+        os.link(path, owned)
+    except OSError:
+        shutil.copyfile(path, owned)
+    return owned
+
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", errors="ignore")
+
+
+_extractor = None
+
+
+def get_text_extractor() -> TextExtractor:
+    global _extractor
+    if _extractor is None:
+        from app.services.database import db
+        _extractor = TextExtractor(db)
+    return _extractor
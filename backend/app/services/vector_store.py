@@ -0,0 +1,96 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "pinecone" (default, cloud) or "local" (in-process NumPy index, no network)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_STORE_DIR = os.getenv(
+    "LOCAL_VECTOR_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data", "vector_store", "local")
+)
+
+PINECONE_UPSERT_BATCH = 100
+
+_local_index = None
+_pinecone_index = None
+
+
+def build_embeddings():
+    """Creates the Gemini embeddings client used for both ingestion and search."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    google_key = os.getenv("GEMINI_KEY_1") or os.getenv("GOOGLE_API_KEY")
+    return GoogleGenerativeAIEmbeddings(
+        model="gemini-embedding-001",
+        google_api_key=google_key
+    )
+
+
+def get_local_index():
+    """The on-disk index is opened once per process and shared."""
+    global _local_index
+    if _local_index is None:
+        from app.services.local_index import LocalVectorIndex
+        _local_index = LocalVectorIndex(LOCAL_VECTOR_STORE_DIR)
+    return _local_index
+
+
+def build_vector_store(embeddings):
+    """Returns a LangChain VectorStore for the configured backend."""
+    if VECTOR_STORE_BACKEND == "local":
+        from app.services.local_index import LocalVectorStore
+        return LocalVectorStore(embeddings, get_local_index())
+
+    if VECTOR_STORE_BACKEND != "pinecone":
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{VECTOR_STORE_BACKEND}' (expected 'pinecone' or 'local').")
+
+    from langchain_pinecone import PineconeVectorStore
+    return PineconeVectorStore(
+        index_name=os.getenv("PINECONE_INDEX_NAME"),
+        embedding=embeddings
+    )
+
+
+def check_backend_config() -> str:
+    """Returns an error message if the configured backend is missing settings, else an empty string."""
+    if VECTOR_STORE_BACKEND == "pinecone" and (not os.getenv("PINECONE_API_KEY") or not os.getenv("PINECONE_INDEX_NAME")):
+        return "PINECONE_API_KEY or PINECONE_INDEX_NAME is missing in .env"
+    return ""
+
+
+def get_pinecone_index():
+    """Raw Pinecone index handle, created once (used for deletes and pre-embedded upserts)."""
+    global _pinecone_index
+    if _pinecone_index is None:
+        from pinecone import Pinecone
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        _pinecone_index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
+    return _pinecone_index
+
+
+def upsert_embeddings(vector_store, ids, texts, embeddings, metadatas):
+    """
+    Writes chunks whose embeddings were already computed (e.g. in concurrent batches),
+    so the store doesn't embed them a second time.
+    """
+    if VECTOR_STORE_BACKEND == "local":
+        return vector_store.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    # Same layout PineconeVectorStore uses: chunk text lives under the "text" metadata key.
+    records = [
+        {"id": doc_id, "values": list(vector), "metadata": {**(metadata or {}), "text": text}}
+        for doc_id, text, vector, metadata in zip(ids, texts, embeddings, metadatas)
+    ]
+    index = get_pinecone_index()
+    for start in range(0, len(records), PINECONE_UPSERT_BATCH):
+        index.upsert(vectors=records[start:start + PINECONE_UPSERT_BATCH])
+    return list(ids)
+
+
+def delete_source(source: str):
+    """Removes every chunk that was ingested from the given source file."""
+    if VECTOR_STORE_BACKEND == "local":
+        return get_local_index().delete(filter={"source": source})
+
+    return get_pinecone_index().delete(filter={"source": source})
@@ -1,63 +1,22 @@
 import os
-import smtplib
-import certifi
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from email.message import EmailMessage
-import json
+
+from app.services.database import db
+from app.services.identity import get_employee_record, invalidate_identity
+from app.services.sequences import next_id
+from app.services.email_outbox import enqueue_email, get_outbox
+from app.services.holidays import get_holiday_provider
+from app.services.name_search import resolve_employee, describe_candidates, department_filter, search_fields
 
 load_dotenv()
 
-# --- MONGODB CONNECTION ---
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGO_URI, tlsCAFile=certifi.where())
-db = client.innvoix_hr 
-
-# --- GOOGLE CALENDAR AUTH SETUP ---
-SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
-
-# Dynamically builds the absolute path: tools -> app -> backend -> data -> google_credentials.json
-CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-BACKEND_DIR = os.path.dirname(os.path.dirname(CURRENT_DIR))
-SERVICE_ACCOUNT_FILE = os.path.join(BACKEND_DIR, 'data', 'google_credentials.json')
-
-
-def get_calendar_service():
-    """Authenticates with Google Cloud using Environment Variables (Prod) or Local JSON (Dev)."""
-    
-    # 1. Try to load from the Production Environment Variable first
-    env_creds = os.getenv("GOOGLE_CREDENTIALS_JSON")
-    
-    if env_creds:
-        # Parse the giant string back into a Python dictionary
-        creds_dict = json.loads(env_creds)
-        creds = service_account.Credentials.from_service_account_info(
-            creds_dict, scopes=SCOPES
-        )
-    else:
-        # 2. Fall back to the local file for your local terminal testing
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES
-        )
-        
-    return build('calendar', 'v3', credentials=creds)
 
-def send_leave_email_to_hr(employee_name: str, start_date: str, end_date: str, reason: str):
-    """Sends an automated email to the HR department."""
-    sender_email = os.getenv("SENDER_EMAIL") 
-    sender_password = os.getenv("SENDER_PASSWORD")
+async def send_leave_email_to_hr(employee_name: str, start_date: str, end_date: str, reason: str):
+    """Queues an automated email to the HR department (delivered by the email outbox)."""
     hr_email = os.getenv("HR_EMAIL", "hr@innvoix.com")
-    
-    if not sender_email or not sender_password:
-        print("⚠️ Email credentials not set in .env. Skipping email notification.")
-        return
-
-    msg = EmailMessage()
-    msg.set_content(
+    body = (
         f"Hello HR,\n\n"
         f"A new leave request has been submitted and requires your approval.\n\n"
         f"Employee: {employee_name}\n"
@@ -65,18 +24,7 @@ def send_leave_email_to_hr(employee_name: str, start_date: str, end_date: str, r
         f"Reason: {reason}\n\n"
         f"Please log in to the Innvoix HR Dashboard to approve or reject this request."
     )
-    
-    msg['Subject'] = f"Action Required: Leave Request from {employee_name}"
-    msg['From'] = sender_email
-    msg['To'] = hr_email
-
-    try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(sender_email, sender_password)
-            smtp.send_message(msg)
-            print(f"📧 Notification email successfully sent to {hr_email}!")
-    except Exception as e:
-        print(f"❌ Failed to send email: {e}")
+    await enqueue_email(hr_email, f"Action Required: Leave Request from {employee_name}", body, kind="leave_request")
 
 @tool
 async def check_google_calendar_for_leaves(employee_id: str, target_month_num: int, target_year: int = datetime.now().year) -> str:
@@ -95,7 +43,7 @@ async def check_google_calendar_for_leaves(employee_id: str, target_month_num: i
 
     print(f"🛠️ TOOL CALLED: Fetching live Google Calendar for month {target_month_num}")
     
-    emp = await db.employees.find_one({"employee_id": employee_id.lower()})
+    emp = await get_employee_record(db, employee_id)
     if not emp:
         return "Error: Employee not found."
         
@@ -103,42 +51,25 @@ async def check_google_calendar_for_leaves(employee_id: str, target_month_num: i
     if leaves_left <= 0:
         return "You have 0 casual leaves remaining. I cannot suggest a vacation."
 
-    time_min = datetime(target_year, target_month_num, 1, 0, 0, 0).isoformat() + 'Z' 
-    if target_month_num == 12:
-        time_max = datetime(target_year + 1, 1, 1, 0, 0, 0).isoformat() + 'Z'
-    else:
-        time_max = datetime(target_year, target_month_num + 1, 1, 0, 0, 0).isoformat() + 'Z'
-
     try:
-        service = get_calendar_service()
-        calendar_id = os.getenv("GOOGLE_CALENDAR_ID")
-        
-        events_result = service.events().list(
-            calendarId=calendar_id, 
-            timeMin=time_min,
-            timeMax=time_max, 
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        holidays = events_result.get('items', [])
-        
-        if not holidays:
-            return f"You have {leaves_left} leaves, but there are no official company holidays listed in Google Calendar for month {target_month_num}."
-            
-        calendar_summary = f"You have {leaves_left} casual leaves left.\n\nHere are the live events from the Google Calendar:\n"
-        for event in holidays:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            calendar_summary += f"- {event['summary']} on {start}\n"
-            
-        calendar_summary += "\nAI INSTRUCTION: Look at these dates. If any fall on a Tuesday or Thursday, explicitly suggest that the user takes Monday or Friday off to get a 4-day long weekend."
-        
-        return calendar_summary
-
+        holidays, info = await get_holiday_provider().get_month(target_year, target_month_num)
     except Exception as e:
         print(f"❌ GOOGLE CALENDAR API ERROR: {str(e)}")
         return "I'm sorry, I'm having trouble accessing the Google Calendar to check for upcoming holidays and your leave balance at the moment."
 
+    if not holidays:
+        return f"You have {leaves_left} leaves, but there are no official company holidays listed in Google Calendar for month {target_month_num}."
+        
+    calendar_summary = f"You have {leaves_left} casual leaves left.\n\nHere are the live events from the Google Calendar:\n"
+    for event in holidays:
+        calendar_summary += f"- {event['summary']} on {event['start']}\n"
+    if info["stale"]:
+        calendar_summary += f"(The calendar could not be reached just now; these events were last synced on {info['fetched_at']:%Y-%m-%d}.)\n"
+        
+    calendar_summary += "\nAI INSTRUCTION: Look at these dates. If any fall on a Tuesday or Thursday, explicitly suggest that the user takes Monday or Friday off to get a 4-day long weekend."
+    
+    return calendar_summary
+
 # --- AUDIT LOGGING HELPER ---
 async def log_audit_action(action_name: str, details: str):
     """Silently logs AI actions to MongoDB for enterprise compliance."""
@@ -160,10 +91,10 @@ async def get_employee_details(employee_id_or_name: str) -> str:
 
     print(f"🛠️ TOOL CALLED: Fetching DB details for {employee_id_or_name}")
     
-    emp = await db.employees.find_one({"employee_id": employee_id_or_name.lower()})
-    if not emp:
-        emp = await db.employees.find_one({"name": {"$regex": employee_id_or_name, "$options": "i"}})
-        
+    emp, candidates = await resolve_employee(db, employee_id_or_name)
+    if candidates:
+        return describe_candidates(employee_id_or_name, candidates)
+
     if emp:
         return f"ID: {emp.get('employee_id')}, Name: {emp['name']}, Role: {emp['role']}, Salary: ${emp.get('salary', 'N/A')}, Casual Leaves: {emp.get('casual_leaves_left', 0)}, Sick Leaves: {emp.get('sick_leaves_left', 0)}"
     return f"Employee '{employee_id_or_name}' not found."
@@ -181,10 +112,10 @@ async def apply_for_leave(employee_id_or_name: str, start_date: str, end_date: s
 
     print(f"🛠️ TOOL CALLED: Applying for leave for {employee_id_or_name} from {start_date} to {end_date}")
     
-    emp = await db.employees.find_one({"employee_id": employee_id_or_name.lower()})
-    if not emp:
-        emp = await db.employees.find_one({"name": {"$regex": employee_id_or_name, "$options": "i"}})
-        
+    emp, candidates = await resolve_employee(db, employee_id_or_name)
+    if candidates:
+        return describe_candidates(employee_id_or_name, candidates)
+
     if not emp: 
         return f"Cannot apply for leave: Employee '{employee_id_or_name}' not found."
     
@@ -202,7 +133,7 @@ async def apply_for_leave(employee_id_or_name: str, start_date: str, end_date: s
     }
     await db.leaves.insert_one(leave_request)
     
-    send_leave_email_to_hr(emp_name, start_date, end_date, reason)
+    await send_leave_email_to_hr(emp_name, start_date, end_date, reason)
     
     return f"SUCCESS: Leave request for {start_date} to {end_date} submitted. HR has been notified via email and will review your reason: '{reason}'."
 
@@ -232,17 +163,16 @@ async def raise_hr_ticket(employee_id_or_name: str, issue_summary: str) -> str:
 
     print(f"🛠️ TOOL CALLED: Raising HR ticket for {employee_id_or_name}")
     
-    emp = await db.employees.find_one({"employee_id": employee_id_or_name.lower()})
-    if not emp:
-        emp = await db.employees.find_one({"name": {"$regex": employee_id_or_name, "$options": "i"}})
-        
+    emp, candidates = await resolve_employee(db, employee_id_or_name)
+    if candidates:
+        return describe_candidates(employee_id_or_name, candidates)
+
     if not emp: 
         return f"Cannot raise ticket: Employee '{employee_id_or_name}' not found."
     
     actual_emp_id = emp["employee_id"]
     
-    count = await db.hr_tickets.count_documents({})
-    ticket_id = f"TKT-{count + 1000}"
+    ticket_id = await next_id("hr_ticket")
     
     await db.hr_tickets.insert_one({
         "ticket_id": ticket_id,
@@ -267,14 +197,14 @@ async def onboard_employee(new_hire_name: str, new_hire_email: str, role: str, d
     """
     print(f"🛠️ TOOL CALLED: Orchestrating Onboarding for {new_hire_name}")
     
-    count = await db.employees.count_documents({})
-    new_id = f"emp_{count + 100}" 
+    new_id = await next_id("employee")
     
     # 1. Create Core HRIS Record
     await db.employees.insert_one({
         "employee_id": new_id, "name": new_hire_name, "email": new_hire_email, "role": role, 
         "department": department, "bank_account": bank_account, "emergency_contact": emergency_contact,
-        "casual_leaves_left": 12, "sick_leaves_left": 10, "status": "Active"
+        "casual_leaves_left": 12, "sick_leaves_left": 10, "status": "Active",
+        **search_fields(new_hire_name, department)
     })
     
     # 2. Create Real LMS Tracking Checklist for Frontend
@@ -288,11 +218,11 @@ async def onboard_employee(new_hire_name: str, new_hire_email: str, role: str, d
     # 3. Send physical trigger email to IT
     it_email = os.getenv("IT_EMAIL", "it@innvoix.com") # Add this to your .env or just use your own email to test
     it_body = f"URGENT: New hire {new_hire_name} ({new_id}) starts soon in {department}. Please provision a laptop and standard access. Contact them at: {new_hire_email}"
-    send_standard_email(it_email, f"IT Action Required: Provision {new_hire_name}", it_body)
+    await send_standard_email(it_email, f"IT Action Required: Provision {new_hire_name}", it_body)
     
     # 4. Send Welcome Packet to New Hire
     welcome_body = f"Welcome to Innovix, {new_hire_name}! Your employee ID is {new_id}. Please log in to your dashboard to complete your 3 assigned learning modules. Your Company website link is https://hr-innovix-agent.vercel.app/. If you have any questions, feel free to reach out to HR or IT. We're excited to have you on board!🎉"
-    send_standard_email(new_hire_email, "Welcome to Innovix!", welcome_body)
+    await send_standard_email(new_hire_email, "Welcome to Innovix!", welcome_body)
     
     await log_audit_action("ONBOARD", f"Onboarded {new_hire_name} ({new_id}). LMS tasks assigned, IT notified.")
     
@@ -309,10 +239,10 @@ async def offboard_employee(employee_id_or_name: str, offboard_date: str) -> str
 
     print(f"🛠️ TOOL CALLED: Multi-System Offboarding for {employee_id_or_name} on {offboard_date}")
     
-    emp = await db.employees.find_one({"employee_id": employee_id_or_name.lower()})
-    if not emp:
-        emp = await db.employees.find_one({"name": {"$regex": employee_id_or_name, "$options": "i"}})
-        
+    emp, candidates = await resolve_employee(db, employee_id_or_name)
+    if candidates:
+        return describe_candidates(employee_id_or_name, candidates)
+
     if not emp: 
         return f"Cannot offboard: Employee '{employee_id_or_name}' not found."
     
@@ -323,6 +253,7 @@ async def offboard_employee(employee_id_or_name: str, offboard_date: str) -> str
         {"employee_id": actual_emp_id}, 
         {"$set": {"status": "Terminated", "offboard_date": offboard_date}}
     )
+    invalidate_identity(actual_emp_id)
     
     await db.it_tickets.insert_one({
         "emp_id": actual_emp_id,
@@ -351,8 +282,7 @@ async def prepare_sensitive_transaction(employee_id: str, action_type: str, deta
     """CRITICAL: Must be used for sensitive actions like 'salary_change' or 'termination'."""
     print(f"🛠️ TOOL CALLED: Guardrail triggered for {action_type} on {employee_id}")
     
-    count = await db.pending_approvals.count_documents({})
-    transaction_id = f"TRX-{count + 1000}"
+    transaction_id = await next_id("transaction")
     
     await db.pending_approvals.insert_one({
         "trx_id": transaction_id,
@@ -375,7 +305,7 @@ async def list_employees(department: str = None) -> str:
     """
     print(f"🛠️ TOOL CALLED: Listing employees (Department filter: {department})")
     
-    query = {"department": {"$regex": department, "$options": "i"}} if department else {}
+    query = department_filter(department) if department else {}
     
     cursor = db.employees.find(query)
     employees = await cursor.to_list(length=50)
@@ -404,42 +334,24 @@ async def draft_policy_update(policy_title: str, new_rules: str, affected_depart
     })
     
     # 2. Find the real employees affected by this change
-    query = {} if affected_department.lower() == "all" else {"department": {"$regex": affected_department, "$options": "i"}}
-    cursor = db.employees.find(query)
-    affected_employees = await cursor.to_list(length=100)
+    query = {} if affected_department.lower() == "all" else department_filter(affected_department)
+    cursor = db.employees.find(query, {"name": 1, "email": 1})
     
-    # 3. Send physical emails to the affected staff
-    notified_count = 0
-    for emp in affected_employees:
+    # 3. Queue the emails to the affected staff in one batch (the outbox delivers them in the background)
+    notices = []
+    async for emp in cursor:
         emp_email = emp.get("email")
         if emp_email:
             body = f"Hello {emp['name']},\n\nA new policy draft titled '{policy_title}' has been proposed that affects your department. Please review the new rules on your HR Dashboard.\n\nSummary:\n{new_rules}"
-            send_standard_email(emp_email, f"Policy Update Notice: {policy_title}", body)
-            notified_count += 1
+            notices.append({"to": emp_email, "subject": f"Policy Update Notice: {policy_title}", "body": body})
+    await get_outbox().enqueue_many(notices, kind="policy_notice")
+    notified_count = len(notices)
             
-    return f"SUCCESS: Draft for '{policy_title}' saved. Physically emailed {notified_count} employees in the {affected_department} department."
+    return f"SUCCESS: Draft for '{policy_title}' saved. Emails to {notified_count} employees in the {affected_department} department are queued for delivery."
 
-def send_standard_email(to_email: str, subject: str, body: str):
-    """A generic email sender for real cross-system notifications."""
-    sender_email = os.getenv("SENDER_EMAIL") 
-    sender_password = os.getenv("SENDER_PASSWORD")
-    
-    if not sender_email or not sender_password:
-        print("⚠️ Email credentials not set. Skipping real email.")
-        return
-
-    msg = EmailMessage()
-    msg.set_content(body)
-    msg['Subject'] = subject
-    msg['From'] = sender_email
-    msg['To'] = to_email
-
-    try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(sender_email, sender_password)
-            smtp.send_message(msg)
-    except Exception as e:
-        print(f"❌ Failed to send email to {to_email}: {e}")
+async def send_standard_email(to_email: str, subject: str, body: str):
+    """A generic email sender for real cross-system notifications. Only queues; never blocks on SMTP."""
+    await enqueue_email(to_email, subject, body)
 
 
 import random
@@ -459,8 +371,7 @@ async def invite_new_hire(name: str, email: str, role: str, department: str) ->
         return f"Error: An account with email {email} already exists."
         
     # Generate official employee_id (e.g., emp_105)
-    count = await db.employees.count_documents({})
-    new_emp_id = f"emp_{count + 100}"
+    new_emp_id = await next_id("employee")
     
     # --- ENTERPRISE FIX: Auto-Generate the Password in Python ---
     first_name = name.split()[0].lower()
@@ -481,6 +392,7 @@ async def invite_new_hire(name: str, email: str, role: str, department: str) ->
     }
     
     result = await db.users.insert_one(new_user)
+    invalidate_identity(new_emp_id)
 
     welcome_body = (
         f"Welcome to Innvoix, {name}!\n\n"
@@ -491,7 +403,7 @@ async def invite_new_hire(name: str, email: str, role: str, department: str) ->
         f"Password: {auto_password}\n\n"
         f"Please log in as soon as possible and change this temporary password."
     )
-    send_standard_email(email, "Your Innvoix Onboarding Credentials", welcome_body)
+    await send_standard_email(email, "Your Innvoix Onboarding Credentials", welcome_body)
     
     return f"SUCCESS: Account created for {name} (ID: {new_emp_id}). Role: {role}, Dept: {department}. Credentials emailed. Status is 'Pending'."
     
@@ -539,12 +451,14 @@ async def complete_onboarding_profile(employee_id: str, phone_number: str, home_
         "emergency_contact": emergency_contact,
         "casual_leaves_left": 12,
         "sick_leaves_left": 10,
-        "status": "Active"
+        "status": "Active",
+        **search_fields(emp_name, user.get("department") or "")
     })
+    invalidate_identity(official_emp_id)
     
     # Alert HR
     hr_email = os.getenv("HR_EMAIL", "hr@innvoix.com")
     hr_body = f"Good news! New hire {emp_name} ({official_emp_id}) has successfully completed their AI onboarding chat. They have been officially added to the active HRIS employee database."
-    send_standard_email(hr_email, f"Onboarding Completed: {emp_name}", hr_body)
+    await send_standard_email(hr_email, f"Onboarding Completed: {emp_name}", hr_body)
     
     return "SUCCESS: Your profile has been updated, you have been added to the main HR database, and HR has been notified. Welcome to the team!"
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Per-turn agent setup cost: building a fresh ChatGoogleGenerativeAI + create_agent graph
+(the old behaviour of get_agent_executor) vs. fetching it from the agent graph cache.
+
+No LLM calls are made, so a placeholder key works:
+    cd backend
+    python -m benchmarks.bench_agent_setup --turns 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.agent_cache import AgentGraphCache, build_agent
+from app.agents.employee_agent import STANDARD_TOOLS, HR_ADMIN_TOOLS
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "turns": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 4),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 4),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 4),
+        "max_ms": round(samples[-1] * 1000, 4),
+    }
+
+
+def run(turns: int, api_key: str) -> dict:
+    tool_sets = [STANDARD_TOOLS, HR_ADMIN_TOOLS]
+
+    uncached = []
+    for turn in range(turns):
+        started = time.perf_counter()
+        build_agent(api_key, tool_sets[turn % 2])
+        uncached.append(time.perf_counter() - started)
+
+    cache = AgentGraphCache()
+    warm_started = time.perf_counter()
+    cache.warm_up([api_key], tool_sets)
+    warm_up_seconds = time.perf_counter() - warm_started
+
+    cached = []
+    for turn in range(turns):
+        started = time.perf_counter()
+        cache.get(api_key, tool_sets[turn % 2])
+        cached.append(time.perf_counter() - started)
+
+    before, after = summarize(uncached), summarize(cached)
+    return {
+        "before_uncached": before,
+        "after_cached": after,
+        "warm_up_ms": round(warm_up_seconds * 1000, 3),
+        "speedup_mean": round(before["mean_ms"] / after["mean_ms"], 1) if after["mean_ms"] else None,
+        "cache": cache.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = run(args.turns, os.getenv("GEMINI_KEY_1") or "benchmark-placeholder-key")
+
+    print(f"Per-turn agent setup over {args.turns} turns")
+    for label, key in (("before (uncached)", "before_uncached"), ("after (cached)", "after_cached")):
+        row = results[key]
+        print(f"  {label:<18} mean {row['mean_ms']:>10.4f} ms | p50 {row['p50_ms']:>10.4f} ms | p95 {row['p95_ms']:>10.4f} ms")
+    print(f"  one-time warm-up   {results['warm_up_ms']} ms, speedup x{results['speedup_mean']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
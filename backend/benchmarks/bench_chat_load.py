@@ -0,0 +1,371 @@
+"""
+Offline load test of /chat and /api/chat/stream.
+
+Runs the real FastAPI app (uvicorn, lifespan and all) against a local mongod, with Gemini replaced
+by a scripted chat model (tool-calling turns included) and Pinecone by the local vector index
+filled through deterministic hash embeddings. No API quota is used.
+
+    cd backend
+    python -m benchmarks.bench_chat_load --mongod mongod --users 20 --requests 10
+    python -m benchmarks.bench_chat_load --mongo-uri mongodb://127.0.0.1:27017 --endpoint stream \\
+        --json benchmarks/results/after.json --compare benchmarks/results/before.json
+
+Reports client-side TTFB, latency percentiles and throughput per endpoint, plus a per-stage
+breakdown (identity, prompt assembly, LLM, tools, history write) measured inside the server.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import random
+import asyncio
+import argparse
+import datetime
+import tempfile
+import subprocess
+import statistics
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.fakes import ScriptedChatModel, HashEmbeddings, build_fake_agent, stage_timer
+
+DEPARTMENTS = ["Engineering", "Sales", "Finance", "Marketing", "Human Resources"]
+PROMPTS = [
+    ("plain", "Hi! Can you help me with something?"),
+    ("policy", "What is the policy on working from home?"),
+    ("policy", "Am I allowed to carry over unused leave?"),
+    ("balance", "How many leaves do I have left? What is my balance?"),
+    ("holidays", "Which holidays are coming up?"),
+]
+POLICY_TEXTS = [
+    "Remote work: employees may work from home up to two days per week with manager approval.",
+    "Leave carry-over: up to five unused casual leaves can be carried into the next calendar year.",
+    "Sick leave: a medical certificate is required for sick leave longer than two consecutive days.",
+    "Expense policy: travel expenses must be filed within 30 days with itemised receipts.",
+    "Code of conduct: harassment of any kind is grounds for immediate disciplinary action.",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentiles(samples_ms: list) -> dict:
+    if not samples_ms:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+    return {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "mean": round(statistics.mean(ordered), 2), "max": round(ordered[-1], 2)}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+# --- Local mongod ---
+def start_mongod(binary: str, port: int):
+    dbpath = tempfile.mkdtemp(prefix="innvoix-bench-mongo-")
+    process = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"mongod exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, dbpath
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("mongod did not start within 30s")
+
+
+def stop_mongod(process, dbpath: str):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    shutil.rmtree(dbpath, ignore_errors=True)
+
+
+def configure_environment(args, mongo_uri: str, workdir: str):
+    """Must run before any app module is imported: settings are read at import time."""
+    os.environ.update({
+        "MONGO_URI": mongo_uri,
+        "DB_NAME": args.db_name,
+        "MONGO_TLS": "false",
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(workdir, "vector_store"),
+        "HOLIDAY_CALENDAR_SOURCE": "file",
+        "HOLIDAY_CALENDAR_FILE": os.path.join(BACKEND_DIR, "data", "holiday_calendar.sample.json"),
+        "SENDER_EMAIL": "",
+        "GEMINI_KEY_RPM": "100000",
+        "GEMINI_KEY_TPM": "1000000000",
+        "MONGO_CHECK_QUERY_PLANS": "false",
+    })
+    for i in range(1, 6):
+        os.environ[f"GEMINI_KEY_{i}"] = f"bench-key-{i}" if i <= args.keys else ""
+
+
+def install_fakes(args):
+    """Swaps the Gemini seams for the scripted model and hash embeddings, and times the server stages."""
+    from app.agents import employee_agent
+    from app.agents.agent_cache import agent_cache
+    from app.services import policy_retriever
+
+    model = ScriptedChatModel(first_token_ms=args.first_token_ms, token_ms=args.token_ms, reply_tokens=args.reply_tokens)
+    agent_cache._builder = build_fake_agent(model)
+    agent_cache.clear()
+    employee_agent._get_summary_llm = lambda api_key: model
+    embeddings = HashEmbeddings(latency_ms=args.embedding_ms)
+    policy_retriever.build_embeddings = lambda: embeddings
+
+    employee_agent.resolve_identity = stage_timer.wrap("identity", employee_agent.resolve_identity)
+    employee_agent.prepare_messages = stage_timer.wrap("prompt_assembly", employee_agent.prepare_messages)
+    employee_agent.append_turn = stage_timer.wrap("history_write", employee_agent.append_turn)
+    for tool in employee_agent.HR_ADMIN_TOOLS:
+        if tool.coroutine is not None:
+            tool.coroutine = stage_timer.wrap(f"tool:{tool.name}", tool.coroutine)
+    return embeddings
+
+
+async def seed(db, users: int, embeddings):
+    from app.services.name_search import search_fields
+    from app.services.vector_store import get_local_index
+
+    await db.client.drop_database(db.name)
+    employees, accounts = [], []
+    for i in range(users):
+        emp_id = f"emp_{100 + i}"
+        department = DEPARTMENTS[i % len(DEPARTMENTS)]
+        name = f"Bench User {i:03d}"
+        employees.append({
+            "employee_id": emp_id, "name": name, "department": department, "role": f"{department} Specialist",
+            "email": f"bench{i}@example.com", "salary": 50000 + i, "casual_leaves_left": 12, "sick_leaves_left": 8,
+            **search_fields(name, department),
+        })
+        accounts.append({
+            "employee_id": emp_id, "email": f"bench{i}@example.com", "name": name,
+            "department": department, "onboarding_status": "Completed",
+        })
+    await db.employees.insert_many(employees)
+    await db.users.insert_many(accounts)
+    year = datetime.date.today().year
+    await db.holidays.insert_many([
+        {"name": "New Year", "date": f"{year}-01-01"},
+        {"name": "Independence Day", "date": f"{year}-08-15"},
+        {"name": "Diwali", "date": f"{year}-11-01"},
+    ])
+    get_local_index().upsert(
+        [f"bench-policy-{i}" for i in range(len(POLICY_TEXTS))],
+        embeddings.embed_documents(POLICY_TEXTS),
+        POLICY_TEXTS,
+        [{"source": "benchmark_policy.pdf", "page": i} for i in range(len(POLICY_TEXTS))],
+    )
+
+
+# --- Load generation ---
+async def chat_once(client, employee_id: str, message: str) -> dict:
+    started = time.perf_counter()
+    response = await client.post("/chat", json={"message": message, "employee_id": employee_id})
+    elapsed = (time.perf_counter() - started) * 1000
+    reply = response.json().get("response", "") if response.status_code == 200 else ""
+    ok = bool(reply) and not reply.startswith(("Sorry, my AI brain", "Error processing request"))
+    return {"ttfb_ms": elapsed, "latency_ms": elapsed, "ok": ok, "frames": 1}
+
+
+async def stream_once(client, employee_id: str, message: str) -> dict:
+    started = time.perf_counter()
+    ttfb, frames, ok = None, 0, False
+    async with client.stream("POST", "/api/chat/stream", json={"message": message, "employee_id": employee_id}) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            if ttfb is None:
+                ttfb = (time.perf_counter() - started) * 1000
+            frames += 1
+            event = json.loads(line[len("data: "):])
+            if event.get("type") == "done":
+                ok = True
+            elif event.get("type") == "error":
+                ok = False
+    return {"ttfb_ms": ttfb, "latency_ms": (time.perf_counter() - started) * 1000, "ok": ok, "frames": frames}
+
+
+async def virtual_user(client, user_num: int, args, results: list, rng: random.Random):
+    employee_id = f"emp_{100 + user_num}"
+    endpoints = ["chat", "stream"] if args.endpoint == "both" else [args.endpoint]
+    for request_num in range(args.requests):
+        endpoint = endpoints[(user_num + request_num) % len(endpoints)]
+        kind, message = rng.choice(PROMPTS)
+        try:
+            sample = await (stream_once if endpoint == "stream" else chat_once)(client, employee_id, message)
+        except Exception as e:
+            sample = {"ttfb_ms": None, "latency_ms": None, "ok": False, "frames": 0, "error": str(e)}
+        results.append({"endpoint": endpoint, "kind": kind, **sample})
+        if args.think_ms:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+
+def summarize(results: list, wall_seconds: float) -> dict:
+    endpoints = {}
+    for endpoint in sorted({r["endpoint"] for r in results}):
+        rows = [r for r in results if r["endpoint"] == endpoint]
+        ok_rows = [r for r in rows if r["ok"]]
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok_rows),
+            "throughput_rps": round(len(ok_rows) / wall_seconds, 2) if wall_seconds else None,
+            "ttfb_ms": _percentiles([r["ttfb_ms"] for r in ok_rows if r["ttfb_ms"] is not None]),
+            "latency_ms": _percentiles([r["latency_ms"] for r in ok_rows]),
+            "frames_per_response": round(statistics.mean(r["frames"] for r in ok_rows), 1) if ok_rows else None,
+            "by_prompt": {
+                kind: _percentiles([r["latency_ms"] for r in ok_rows if r["kind"] == kind])["p50"]
+                for kind in sorted({r["kind"] for r in ok_rows})
+            },
+        }
+    stages = {
+        stage: {"count": len(samples), **_percentiles([s * 1000 for s in samples])}
+        for stage, samples in sorted(stage_timer.samples.items())
+    }
+    return {"endpoints": endpoints, "stages_ms": stages}
+
+
+async def run(args) -> dict:
+    import httpx
+    import uvicorn
+    from app.main import app
+    from app.services.database import get_db
+
+    embeddings = install_fakes(args)
+    await seed(get_db(), args.users, embeddings)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            raise RuntimeError("uvicorn failed to start")
+        await asyncio.sleep(0.05)
+
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+            # One untimed turn per endpoint so first-use costs (agent graphs, caches, pools) don't skew p99.
+            await chat_once(client, "emp_100", "Hi!")
+            await stream_once(client, "emp_100", "Hi!")
+            stage_timer.reset()
+
+            results = []
+            rng = random.Random(args.seed)
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                virtual_user(client, i, args, results, random.Random(rng.random())) for i in range(args.users)
+            ])
+            wall_seconds = time.perf_counter() - started
+
+            server_metrics = {}
+            for name, path in (("streams", "/api/metrics/streams"), ("mongo_pool", "/api/metrics/mongo"), ("key_pool", "/api/agents/keys")):
+                try:
+                    server_metrics[name] = (await client.get(path)).json().get("data")
+                except Exception as e:
+                    server_metrics[name] = {"error": str(e)}
+    finally:
+        server.should_exit = True
+        await server_task
+
+    if isinstance(server_metrics.get("streams"), dict):
+        server_metrics["streams"].pop("recent", None)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "config": {k: v for k, v in vars(args).items() if k not in ("json_path", "compare")},
+        "wall_seconds": round(wall_seconds, 3),
+        **summarize(results, wall_seconds),
+        "server": server_metrics,
+    }
+
+
+def print_report(results: dict, baseline: dict = None):
+    print(f"\nChat load test @ {results['commit']}: {results['config']['users']} users x "
+          f"{results['config']['requests']} requests in {results['wall_seconds']}s")
+    for endpoint, row in results["endpoints"].items():
+        print(f"  {endpoint:<7} {row['requests']:>5} req | {row['errors']:>3} err | {row['throughput_rps']:>7} req/s | "
+              f"TTFB p50 {row['ttfb_ms']['p50']} p95 {row['ttfb_ms']['p95']} ms | "
+              f"latency p50 {row['latency_ms']['p50']} p95 {row['latency_ms']['p95']} p99 {row['latency_ms']['p99']} ms")
+        if baseline and endpoint in baseline.get("endpoints", {}):
+            old = baseline["endpoints"][endpoint]
+            deltas = []
+            for metric in ("ttfb_ms", "latency_ms"):
+                for pct in ("p50", "p95", "p99"):
+                    if row[metric][pct] is not None and old[metric][pct]:
+                        deltas.append(f"{metric[:-3]} {pct} {100 * (row[metric][pct] - old[metric][pct]) / old[metric][pct]:+.1f}%")
+            print(f"          vs {baseline.get('commit', 'baseline')}: " + ", ".join(deltas))
+    print("  Server stages (ms):")
+    for stage, row in results["stages_ms"].items():
+        print(f"    {stage:<32} n={row['count']:<6} p50 {row['p50']:>8} | p95 {row['p95']:>8} | p99 {row['p99']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongod", help="Path to a mongod binary; a throwaway instance is started on a free port.")
+    parser.add_argument("--mongo-uri", default="mongodb://127.0.0.1:27017", help="Used when --mongod is not given.")
+    parser.add_argument("--db-name", default="innvoix_bench", help="Dropped and re-seeded on every run.")
+    parser.add_argument("--endpoint", choices=["chat", "stream", "both"], default="both")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users.")
+    parser.add_argument("--requests", type=int, default=10, help="Requests per user.")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a user's requests.")
+    parser.add_argument("--keys", type=int, default=3, help="Fake Gemini keys in the key pool (1-5).")
+    parser.add_argument("--first-token-ms", type=float, default=350)
+    parser.add_argument("--token-ms", type=float, default=12)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--embedding-ms", type=float, default=40)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="Write the results here (default: benchmarks/results/chat_load-<commit>.json).")
+    parser.add_argument("--compare", help="A previous results JSON to print percentage changes against.")
+    args = parser.parse_args()
+    if args.db_name == "innvoix_hr":
+        parser.error("refusing to drop the application database; pick another --db-name")
+
+    mongod = None
+    workdir = tempfile.mkdtemp(prefix="innvoix-bench-")
+    mongo_uri = args.mongo_uri
+    if args.mongod:
+        port = _free_port()
+        mongod = start_mongod(args.mongod, port)
+        mongo_uri = f"mongodb://127.0.0.1:{port}"
+    configure_environment(args, mongo_uri, workdir)
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if mongod:
+            stop_mongod(*mongod)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    json_path = args.json_path or os.path.join(BACKEND_DIR, "benchmarks", "results", f"chat_load-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results written to {json_path}")
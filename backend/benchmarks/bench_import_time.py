@@ -0,0 +1,115 @@
+"""
+Import-time profile of the API process, with a budget for CI.
+
+Imports the target module in a fresh interpreter under `python -X importtime`, then reports the
+slowest top-level packages and modules. Exits with status 1 when the total import time is over
+budget, or when a subsystem that should load lazily (LangChain agents, Pinecone, Google clients...)
+was imported at startup:
+    cd backend
+    python -m benchmarks.bench_import_time --budget-ms 1500
+    IMPORT_BUDGET_MS=1200 python -m benchmarks.bench_import_time --json import_time.json
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported by `import app.main`; they load on first use or in the background warm-up.
+LAZY_MODULES = [
+    "langchain_community",
+    "langchain_google_genai",
+    "langchain.agents",
+    "langgraph",
+    "langchain_pinecone",
+    "pinecone",
+    "googleapiclient",
+    "google.oauth2",
+    "pypdf",
+    "app.agents.employee_agent",
+    "app.tools.hr_tools",
+]
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(module: str, runs: int = 3) -> dict:
+    """Best-of-`runs` (each in a fresh interpreter, so nothing is cached in sys.modules)."""
+    best = None
+    for _ in range(runs):
+        env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+        modules = {}
+        for line in result.stderr.splitlines():
+            match = _LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules[name] = {"self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000, "depth": len(indent) // 2}
+        total_ms = modules.get(module, {}).get("cumulative_ms") or sum(m["self_ms"] for m in modules.values())
+        if best is None or total_ms < best["total_ms"]:
+            best = {"total_ms": round(total_ms, 1), "modules": modules}
+    return best
+
+
+def summarize(report: dict, top: int) -> dict:
+    modules = report["modules"]
+    packages = {}
+    for name, row in modules.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + row["self_ms"]
+    return {
+        "total_ms": report["total_ms"],
+        "modules_imported": len(modules),
+        "top_packages_ms": dict(sorted(((p, round(ms, 1)) for p, ms in packages.items()), key=lambda kv: -kv[1])[:top]),
+        "top_modules_cumulative_ms": dict(sorted(
+            ((name, round(row["cumulative_ms"], 1)) for name, row in modules.items()), key=lambda kv: -kv[1]
+        )[:top]),
+        "lazy_modules_imported": [m for m in LAZY_MODULES if m in modules],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    summary = summarize(profile(args.module, args.runs), args.top)
+    summary["budget_ms"] = args.budget_ms
+
+    print(f"import {args.module}: {summary['total_ms']} ms ({summary['modules_imported']} modules), budget {args.budget_ms} ms")
+    print("  Slowest packages (self time):")
+    for package, ms in summary["top_packages_ms"].items():
+        print(f"    {package:<40} {ms:>9.1f} ms")
+    print("  Slowest modules (cumulative):")
+    for name, ms in summary["top_modules_cumulative_ms"].items():
+        print(f"    {name:<40} {ms:>9.1f} ms")
+
+    failures = []
+    if summary["total_ms"] > args.budget_ms:
+        failures.append(f"import time {summary['total_ms']} ms is over the {args.budget_ms} ms budget")
+    if summary["lazy_modules_imported"]:
+        failures.append(f"imported at startup but should load lazily: {', '.join(summary['lazy_modules_imported'])}")
+    summary["failures"] = failures
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Within budget.")
@@ -0,0 +1,181 @@
+"""
+Offline stand-ins for Gemini used by the load benchmarks: a scripted chat model that streams
+tokens and makes tool calls with Gemini-like latency, and deterministic hash embeddings.
+Nothing here talks to the network.
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_HR_ID = re.compile(r"Official HR ID: (\S+?)\]")
+
+
+class StageTimer:
+    """Collects per-stage durations (seconds) recorded inside the server process."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, func):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return timed
+
+    def reset(self):
+        self.samples = {}
+
+
+stage_timer = StageTimer()
+
+
+def _tool_call_for(text: str, hr_id: str):
+    """Which tool a real model would reach for, based on keywords in the user's message."""
+    lowered = text.lower()
+    if "policy" in lowered or "allowed" in lowered:
+        return "search_policy", {"query": text}
+    if "balance" in lowered or "leaves" in lowered:
+        return "get_employee_details", {"employee_id_or_name": hr_id}
+    if "holiday" in lowered:
+        return "get_upcoming_holidays", {}
+    return None
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic chat model with tool calling.
+    A user turn that mentions a policy, a leave balance or holidays first gets a tool call;
+    once the tool result is back (or for any other message) it streams a fixed-length reply.
+    Latency is modelled as time-to-first-token plus a per-token delay.
+    """
+
+    first_token_ms: float = 350.0
+    token_ms: float = 12.0
+    reply_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _plan(self, messages) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            seed = str(last.content)[:80].replace("\n", " ")
+            return AIMessage(content=self._reply(f"Based on what I found ({seed})"))
+
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), "")
+        match = _HR_ID.search(system if isinstance(system, str) else "")
+        hr_id = match.group(1) if match else "emp_100"
+        text = last.content if isinstance(last, HumanMessage) and isinstance(last.content, str) else ""
+        call = _tool_call_for(text, hr_id)
+        if call:
+            name, args = call
+            return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+        return AIMessage(content=self._reply("Thanks for your question"))
+
+    def _reply(self, opening: str) -> str:
+        filler = " here is a short, deterministic answer used for load testing the chat pipeline".split()
+        words = opening.split() + [filler[i % len(filler)] for i in range(self.reply_tokens)]
+        return " ".join(words[: self.reply_tokens])
+
+    def _latency(self, message: AIMessage) -> float:
+        tokens = 1 if message.tool_calls else len(message.content.split())
+        return (self.first_token_ms + self.token_ms * tokens) / 1000
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        message = self._plan(messages)
+        time.sleep(self._latency(message))
+        stage_timer.record("llm", time.perf_counter() - started)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        message = self._plan(messages)
+        await asyncio.sleep(self._latency(message))
+        stage_timer.record("llm", time.perf_counter() - started)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        message = self._plan(messages)
+        await asyncio.sleep(self.first_token_ms / 1000)
+        try:
+            if message.tool_calls:
+                call = message.tool_calls[0]
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+                ]))
+                return
+
+            for i, word in enumerate(message.content.split()):
+                if i:
+                    await asyncio.sleep(self.token_ms / 1000)
+                token = word if i == 0 else " " + word
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+                if run_manager:
+                    await run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+        finally:
+            stage_timer.record("llm", time.perf_counter() - started)
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic unit vectors seeded from the text's hash; same text -> same vector."""
+
+    def __init__(self, size: int = 768, latency_ms: float = 0.0):
+        self.size = size
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        started = time.perf_counter()
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        vector = self.embed_query(text)
+        stage_timer.record("embedding", time.perf_counter() - started)
+        return vector
+
+
+def build_fake_agent(model: ScriptedChatModel):
+    """Builder for AgentGraphCache: the real LangGraph agent, wired to the scripted model."""
+    from langchain.agents import create_agent
+
+    def builder(api_key: str, tools, model_config: Optional[dict] = None) -> Any:
+        return create_agent(model, tools)
+
+    return builder